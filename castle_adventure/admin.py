@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Scene, Choice, Item, GameState, Ending, EndingUnlock
+from .models import Scene, Choice, Item, GameState, ArchivedGame, Ending, EndingUnlock
 
 
 @admin.register(Scene)
@@ -27,6 +27,12 @@ class GameStateAdmin(admin.ModelAdmin):
     list_filter = ['is_complete']
 
 
+@admin.register(ArchivedGame)
+class ArchivedGameAdmin(admin.ModelAdmin):
+    list_display = ['user', 'session_key', 'ending_reached', 'choices_made', 'deaths', 'game_finished']
+    list_filter = ['ending_reached']
+
+
 @admin.register(Ending)
 class EndingAdmin(admin.ModelAdmin):
     list_display = ['ending_id', 'title', 'ending_type', 'is_secret']
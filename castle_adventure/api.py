@@ -0,0 +1,260 @@
+"""
+JSON API for Castle Adventure.
+
+Each write returns the resulting game payload directly, so a move takes one
+round trip instead of POST, redirect and GET. Static scene text is served
+separately (and cached by story version) from the per-player state.
+"""
+import copy
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.decorators import decorator_from_middleware
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from .models import GameState
+from .story_graph import get_story_graph
+from .views import (
+    CONFLICT_MESSAGE, choice_error, get_game_state, make_etag, pickup_error,
+    write_with_retry,
+)
+
+
+def json_error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+class JsonCsrfViewMiddleware(CsrfViewMiddleware):
+    """CSRF checks that reject with a JSON 403 instead of Django's HTML page."""
+
+    def _reject(self, request, reason):
+        return json_error(f"CSRF verification failed: {reason}", 403)
+
+
+def api_csrf_protect(view):
+    """
+    Protect an API write against CSRF, reporting failures as JSON.
+
+    The site-wide middleware is skipped for the view so this check is the
+    one that runs. Clients get the token cookie from game/ and send it
+    back in the X-CSRFToken header.
+    """
+    return csrf_exempt(decorator_from_middleware(JsonCsrfViewMiddleware)(view))
+
+
+def api_view(view):
+    """Report missing games and content as JSON 404s."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404 as exc:
+            return json_error(str(exc) or 'Not found', 404)
+    return wrapper
+
+
+def scene_payload(scene):
+    """Static scene content, the same for every player."""
+    return {
+        'scene_id': scene.scene_id,
+        'title': scene.title,
+        'description': scene.description,
+        'ascii_art': scene.ascii_art,
+        'scene_type': scene.scene_type,
+        'is_ending': scene.is_ending,
+        'is_death': scene.is_death,
+        'choices': [
+            {
+                'id': choice.id,
+                'letter': choice.choice_letter,
+                'text': choice.choice_text,
+                'requires_item': choice.requires_item_id,
+            }
+            for choice in scene.choices
+        ],
+        'items': [
+            {
+                'item_id': item.item_id,
+                'name': item.name,
+                'description': item.description,
+                'icon': item.icon,
+            }
+            for item in scene.items
+        ],
+    }
+
+
+def state_payload(game_state, scene):
+    """The player's progress and what is available to them in ``scene``."""
+    return {
+        'scene_id': scene.scene_id,
+        'locked_choices': [
+            choice.id for choice in scene.choices
+            if choice.requires_item_id and not game_state.has_item(choice.requires_item_id)
+        ],
+        'items_here': [
+            item.item_id for item in scene.items if not game_state.has_item(item.item_id)
+        ],
+        'inventory': game_state.inventory,
+        'choices_made': game_state.choices_made,
+        'deaths': game_state.deaths,
+        'items_collected': game_state.items_collected,
+        'is_complete': game_state.is_complete,
+        'version': game_state.version,
+    }
+
+
+def game_response(game_state, graph, status=200):
+    scene = graph.scenes_by_pk[game_state.current_scene_id]
+    return JsonResponse({
+        'scene': scene_payload(scene),
+        'state': state_payload(game_state, scene),
+    }, status=status)
+
+
+def conflict_response():
+    return json_error(CONFLICT_MESSAGE, 409)
+
+
+@require_GET
+@ensure_csrf_cookie
+@api_view
+def game_state(request):
+    """Current scene and player state; also sets the CSRF cookie for writes."""
+    return game_response(get_game_state(request), get_story_graph())
+
+
+@api_csrf_protect
+@require_POST
+@api_view
+def make_choice(request, choice_id):
+    """Take a choice and return the new scene and state."""
+    game_state = get_game_state(request)
+    graph = get_story_graph()
+    choice = graph.choices.get(choice_id)
+    if choice is None:
+        raise Http404("No Choice matches the given query.")
+
+    def attempt(game_state):
+        error = choice_error(game_state, choice)
+        if error:
+            return json_error(error, 400)
+        if game_state.commit_move(choice, graph.scenes_by_pk[choice.to_scene_pk]):
+            return game_response(game_state, graph)
+
+    return write_with_retry(game_state, attempt, conflict_response())
+
+
+@api_csrf_protect
+@require_POST
+@api_view
+def pickup_item(request, item_id):
+    """Pick up an item and return the updated scene and state."""
+    game_state = get_game_state(request)
+    graph = get_story_graph()
+    item = graph.items.get(item_id)
+    if item is None:
+        raise Http404("No Item matches the given query.")
+
+    def attempt(game_state):
+        error = pickup_error(game_state, item)
+        if error:
+            return json_error(error, 400)
+        if game_state.add_item(item_id):
+            return game_response(game_state, graph)
+
+    return write_with_retry(game_state, attempt, conflict_response())
+
+
+def apply_move(game_state, move, graph):
+    """Apply one batch entry in memory. Returns an error message or None."""
+    if not isinstance(move, dict):
+        return "Move must be an object"
+    if 'choice' in move:
+        choice_id = move['choice']
+        # bool is an int subclass: {"choice": true} must not mean choice 1
+        valid = isinstance(choice_id, int) and not isinstance(choice_id, bool)
+        choice = graph.choices.get(choice_id) if valid else None
+        if choice is None:
+            return "No such choice"
+        error = choice_error(game_state, choice)
+        if error is None:
+            game_state.commit_move(choice, graph.scenes_by_pk[choice.to_scene_pk])
+        return error
+    if 'pickup' in move:
+        item = graph.items.get(move['pickup']) if isinstance(move['pickup'], str) else None
+        if item is None:
+            return "No such item"
+        error = pickup_error(game_state, item)
+        if error is None:
+            game_state.add_item(item.item_id)
+        return error
+    return "Move must have a 'choice' or 'pickup'"
+
+
+@api_csrf_protect
+@require_POST
+@api_view
+def make_moves(request):
+    """
+    Apply an ordered list of moves and pickups with a single write.
+
+    The body is ``{"moves": [{"choice": 12}, {"pickup": "ITEM_003"}, ...]}``.
+    Moves are checked with the same rules as single moves, on a copy of the
+    game. If any is illegal nothing is saved and the response gives its
+    index; otherwise the game is written once and the final payload is
+    returned.
+    """
+    try:
+        moves = json.loads(request.body)['moves']
+    except (ValueError, KeyError, TypeError):
+        return json_error("Expected a JSON object with a 'moves' list", 400)
+    if not isinstance(moves, list):
+        return json_error("Expected a JSON object with a 'moves' list", 400)
+    max_moves = getattr(settings, 'CASTLE_ADVENTURE_MAX_BATCH_MOVES', 100)
+    if len(moves) > max_moves:
+        return json_error(f"At most {max_moves} moves per batch", 400)
+
+    game_state = get_game_state(request)
+    graph = get_story_graph()
+
+    def attempt(game_state):
+        working = copy.deepcopy(game_state)
+        working.defer_writes = True
+        for index, move in enumerate(moves):
+            error = apply_move(working, move, graph)
+            if error:
+                return JsonResponse({'error': error, 'index': index}, status=400)
+
+        working.defer_writes = game_state.defer_writes
+        if not working.commit_progress(game_state.version):
+            return None
+        for field in GameState.PROGRESS_FIELDS:
+            setattr(game_state, field, getattr(working, field))
+        game_state.pending_moves = working.pending_moves
+        return game_response(game_state, graph)
+
+    return write_with_retry(game_state, attempt, conflict_response())
+
+
+def scene_etag(request, scene_id):
+    graph = get_story_graph()
+    scene = graph.scenes.get(scene_id)
+    return make_etag(graph.revision(scene) if scene else graph.version, scene_id)
+
+
+@require_GET
+@api_view
+@cache_control(public=True, no_cache=True)
+@condition(etag_func=scene_etag)
+def scene(request, scene_id):
+    """Static content of one scene, revalidated by scene revision."""
+    node = get_story_graph().scenes.get(scene_id)
+    if node is None:
+        raise Http404("No Scene matches the given query.")
+    return JsonResponse(scene_payload(node))
@@ -1,7 +1,14 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class CastleAdventureConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "castle_adventure"
     verbose_name = "Castle of Shadows Adventure Game"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .checks import check_game_state_store_middleware
+
+        checks.register(check_game_state_store_middleware)
@@ -0,0 +1,34 @@
+"""
+URL configuration for castle_adventure under ASGI.
+
+Same routes and names as castle_adventure.urls, with the game flow served
+by async_views.
+"""
+from django.urls import path
+from . import api, metrics, async_views, views
+
+app_name = 'castle_adventure'
+
+urlpatterns = [
+    path('', views.landing_page, name='landing'),
+    path('start/', views.start_game, name='start'),
+    path('new/', views.new_game, name='new_game'),
+    path('scene/<str:scene_id>/', async_views.display_scene, name='scene'),
+    path('choice/<int:choice_id>/', async_views.make_choice, name='choice'),
+    path('pickup/<str:item_id>/', async_views.pickup_item, name='pickup_item'),
+    path('inventory/', async_views.view_inventory, name='inventory'),
+    path('save/', views.save_game, name='save'),
+    path('load/', views.load_game, name='load'),
+    path('ending/<str:scene_id>/', async_views.display_ending, name='display_ending'),
+    path('endings/', async_views.endings_collection, name='endings_collection'),
+
+    # JSON API
+    path('api/game/', api.game_state, name='api_game'),
+    path('api/game/choice/<int:choice_id>/', api.make_choice, name='api_choice'),
+    path('api/game/pickup/<str:item_id>/', api.pickup_item, name='api_pickup'),
+    path('api/game/moves/', api.make_moves, name='api_moves'),
+    path('api/scenes/<str:scene_id>/', api.scene, name='api_scene'),
+
+    # Prometheus metrics (enabled by CASTLE_ADVENTURE_METRICS)
+    path('metrics/', metrics.metrics, name='metrics'),
+]
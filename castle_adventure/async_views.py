@@ -0,0 +1,178 @@
+"""
+Async versions of the game flow views for ASGI deployments.
+
+They read story content from the in-memory graph and game state through
+the async ORM, so a slow client does not tie up a worker thread. Route
+them by including ``castle_adventure.async_urls`` instead of
+``castle_adventure.urls``; the URL names are the same.
+
+Conditional GET (ETag) handling is only applied by the sync views: the
+``condition`` decorator does not support coroutines before Django 5.0.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
+from django.shortcuts import render, redirect
+
+from .ending_logic import determine_ending
+from .models import Ending, EndingUnlock, GameState
+from .stores import aget_user, get_game_state_store
+from .story_graph import aget_story_graph
+from .views import (
+    CONFLICT_MESSAGE, MAX_WRITE_ATTEMPTS, choice_error, inventory_page, pickup_error,
+    redirect_to_current_scene, scene_page, set_request_game_state,
+)
+
+
+async def aget_or_create_game_state(request):
+    """Async version of views.get_or_create_game_state."""
+    game_state = getattr(request, '_castle_game_state', None)
+    if game_state is not None:
+        return game_state
+
+    game_state = await get_game_state_store().aload(request)
+    set_request_game_state(request, game_state)
+    return game_state
+
+
+async def aget_game_state(request):
+    """Get current game state, raise 404 if not found."""
+    state = await aget_or_create_game_state(request)
+    if not state:
+        raise Http404("No active game found")
+    return state
+
+
+async def awrite_with_retry(game_state, attempt):
+    """Async version of views.write_with_retry; ``attempt`` is a coroutine function."""
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        response = await attempt(game_state)
+        if response is not None:
+            return response
+        try:
+            await game_state.arefresh_from_db()
+        except GameState.DoesNotExist:
+            raise Http404("No active game found")
+        if game_state.is_complete:
+            raise Http404("No active game found")
+    return HttpResponse(CONFLICT_MESSAGE, status=409)
+
+
+async def display_scene(request, scene_id):
+    """Display current scene with choices."""
+    game_state = await aget_game_state(request)
+    return scene_page(request, game_state, await aget_story_graph(), scene_id)
+
+
+async def make_choice(request, choice_id):
+    """Process player choice and navigate to next scene."""
+    game_state = await aget_game_state(request)
+    graph = await aget_story_graph()
+    choice = graph.choices.get(choice_id)
+    if choice is None:
+        raise Http404("No Choice matches the given query.")
+
+    to_scene = graph.scenes_by_pk[choice.to_scene_pk]
+
+    async def attempt(game_state):
+        error = choice_error(game_state, choice)
+        if error:
+            return HttpResponseBadRequest(error)
+
+        if await game_state.acommit_move(choice, to_scene):
+            return redirect('castle_adventure:scene', scene_id=to_scene.scene_id)
+
+    return await awrite_with_retry(game_state, attempt)
+
+
+async def pickup_item(request, item_id):
+    """Pick up an item and add to inventory."""
+    game_state = await aget_game_state(request)
+    graph = await aget_story_graph()
+    item = graph.items.get(item_id)
+    if item is None:
+        raise Http404("No Item matches the given query.")
+
+    async def attempt(game_state):
+        error = pickup_error(game_state, item)
+        if error:
+            return HttpResponseBadRequest(error)
+
+        if await game_state.aadd_item(item_id):
+            return redirect_to_current_scene(game_state, graph)
+
+    return await awrite_with_retry(game_state, attempt)
+
+
+async def view_inventory(request):
+    """View player inventory."""
+    game_state = await aget_game_state(request)
+    return inventory_page(request, game_state, await aget_story_graph())
+
+
+async def unlock_ending(request, ending):
+    """Record ending unlock for user/session."""
+    user = await aget_user(request)
+    if user.is_authenticated:
+        await EndingUnlock.objects.aget_or_create(user=user, ending=ending)
+    else:
+        if not request.session.session_key:
+            await sync_to_async(request.session.create)()
+        await EndingUnlock.objects.aget_or_create(
+            session_key=request.session.session_key,
+            ending=ending
+        )
+
+
+async def get_unlocked_endings(request):
+    """Get list of endings this user/session has unlocked."""
+    user = await aget_user(request)
+    if user.is_authenticated:
+        unlocks = EndingUnlock.objects.filter(user=user)
+    elif request.session.session_key:
+        unlocks = EndingUnlock.objects.filter(session_key=request.session.session_key)
+    else:
+        return []
+    return [ending_id async for ending_id in unlocks.values_list('ending_id', flat=True)]
+
+
+async def display_ending(request, scene_id):
+    """Display ending with achievement unlock."""
+    game_state = await aget_game_state(request)
+    scene = (await aget_story_graph()).scenes.get(scene_id)
+    if scene is None or not scene.is_ending:
+        raise Http404("No Scene matches the given query.")
+
+    async def attempt(game_state):
+        ending_id = determine_ending(game_state)
+        if await game_state.acomplete(ending_id):
+            return await Ending.objects.aget(ending_id=ending_id)
+
+    ending = await awrite_with_retry(game_state, attempt)
+    if isinstance(ending, HttpResponse):
+        return ending
+
+    await unlock_ending(request, ending)
+
+    context = {
+        'ending': ending,
+        'game_state': game_state,
+        'all_endings': [ending async for ending in Ending.objects.all()],
+        'unlocked_endings': await get_unlocked_endings(request),
+    }
+    return render(request, 'castle_adventure/ending.html', context)
+
+
+async def endings_collection(request):
+    """Display all endings with locked/unlocked status."""
+    all_endings = [ending async for ending in Ending.objects.order_by('ending_id')]
+    unlocked = await get_unlocked_endings(request)
+
+    for ending in all_endings:
+        ending.is_unlocked = ending.id in unlocked
+
+    context = {
+        'endings': all_endings,
+        'total_endings': len(all_endings),
+        'unlocked_count': len(unlocked),
+    }
+    return render(request, 'castle_adventure/endings_collection.html', context)
@@ -0,0 +1,55 @@
+"""
+Compact bitmap helpers for GameState inventory and visited scenes.
+
+Bitmaps are little-endian byte strings: bit ``i`` lives in byte ``i // 8``.
+Scenes and items each get a dense ``bit_index`` per story, so a player's
+inventory or visited set costs one bit per piece of content.
+"""
+
+
+def has_bit(data, index):
+    """Return True if bit ``index`` is set."""
+    byte = index >> 3
+    return byte < len(data) and bool(data[byte] >> (index & 7) & 1)
+
+
+def set_bit(data, index):
+    """
+    Set bit ``index`` and return the bitmap.
+
+    A bytearray is updated in place; any other buffer is copied once.
+    """
+    if not isinstance(data, bytearray):
+        data = bytearray(data)
+    byte = index >> 3
+    if byte >= len(data):
+        data.extend(bytes(byte + 1 - len(data)))
+    data[byte] |= 1 << (index & 7)
+    return data
+
+
+def popcount(data):
+    """Return the number of set bits."""
+    return int.from_bytes(data, 'little').bit_count()
+
+
+def count_bits(data, mask):
+    """Return the number of set bits that are also set in the integer ``mask``."""
+    return (int.from_bytes(data, 'little') & mask).bit_count()
+
+
+def iter_bits(data):
+    """Yield the indexes of all set bits in ascending order."""
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield (byte_index << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+def from_indexes(indexes):
+    """Build a bitmap with the given bits set."""
+    data = bytearray()
+    for index in indexes:
+        set_bit(data, index)
+    return bytes(data)
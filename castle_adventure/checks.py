@@ -0,0 +1,39 @@
+"""
+System checks for Castle Adventure.
+"""
+from django.conf import settings
+from django.core.checks import Error
+from django.utils.module_loading import import_string
+
+from .move_log import move_log_enabled
+from .stores import DEFAULT_GAME_STATE_STORE, DatabaseGameStateStore
+
+
+MIDDLEWARE_PATH = 'castle_adventure.middleware.GameStateStoreMiddleware'
+
+
+def check_game_state_store_middleware(app_configs, **kwargs):
+    """
+    Stores other than the plain database store write in process_response.
+
+    Without GameStateStoreMiddleware those writes never happen, so cookie,
+    cached and event-sourced games (and the move log) would silently lose
+    progress.
+    """
+    path = getattr(settings, 'CASTLE_ADVENTURE_GAME_STATE_STORE', DEFAULT_GAME_STATE_STORE)
+    if MIDDLEWARE_PATH in settings.MIDDLEWARE:
+        return []
+    try:
+        store_class = import_string(path)
+    except ImportError:
+        return [Error(
+            f"CASTLE_ADVENTURE_GAME_STATE_STORE names {path!r}, which cannot be imported.",
+            id='castle_adventure.E002',
+        )]
+    if store_class is DatabaseGameStateStore and not move_log_enabled():
+        return []
+    return [Error(
+        f"{store_class.__name__} needs {MIDDLEWARE_PATH} in MIDDLEWARE.",
+        hint='Without it, game state changes made during a request are never saved.',
+        id='castle_adventure.E001',
+    )]
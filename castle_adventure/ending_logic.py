@@ -1,11 +1,225 @@
 """
 Ending determination logic for Castle Adventure.
+
+Endings can describe when they are reached with rules stored in
+Ending.requirements::
+
+    {
+        "priority": 30,                       # higher rules are tried first
+        "items": ["ITEM_004"],                # all must be held
+        "flags": {"dragon_befriended": true,  # true/false: flag truthiness
+                  "chaos_level": ">10"},      # "<op><number>": comparison
+        "counters": {"deaths": "<3"},         # see COUNTERS
+        "any": [{...}, {...}]                 # at least one sub-rule holds
+    }
+
+Every given condition must hold; ``{"priority": 0}`` always matches, and
+the lowest-priority ending is reached if nothing else matches. Rules are
+compiled into predicates once, when the story graph is built. If no ending
+uses rules, the built-in E1-E5 logic below is used.
 """
+import logging
+import operator
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+
+logger = logging.getLogger(__name__)
+
+RULE_KEYS = {'priority', 'items', 'flags', 'counters', 'any'}
+
+COUNTERS = {
+    'choices_made': lambda game_state: game_state.choices_made,
+    'deaths': lambda game_state: game_state.deaths,
+    'items_collected': lambda game_state: game_state.items_collected,
+    'items_held': lambda game_state: game_state.inventory_count,
+    'scenes_visited': lambda game_state: game_state.visited_count,
+}
+
+OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+
+class RuleError(ValueError):
+    """Raised for an ending rule that cannot be compiled."""
+
+
+@dataclass(frozen=True)
+class EndingRule:
+    """A compiled ending rule."""
+
+    ending_id: str
+    priority: int
+    matches: object
+    requirements: Mapping
 
 
-def determine_ending(game_state):
+def is_rule(requirements):
+    """Whether ``requirements`` is written in the rule language."""
+    return bool(requirements) and set(requirements) <= RULE_KEYS
+
+
+def compile_ending_rules(endings, skip_invalid=False):
+    """
+    Compile the rules of ``endings`` into a priority-ordered tuple.
+
+    Returns an empty tuple when no ending uses rules. Raises RuleError if
+    some do but others have requirements in another format, or with
+    ``skip_invalid`` logs those endings and leaves them out.
+    """
+    if not any(is_rule(ending.requirements) for ending in endings):
+        return ()
+    rules = []
+    for ending in endings:
+        try:
+            rules.append(EndingRule(
+                ending_id=ending.ending_id,
+                priority=_priority(ending.requirements),
+                matches=compile_rule(ending.requirements),
+                requirements=ending.requirements,
+            ))
+        except RuleError as exc:
+            if not skip_invalid:
+                raise RuleError(f"Ending {ending.ending_id}: {exc}") from None
+            logger.error("Ending %s cannot be reached, its rule is invalid: %s",
+                         ending.ending_id, exc)
+    # Stable sort: equal priorities keep ending_id order
+    rules.sort(key=lambda rule: -rule.priority)
+    return tuple(rules)
+
+
+def compile_rule(requirements):
+    """Compile one rule into a predicate taking (game_state, held_items)."""
+    if not isinstance(requirements, Mapping):
+        raise RuleError("a rule must be an object")
+    unknown = set(requirements) - RULE_KEYS
+    if unknown:
+        raise RuleError(f"unknown keys {sorted(unknown)}")
+    _priority(requirements)
+
+    checks = []
+    items = requirements.get('items')
+    if items:
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            raise RuleError("'items' must be a list of item ids")
+        required = frozenset(items)
+        checks.append(lambda game_state, held: required <= held)
+
+    for name, condition in _mapping(requirements, 'flags').items():
+        checks.append(_flag_check(name, condition))
+
+    for name, condition in _mapping(requirements, 'counters').items():
+        if name not in COUNTERS:
+            raise RuleError(f"unknown counter '{name}'")
+        checks.append(_counter_check(COUNTERS[name], condition))
+
+    if 'any' in requirements:
+        alternatives = requirements['any']
+        if not isinstance(alternatives, list) or not alternatives:
+            raise RuleError("'any' must be a non-empty list of rules")
+        options = tuple(compile_rule(rule) for rule in alternatives)
+        checks.append(
+            lambda game_state, held: any(option(game_state, held) for option in options)
+        )
+
+    checks = tuple(checks)
+    return lambda game_state, held: all(check(game_state, held) for check in checks)
+
+
+def _priority(requirements):
+    priority = requirements.get('priority', 0)
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        raise RuleError("'priority' must be an integer")
+    return priority
+
+
+def _mapping(requirements, key):
+    value = requirements.get(key, {})
+    if not isinstance(value, Mapping):
+        raise RuleError(f"'{key}' must be an object")
+    return value
+
+
+def parse_comparison(condition):
+    """Parse "<op><number>" into (op, number), or return None."""
+    if not isinstance(condition, str):
+        return None
+    for symbol, op in OPERATORS.items():
+        if condition.startswith(symbol):
+            try:
+                return op, float(condition[len(symbol):])
+            except ValueError:
+                raise RuleError(f"bad comparison '{condition}'") from None
+    return None
+
+
+def _flag_check(name, condition):
+    if isinstance(condition, bool):
+        return lambda game_state, held: bool(game_state.flags.get(name)) is condition
+    comparison = parse_comparison(condition)
+    if comparison:
+        op, number = comparison
+
+        def check(game_state, held):
+            value = flag_number(game_state.flags.get(name))
+            return value is not None and op(value, number)
+        return check
+    return lambda game_state, held: game_state.flags.get(name) == condition
+
+
+def flag_number(value):
+    """
+    A flag value for comparisons, or None if it isn't a number.
+
+    Missing and null flags count as 0; any other non-numeric value fails
+    every comparison. ending_stats converts flag columns the same way.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def _counter_check(counter, condition):
+    if isinstance(condition, int) and not isinstance(condition, bool):
+        op, number = operator.eq, condition
+    else:
+        comparison = parse_comparison(condition)
+        if comparison is None:
+            raise RuleError(f"bad counter condition {condition!r}")
+        op, number = comparison
+    return lambda game_state, held: op(counter(game_state), number)
+
+
+def determine_ending(game_state, graph=None):
     """
     Determine which ending player reaches based on game state.
+
+    Uses the compiled ending rules when the story defines any.
+    """
+    from .story_graph import get_story_graph
+
+    rules = (graph or get_story_graph()).ending_rules
+    if not rules:
+        return determine_legacy_ending(game_state)
+    held = frozenset(game_state.inventory)
+    for rule in rules:
+        if rule.matches(game_state, held):
+            return rule.ending_id
+    # The lowest-priority ending is the default
+    return rules[-1].ending_id
+
+
+def determine_legacy_ending(game_state):
+    """
+    Built-in ending logic for stories without ending rules.
     Returns ending_id (E1-E5).
 
     Priority order (most specific first):
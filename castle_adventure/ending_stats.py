@@ -0,0 +1,266 @@
+"""
+Batch ending evaluation for analytics.
+
+Answers "which ending would each of these games reach?" over many
+GameState rows at once. Rows are streamed in chunks into NumPy columns
+(an inventory bit matrix, plus flag and counter columns) and each ending
+rule is evaluated as a boolean mask over the whole chunk, instead of
+calling determine_ending once per game.
+
+NumPy is an optional dependency: ``pip install django-castle-adventure[analytics]``.
+"""
+import dataclasses
+from collections import Counter
+
+from .ending_logic import (
+    compile_ending_rules, determine_legacy_ending, flag_number, parse_comparison,
+)
+from .models import GameState
+from .story_graph import get_story_graph
+
+
+CHUNK_SIZE = 10000
+
+ROW_FIELDS = (
+    'inventory_bits', 'visited_bits', 'unindexed_inventory', 'unindexed_visited',
+    'flags', 'choices_made', 'deaths', 'items_collected', 'ending_reached',
+)
+
+
+def load_numpy():
+    """Import NumPy, or explain how to install it."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "Batch ending evaluation requires NumPy. Install it with "
+            "pip install 'django-castle-adventure[analytics]'."
+        ) from None
+    return numpy
+
+
+def override_rules(graph, requirements_by_ending):
+    """
+    Compile the graph's ending rules with some requirements replaced.
+
+    ``requirements_by_ending`` maps ending_id to a rule, for trying out a
+    change before saving it. Raises RuleError for invalid rules and
+    KeyError for unknown endings.
+    """
+    for ending_id in requirements_by_ending:
+        if ending_id not in graph.endings:
+            raise KeyError(ending_id)
+    return compile_ending_rules([
+        dataclasses.replace(ending, requirements=requirements_by_ending[ending.ending_id])
+        if ending.ending_id in requirements_by_ending else ending
+        for ending in graph.endings.values()
+    ])
+
+
+def ending_distribution(queryset=None, rules=None, graph=None, chunk_size=CHUNK_SIZE):
+    """
+    Count the ending each game in ``queryset`` would reach now.
+
+    Defaults to all incomplete games and the story's own rules. Returns a
+    Counter of ending_id to number of games.
+    """
+    counts = Counter()
+    for reached, ending_ids in evaluate_endings(queryset, rules, graph, chunk_size):
+        counts.update(ending_ids)
+    return counts
+
+
+def ending_transitions(queryset=None, rules=None, graph=None, chunk_size=CHUNK_SIZE):
+    """
+    Compare the ending games actually reached with the one ``rules`` give.
+
+    Defaults to all completed games still in GameState; archived games
+    keep no inventory or flags, so they can't be evaluated. Returns a
+    Counter keyed by (ending_reached, ending_id) pairs.
+    """
+    if queryset is None:
+        queryset = GameState.objects.filter(is_complete=True)
+    counts = Counter()
+    for reached, ending_ids in evaluate_endings(queryset, rules, graph, chunk_size):
+        counts.update(zip(reached, ending_ids))
+    return counts
+
+
+def evaluate_endings(queryset=None, rules=None, graph=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield (ending_reached, ending_ids) lists for each chunk of ``queryset``.
+
+    Stories without ending rules use the built-in logic row by row.
+    """
+    graph = graph or get_story_graph()
+    rules = graph.ending_rules if rules is None else rules
+    if queryset is None:
+        queryset = GameState.objects.filter(is_complete=False)
+    queryset = queryset.order_by('pk')
+
+    if not rules:
+        yield from _evaluate_legacy(queryset, chunk_size)
+        return
+
+    numpy = load_numpy()
+    ending_ids = numpy.array([rule.ending_id for rule in rules], dtype=object)
+    for rows in _chunks(queryset.values_list(*ROW_FIELDS), chunk_size):
+        columns = GameColumns(numpy, rows, graph)
+        # Lowest priority first, so higher-priority matches overwrite it
+        result = numpy.full(len(rows), len(rules) - 1)
+        for index in range(len(rules) - 1, -1, -1):
+            result[columns.mask(rules[index].requirements)] = index
+        yield [row[-1] for row in rows], ending_ids[result].tolist()
+
+
+def _evaluate_legacy(queryset, chunk_size):
+    for games in _chunks(queryset.only(*ROW_FIELDS), chunk_size):
+        yield (
+            [game.ending_reached for game in games],
+            [determine_legacy_ending(game) for game in games],
+        )
+
+
+def _chunks(queryset, chunk_size):
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class GameColumns:
+    """Column view of a chunk of GameState rows, built as rules need it."""
+
+    def __init__(self, numpy, rows, graph):
+        self.np = numpy
+        self.rows = rows
+        self.graph = graph
+        self.size = len(rows)
+        self._cache = {}
+
+    def _column(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def _bit_matrix(self, field):
+        """Unpack one bitmap field into a (rows, bits) boolean matrix."""
+        np = self.np
+        position = ROW_FIELDS.index(field)
+        data = [bytes(row[position]) for row in self.rows]
+        width = max(map(len, data), default=0) or 1
+        packed = np.frombuffer(
+            b''.join(value.ljust(width, b'\0') for value in data), dtype=np.uint8
+        ).reshape(self.size, width)
+        return np.unpackbits(packed, axis=1, bitorder='little').astype(bool)
+
+    def _unindexed(self, field):
+        return [row[ROW_FIELDS.index(field)] for row in self.rows]
+
+    def inventory(self):
+        return self._column('inventory', lambda: self._bit_matrix('inventory_bits'))
+
+    def item(self, item_id):
+        def build():
+            held = self.np.zeros(self.size, dtype=bool)
+            bit = self.graph.item_bits.get(item_id)
+            matrix = self.inventory()
+            if bit is not None and bit < matrix.shape[1]:
+                held |= matrix[:, bit]
+            unindexed = self._unindexed('unindexed_inventory')
+            if any(unindexed):
+                held |= self.np.fromiter(
+                    (item_id in items for items in unindexed), dtype=bool, count=self.size
+                )
+            return held
+        return self._column(('item', item_id), build)
+
+    def counter(self, name):
+        np = self.np
+
+        def build():
+            if name == 'items_held':
+                return (self._count_known(self.inventory(), self.graph.item_bits)
+                        + self._lengths('unindexed_inventory'))
+            if name == 'scenes_visited':
+                visited = self._bit_matrix('visited_bits')
+                return (self._count_known(visited, self.graph.scene_bits)
+                        + self._lengths('unindexed_visited'))
+            position = ROW_FIELDS.index(name)
+            return np.fromiter((row[position] for row in self.rows), dtype=np.int64,
+                               count=self.size)
+        return self._column(('counter', name), build)
+
+    def _count_known(self, matrix, bits):
+        """Set bits per row, counting only bits of content that still exists."""
+        known = self.np.zeros(matrix.shape[1], dtype=bool)
+        known[[bit for bit in bits.values() if bit < matrix.shape[1]]] = True
+        return matrix[:, known].sum(axis=1)
+
+    def _lengths(self, field):
+        return self.np.fromiter(map(len, self._unindexed(field)), dtype=self.np.int64,
+                                count=self.size)
+
+    def flag_values(self, name):
+        position = ROW_FIELDS.index('flags')
+        return self._column(
+            ('flag', name), lambda: [row[position].get(name) for row in self.rows]
+        )
+
+    def flag_number(self, name):
+        def build():
+            return self.np.fromiter(
+                (_as_number(value) for value in self.flag_values(name)),
+                dtype=float, count=self.size,
+            )
+        return self._column(('flag_number', name), build)
+
+    def mask(self, requirements):
+        """Boolean mask of the rows matching one rule."""
+        np = self.np
+        mask = np.ones(self.size, dtype=bool)
+        for item_id in requirements.get('items') or ():
+            mask &= self.item(item_id)
+
+        for name, condition in requirements.get('flags', {}).items():
+            if isinstance(condition, bool):
+                truthy = np.fromiter(map(bool, self.flag_values(name)), dtype=bool,
+                                     count=self.size)
+                mask &= truthy if condition else ~truthy
+                continue
+            comparison = parse_comparison(condition)
+            if comparison:
+                op, number = comparison
+                values = self.flag_number(name)
+                # NaN is != everything, but non-numeric flags fail every comparison
+                mask &= op(values, number) & ~np.isnan(values)
+            else:
+                mask &= np.fromiter(
+                    (value == condition for value in self.flag_values(name)),
+                    dtype=bool, count=self.size,
+                )
+
+        for name, condition in requirements.get('counters', {}).items():
+            comparison = parse_comparison(condition)
+            if comparison is None:
+                mask &= self.counter(name) == condition
+            else:
+                op, number = comparison
+                mask &= op(self.counter(name), number)
+
+        if requirements.get('any'):
+            alternatives = np.zeros(self.size, dtype=bool)
+            for rule in requirements['any']:
+                alternatives |= self.mask(rule)
+            mask &= alternatives
+        return mask
+
+
+def _as_number(value):
+    """A flag value as a float for comparisons, NaN if it isn't a number."""
+    value = flag_number(value)
+    return float('nan') if value is None else float(value)
@@ -0,0 +1,89 @@
+"""
+Management command to apply a story update as a content-hash diff.
+"""
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from castle_adventure.story_diff import StoryDiff
+from castle_adventure.story_graph import bump_story_version
+from castle_adventure.story_import import (
+    BATCH_SIZE, CONTENT, StoryImportError, find_story_files,
+)
+
+
+FIXTURE_DIR = Path(__file__).resolve().parents[2] / 'fixtures'
+
+# Natural keys listed per change at normal verbosity; -v 2 lists all
+SHOWN_KEYS = 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare story files with the database by content hash and apply only '
+        'the inserts, updates and deletes needed, in one transaction. Only the '
+        'pages of changed scenes are rendered again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=str(FIXTURE_DIR),
+                            help='Directory with scenes, items, choices and endings '
+                                 'as .json fixtures or .jsonl (default: the shipped story)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'Rows per bulk upsert or delete (default: {BATCH_SIZE})')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the diff without writing anything')
+        parser.add_argument('--delete-progress', action='store_true',
+                            help='Allow deleting scenes that games are on and endings '
+                                 'players have unlocked, with those games and unlocks')
+
+    def handle(self, *args, **options):
+        try:
+            story_diff = StoryDiff(find_story_files(Path(options['dir'])), options['batch_size'])
+            with transaction.atomic():
+                story_diff.compare()
+                self.report(story_diff, options['verbosity'])
+                if options['dry_run'] or not story_diff.changed:
+                    return
+
+                games, unlocks = story_diff.progress_lost()
+                if (games or unlocks) and not options['delete_progress']:
+                    raise CommandError(
+                        f'The update deletes content that {games} games in progress and '
+                        f'{unlocks} ending unlocks refer to; use --delete-progress to '
+                        f'delete them too'
+                    )
+                story_diff.apply()
+                bump_story_version()
+        except StoryImportError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS('Story update applied.'))
+
+    def report(self, story_diff, verbosity):
+        for name in CONTENT:
+            diff = story_diff.diffs[name]
+            self.stdout.write(
+                f'{name.capitalize()}: {len(diff.inserted)} inserted, {len(diff.updated)} '
+                f'updated, {len(diff.deleted)} deleted, {diff.unchanged} unchanged'
+            )
+            for sign, keys in (('+', diff.inserted), ('~', diff.updated), ('-', diff.deleted)):
+                if keys and verbosity:
+                    self.stdout.write(f'  {sign} {self.describe(keys, verbosity)}')
+
+        if not story_diff.changed:
+            self.stdout.write(self.style.SUCCESS('Story content is up to date.'))
+            return
+        scenes = sorted(story_diff.scenes_changed)
+        self.stdout.write(
+            f'Scene pages invalidated: {len(scenes)}'
+            + (f' ({self.describe(scenes, verbosity)})' if scenes and verbosity else '')
+        )
+
+    def describe(self, keys, verbosity):
+        shown = keys if verbosity > 1 else keys[:SHOWN_KEYS]
+        text = ', '.join('/'.join(key) if isinstance(key, tuple) else key for key in shown)
+        if len(shown) < len(keys):
+            text += f' and {len(keys) - len(shown)} more'
+        return text
@@ -0,0 +1,77 @@
+"""
+Management command to move completed games into the ArchivedGame table.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from castle_adventure.models import ArchivedGame, GameState
+
+
+class Command(BaseCommand):
+    help = 'Move completed games from GameState into the compact ArchivedGame table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Games moved per transaction (default: 1000)')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches (default: 0.1)')
+        parser.add_argument('--min-age', type=int, default=0,
+                            help='Only archive games finished at least this many minutes ago (default: 0)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        completed = GameState.objects.filter(
+            is_complete=True,
+            last_updated__lte=timezone.now() - timedelta(minutes=options['min_age']),
+        )
+
+        started = time.perf_counter()
+        archived = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    completed.filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .values(
+                        'pk', 'user_id', 'session_key', 'current_scene__scene_id',
+                        'ending_reached', 'choices_made', 'deaths', 'items_collected',
+                        'game_started', 'last_updated',
+                    )[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1]['pk']
+                # ignore_conflicts makes a re-run after a failed delete harmless
+                ArchivedGame.objects.bulk_create([
+                    ArchivedGame(
+                        game_id=row['pk'],
+                        user_id=row['user_id'],
+                        session_key=row['session_key'],
+                        final_scene_id=row['current_scene__scene_id'],
+                        ending_reached=row['ending_reached'],
+                        choices_made=row['choices_made'],
+                        deaths=row['deaths'],
+                        items_collected=row['items_collected'],
+                        game_started=row['game_started'],
+                        game_finished=row['last_updated'],
+                    )
+                    for row in batch
+                ], ignore_conflicts=True)
+                GameState.objects.filter(pk__in=[row['pk'] for row in batch]).delete()
+            archived += len(batch)
+
+            if len(batch) < batch_size:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} completed games in {elapsed:.1f}s '
+            f'({archived / elapsed if elapsed else 0:.0f} games/s)'
+        ))
@@ -0,0 +1,93 @@
+"""
+Management command to benchmark active-game lookups on a large GameState table.
+"""
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from castle_adventure.models import GameState, Scene
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed GameState rows and report active-game lookup latency with and '
+        'without the lookup indexes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Number of GameState rows to seed (default: 1000000)')
+        parser.add_argument('--lookups', type=int, default=1000,
+                            help='Number of lookups to time per run (default: 1000)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per INSERT while seeding (default: 5000)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows instead of deleting them')
+
+    def handle(self, *args, **options):
+        scene = Scene.objects.order_by('pk').first()
+        if scene is None:
+            raise CommandError('No scenes found. Run load_story_content first.')
+
+        rows, batch_size = options['rows'], options['batch_size']
+        prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+        self.stdout.write(f'Seeding {rows} GameState rows...')
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            GameState.objects.bulk_create([
+                GameState(
+                    session_key=f'{prefix}{n}',
+                    current_scene_id=scene.pk,
+                    # One in four seeded games is finished
+                    is_complete=n % 4 == 0,
+                )
+                for n in range(offset, min(offset + batch_size, rows))
+            ], batch_size=batch_size)
+        self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+        keys = [f'{prefix}{random.randrange(rows)}' for _ in range(options['lookups'])]
+        try:
+            self.report('With indexes', self.time_lookups(keys))
+            if not connection.features.can_rollback_ddl:
+                self.stdout.write(self.style.WARNING(
+                    f'{connection.vendor} cannot roll back DDL; skipping the run without indexes.'
+                ))
+                return
+            with transaction.atomic():
+                self.drop_lookup_indexes()
+                self.report('Without indexes', self.time_lookups(keys))
+                # Roll back the schema change; the indexes are restored
+                transaction.set_rollback(True)
+        finally:
+            if not options['keep']:
+                GameState.objects.filter(session_key__startswith=prefix).delete()
+
+    def drop_lookup_indexes(self):
+        # Only used to render DROP statements; it is never entered, so it
+        # works inside the surrounding transaction on every backend.
+        schema_editor = connection.schema_editor()
+        meta = GameState._meta
+        with connection.cursor() as cursor:
+            for index in [*meta.constraints, *meta.indexes]:
+                cursor.execute(str(index.remove_sql(GameState, schema_editor)))
+
+    def time_lookups(self, keys):
+        games = GameState.objects.select_related('current_scene').filter(is_complete=False)
+        timings = []
+        for key in keys:
+            started = time.perf_counter()
+            games.filter(session_key=key).first()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def report(self, label, timings):
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+        self.stdout.write(
+            f'{label}: mean {statistics.mean(timings):.3f}ms, '
+            f'median {statistics.median(timings):.3f}ms, p95 {p95:.3f}ms'
+        )
@@ -0,0 +1,178 @@
+"""
+Management command to load test the game with simulated players.
+"""
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from castle_adventure.story_graph import get_story_graph
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Player:
+    """One simulated player walking the story graph with its own session."""
+
+    def __init__(self, rng, deadline, death_weight, think_time):
+        self.rng = rng
+        self.deadline = deadline
+        self.death_weight = death_weight
+        self.think_time = think_time
+        # Server errors are counted, not raised, so one failure does not stop the player
+        self.client = Client(raise_request_exception=False)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.games = 0
+
+    def request(self, method, name, *args, data=None):
+        path = reverse(f'castle_adventure:{name}', args=args)
+        started = time.perf_counter()
+        if method == 'POST':
+            response = self.client.post(path, data or {})
+        else:
+            response = self.client.get(path)
+        self.latencies[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        return response
+
+    def run(self):
+        try:
+            while time.monotonic() < self.deadline:
+                self.play_game()
+        finally:
+            connection.close()
+
+    def play_game(self):
+        """Play from the first scene until an ending, a dead end or the deadline."""
+        self.games += 1
+        self.request('POST', 'new_game', data={'confirm_overwrite': '1'})
+        self.request('GET', 'start')
+        scene_id, held = '01', set()
+
+        while time.monotonic() < self.deadline:
+            graph = get_story_graph()
+            scene = graph.scenes[scene_id]
+            if self.request('GET', 'scene', scene_id).status_code != 200:
+                return
+            if scene.is_ending:
+                self.request('GET', 'display_ending', scene_id)
+                return
+
+            for item in scene.items:
+                if item.item_id not in held:
+                    if self.request('POST', 'pickup_item', item.item_id).status_code == 302:
+                        held.add(item.item_id)
+
+            choice = self.pick_choice(graph, scene, held)
+            if choice is None:
+                return
+            if self.request('POST', 'choice', choice.id).status_code != 302:
+                return
+            scene_id = graph.scenes_by_pk[choice.to_scene_pk].scene_id
+
+    def pick_choice(self, graph, scene, held):
+        choices = [
+            choice for choice in scene.choices
+            if not choice.requires_item_id or choice.requires_item_id in held
+        ]
+        if not choices:
+            return None
+        weights = [
+            self.death_weight if graph.scenes_by_pk[choice.to_scene_pk].is_death else 1.0
+            for choice in choices
+        ]
+        if not any(weights):
+            weights = None
+        return self.rng.choices(choices, weights)[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate concurrent players walking random paths through the story '
+        'and report requests/sec and latency percentiles per view. Players '
+        'create real sessions and games, so run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=10,
+                            help='Concurrent players, one thread each (default: 10)')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to run (default: 30)')
+        parser.add_argument('--death-weight', type=float, default=1.0,
+                            help='Relative weight of choices leading to a death scene; '
+                                 '1 is a uniform random walk (default: 1)')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Mean pause in seconds after each request (default: 0)')
+        parser.add_argument('--seed', type=int, help='Random seed for repeatable walks')
+
+    def handle(self, *args, **options):
+        if options['players'] < 1:
+            raise CommandError('--players must be at least 1')
+        graph = get_story_graph()
+        if '01' not in graph.scenes:
+            raise CommandError('No scenes found. Run load_story_content first.')
+
+        seeds = random.Random(options['seed'])
+        deadline = time.monotonic() + options['duration']
+        players = [
+            Player(random.Random(seeds.random()), deadline,
+                   options['death_weight'], options['think_time'])
+            for _ in range(options['players'])
+        ]
+        threads = [threading.Thread(target=player.run) for player in players]
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        self.report(players, elapsed)
+
+    def report(self, players, elapsed):
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        for player in players:
+            for name, values in player.latencies.items():
+                latencies[name].extend(values)
+            for name, count in player.errors.items():
+                errors[name] += count
+
+        self.stdout.write(
+            f"{'view':<20} {'requests':>9} {'req/s':>8} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for name in sorted(latencies):
+            values = sorted(latencies[name])
+            self.stdout.write(
+                f'{name:<20} {len(values):>9} {len(values) / elapsed:>8.1f} '
+                f'{percentile(values, 0.50) * 1000:>8.1f} '
+                f'{percentile(values, 0.95) * 1000:>8.1f} '
+                f'{percentile(values, 0.99) * 1000:>8.1f} {errors[name]:>7}'
+            )
+
+        total = sum(len(values) for values in latencies.values())
+        games = sum(player.games for player in players)
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} requests from {len(players)} players ({games} games) in {elapsed:.1f}s: '
+            f'{total / elapsed if elapsed else 0:.1f} req/s, {sum(errors.values())} errors'
+        ))
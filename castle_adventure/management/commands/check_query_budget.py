@@ -0,0 +1,96 @@
+"""
+Management command to check the game views against their query budgets.
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from castle_adventure.query_budget import (
+    BUDGET_FILE, FIXTURES, PlaythroughError, budget_from, check_budget, load_budget,
+    measure_playthrough,
+)
+from castle_adventure.story_graph import invalidate_story_graph
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Play a scripted game through every view and compare the SQL queries '
+        'each makes with the budget file. Runs in a throwaway test database '
+        'unless --use-current-database is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', default=str(BUDGET_FILE),
+                            help='Budget file (default: the one shipped with the app)')
+        parser.add_argument('--update', action='store_true',
+                            help='Rewrite the budget file with the measured counts')
+        parser.add_argument('--use-current-database', action='store_true',
+                            help='Play through in the configured database inside a '
+                                 'transaction that is rolled back, instead of in a test '
+                                 'database. This locks live story tables while it runs.')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Destroy an old test database without asking')
+
+    def handle(self, *args, **options):
+        if options['use_current_database']:
+            results = self.measure()
+        else:
+            results = self.measure_in_test_database(options['interactive'])
+
+        for name, entry in sorted(results.items()):
+            self.stdout.write(
+                f"{name}: {entry['queries']} queries "
+                f"({entry['requests']} requests, {entry['time_ms']:.1f} ms)"
+            )
+
+        if options['update']:
+            with open(options['budget'], 'w', encoding='utf-8') as f:
+                json.dump(budget_from(results), f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['budget']}"))
+            return
+
+        problems = check_budget(results, load_budget(options['budget']))
+        if problems:
+            raise CommandError('Query budget exceeded:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('All views within budget'))
+
+    def measure_in_test_database(self, interactive):
+        """Measure in a test database created and destroyed like the test runner does."""
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=not interactive,
+                                           serialize=False)
+        try:
+            return self.measure()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def measure(self):
+        """Load the fixtures and play through in a transaction that is rolled back."""
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                    transaction.atomic():
+                call_command('loaddata', *FIXTURES, verbosity=0)
+                client = Client()
+                client.force_login(User.objects.create_user(
+                    username=f'query-budget-{uuid.uuid4().hex[:12]}'
+                ))
+                try:
+                    results = measure_playthrough(client)
+                except PlaythroughError as exc:
+                    raise CommandError(f'Playthrough failed: {exc}')
+                raise Rollback
+        except Rollback:
+            return results
+        finally:
+            invalidate_story_graph()
@@ -0,0 +1,86 @@
+"""
+Management command to report which endings games would reach.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from castle_adventure.ending_logic import RuleError
+from castle_adventure.ending_stats import (
+    CHUNK_SIZE, ending_distribution, ending_transitions, override_rules,
+)
+from castle_adventure.models import ArchivedGame, GameState
+from castle_adventure.story_graph import get_story_graph
+
+
+class Command(BaseCommand):
+    help = (
+        'Count the ending every incomplete game would reach now, or with '
+        '--completed how trial rules would redistribute finished games. '
+        'Games moved out by archive_completed_games are left out: their '
+        'inventory and flags are not kept'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completed', action='store_true',
+                            help='Compare completed games that are not archived with the '
+                                 'ending they reached')
+        parser.add_argument('--rules',
+                            help='JSON file mapping ending_id to trial requirements')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Rows evaluated per chunk (default: {CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        graph = get_story_graph()
+        rules = self.load_rules(graph, options['rules']) if options['rules'] else None
+        chunk_size = options['chunk_size']
+
+        try:
+            if options['completed']:
+                counts = ending_transitions(
+                    GameState.objects.filter(is_complete=True), rules, graph, chunk_size
+                )
+            else:
+                counts = ending_distribution(
+                    GameState.objects.filter(is_complete=False), rules, graph, chunk_size
+                )
+        except ImportError as exc:
+            raise CommandError(str(exc))
+
+        total = sum(counts.values())
+        if options['completed']:
+            for (reached, ending_id), count in sorted(counts.items(), key=str):
+                marker = '' if reached == ending_id else '  (changed)'
+                self.stdout.write(f'{reached} -> {ending_id}: {count}{marker}')
+            moved = sum(count for (reached, ending_id), count in counts.items()
+                        if reached != ending_id)
+            self.stdout.write(self.style.SUCCESS(
+                f'{moved} of {total} completed games would reach a different ending'
+            ))
+            archived = ArchivedGame.objects.count()
+            if archived:
+                self.stdout.write(self.style.WARNING(
+                    f'{archived} archived games are not included: their inventory '
+                    f'and flags are not kept'
+                ))
+        else:
+            for ending_id, ending in graph.endings.items():
+                count = counts.get(ending_id, 0)
+                share = count / total * 100 if total else 0
+                self.stdout.write(f'{ending_id}  {ending.title}: {count} ({share:.1f}%)')
+            self.stdout.write(self.style.SUCCESS(f'Evaluated {total} incomplete games'))
+
+    def load_rules(self, graph, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                requirements = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read rules from {path}: {exc}')
+        if not isinstance(requirements, dict):
+            raise CommandError('The rules file must map ending ids to requirements')
+        try:
+            return override_rules(graph, requirements)
+        except KeyError as exc:
+            raise CommandError(f'Unknown ending {exc}')
+        except RuleError as exc:
+            raise CommandError(str(exc))
@@ -0,0 +1,252 @@
+"""
+Management command to generate a large synthetic story for benchmarks.
+"""
+import random
+import string
+import time
+from array import array
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from castle_adventure.models import (
+    Choice, Ending, EndingUnlock, GameMove, GameState, Item, Scene,
+)
+from castle_adventure.story_graph import bump_story_version
+
+
+STORY, DEATH, ENDING = 0, 1, 2
+
+LETTERS = string.ascii_uppercase
+
+WORDS = (
+    'castle dark torch stone corridor dragon troll wizard gate tower dungeon '
+    'shadow cold ancient door stair bones throne moat chain banner smoke '
+    'whisper rusty iron crown hall window rope cellar'
+).split()
+
+# Story content and everything with a foreign key to it; emptied by --replace.
+# ArchivedGame only keeps scene and ending ids as text, so history survives.
+REPLACED_MODELS = (GameMove, EndingUnlock, GameState, Choice, Item, Scene, Ending)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic story of any size with bulk inserts. Every scene '
+        'is reachable from scene 01 and every item gate can be satisfied.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenes', type=int, default=10000,
+                            help='Number of scenes (default: 10000)')
+        parser.add_argument('--branching', type=int, default=3,
+                            help='Most choices per scene, up to 26 (default: 3)')
+        parser.add_argument('--item-gates', type=float, default=0.05,
+                            help='Fraction of choices that require an item (default: 0.05)')
+        parser.add_argument('--death-ratio', type=float, default=0.05,
+                            help='Fraction of scenes that are deaths (default: 0.05)')
+        parser.add_argument('--ending-ratio', type=float, default=0.01,
+                            help='Fraction of scenes that are endings (default: 0.01)')
+        parser.add_argument('--endings', type=int, default=5,
+                            help='Number of Ending rows (default: 5)')
+        parser.add_argument('--description-words', type=int, default=40,
+                            help='Words in each scene description (default: 40)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert (default: 5000)')
+        parser.add_argument('--seed', type=int, help='Random seed for a repeatable story')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the existing story, all games in progress and ending '
+                                 'unlocks first (archived games are kept)')
+
+    def handle(self, *args, **options):
+        self.scene_count = options['scenes']
+        self.branching = options['branching']
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        if self.scene_count < 2:
+            raise CommandError('--scenes must be at least 2')
+        if not 1 <= self.branching <= len(LETTERS):
+            raise CommandError(f'--branching must be between 1 and {len(LETTERS)}')
+        if options['death_ratio'] + options['ending_ratio'] >= 1:
+            raise CommandError('--death-ratio and --ending-ratio must add up to less than 1')
+        if options['endings'] < 1:
+            raise CommandError('--endings must be at least 1')
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('This database does not return primary keys from bulk inserts')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options['replace']:
+                self.delete_story()
+            elif Scene.objects.exists() or Ending.objects.exists():
+                raise CommandError('Story content already exists; use --replace to delete it')
+
+            parents, kinds = self.plan_tree(options['death_ratio'], options['ending_ratio'])
+            scene_pks = self.create_scenes(kinds, options['description_words'])
+            choices, items = self.create_choices(parents, kinds, scene_pks, options['item_gates'])
+            self.create_endings(options['endings'])
+            bump_story_version()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {self.scene_count} scenes ({kinds.count(DEATH)} deaths, '
+            f'{kinds.count(ENDING)} endings), {choices} choices, {items} items and '
+            f"{options['endings']} endings in {elapsed:.1f}s"
+        ))
+
+    def delete_story(self):
+        tables = [model._meta.db_table for model in REPLACED_MODELS]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sql_flush(no_style(), tables):
+                cursor.execute(sql)
+
+    def plan_tree(self, death_ratio, ending_ratio):
+        """
+        Pick a parent and a kind for every scene.
+
+        Scene 0 is the start. Each later scene hangs off a random earlier
+        story scene that still has a free choice letter, so the tree
+        edges alone reach every scene. A scene is kept a story scene when
+        it is needed to keep some letter free.
+        """
+        parents = array('l', [-1])
+        kinds = bytearray([STORY])
+        open_scenes = [0]
+        free = array('l', [self.branching])
+        for index in range(1, self.scene_count):
+            position = self.rng.randrange(len(open_scenes))
+            parent = open_scenes[position]
+            parents.append(parent)
+            free[parent] -= 1
+            if not free[parent]:
+                open_scenes[position] = open_scenes[-1]
+                open_scenes.pop()
+
+            roll = self.rng.random()
+            kind = DEATH if roll < death_ratio else ENDING if roll < death_ratio + ending_ratio else STORY
+            if kind != STORY and not open_scenes:
+                kind = STORY
+            kinds.append(kind)
+            free.append(self.branching if kind == STORY else 0)
+            if kind == STORY:
+                open_scenes.append(index)
+
+        if ENDING not in kinds:
+            # The last scene is a leaf, so it can always become an ending
+            kinds[self.scene_count - 1] = ENDING
+        return parents, kinds
+
+    def create_scenes(self, kinds, description_words):
+        """Insert the scenes in batches and return their primary keys by index."""
+        scene_pks = array('q')
+        batch = []
+        for index, kind in enumerate(kinds):
+            batch.append(Scene(
+                scene_id=f'{index + 1:02d}',
+                title=f'{self.rng.choice(WORDS).title()} {index + 1}',
+                description=' '.join(self.rng.choices(WORDS, k=description_words)),
+                is_ending=kind != STORY,
+                is_death=kind == DEATH,
+                scene_type=('story', 'death', 'ending')[kind],
+                bit_index=index,
+            ))
+            if len(batch) >= self.batch_size:
+                scene_pks.extend(scene.pk for scene in Scene.objects.bulk_create(batch))
+                batch = []
+        scene_pks.extend(scene.pk for scene in Scene.objects.bulk_create(batch))
+        return scene_pks
+
+    def create_choices(self, parents, kinds, scene_pks, item_gates):
+        """
+        Insert the choices of every story scene, with items for gated ones.
+
+        A gated choice's item is found in the scene itself or one of its
+        tree ancestors, so it can always be picked up on the way there.
+        """
+        child_starts, children = self.children_by_parent(parents)
+        choices, items = [], []
+        choice_total = item_total = 0
+
+        for scene in range(self.scene_count):
+            if kinds[scene] != STORY:
+                continue
+            targets = list(children[child_starts[scene]:child_starts[scene + 1]])
+            wanted = self.rng.randint(1, self.branching)
+            while len(targets) < wanted:
+                target = self.rng.randrange(self.scene_count)
+                if target != scene:
+                    targets.append(target)
+
+            for position, target in enumerate(targets):
+                item = None
+                if self.rng.random() < item_gates:
+                    item = Item(
+                        item_id=f'ITEM_{item_total + 1:03d}',
+                        name=f'{self.rng.choice(WORDS).title()} token {item_total + 1}',
+                        description=' '.join(self.rng.choices(WORDS, k=8)),
+                        found_in_scene_id=scene_pks[self.ancestor(parents, scene)],
+                        bit_index=item_total,
+                    )
+                    items.append(item)
+                    item_total += 1
+                choices.append(Choice(
+                    from_scene_id=scene_pks[scene],
+                    to_scene_id=scene_pks[target],
+                    choice_text=f'Head for the {self.rng.choice(WORDS)}',
+                    choice_letter=LETTERS[position],
+                    requires_item=item,
+                    order=position,
+                ))
+            if len(choices) >= self.batch_size:
+                choice_total += self.flush(choices, items)
+                choices, items = [], []
+
+        choice_total += self.flush(choices, items)
+        return choice_total, item_total
+
+    def children_by_parent(self, parents):
+        """Tree children grouped by parent: children[starts[p]:starts[p + 1]]."""
+        starts = array('l', [0]) * (self.scene_count + 1)
+        for parent in parents[1:]:
+            starts[parent + 1] += 1
+        for index in range(self.scene_count):
+            starts[index + 1] += starts[index]
+        filled = array('l', starts)
+        children = array('l', [0]) * (self.scene_count - 1)
+        for child in range(1, self.scene_count):
+            parent = parents[child]
+            children[filled[parent]] = child
+            filled[parent] += 1
+        return starts, children
+
+    def ancestor(self, parents, scene):
+        for _ in range(self.rng.randint(0, 8)):
+            if parents[scene] < 0:
+                break
+            scene = parents[scene]
+        return scene
+
+    def flush(self, choices, items):
+        Item.objects.bulk_create(items)
+        Choice.objects.bulk_create(choices)
+        return len(choices)
+
+    def create_endings(self, count):
+        """One default ending, then endings that need more and more items."""
+        types = [value for value, label in Ending.ENDING_TYPES]
+        Ending.objects.bulk_create([
+            Ending(
+                ending_id=f'E{number}',
+                title=f'Ending {number}',
+                description=' '.join(self.rng.choices(WORDS, k=20)),
+                ending_type=types[(number - 1) % len(types)],
+                icon='🏁',
+                achievement_text=f'Reached ending {number}',
+                requirements=(
+                    {'priority': 0} if number == 1 else
+                    {'priority': number * 10, 'counters': {'items_held': f'>={number - 1}'}}
+                ),
+            )
+            for number in range(1, count + 1)
+        ])
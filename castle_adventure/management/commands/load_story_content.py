@@ -1,32 +1,56 @@
 """
 Management command to load all story content from fixtures.
 """
-from django.core.management.base import BaseCommand
-from django.core.management import call_command
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from castle_adventure.story_graph import bump_story_version
+from castle_adventure.story_import import (
+    BATCH_SIZE, CONTENT, StoryImportError, StoryImporter, find_story_files, iter_json_objects,
+)
+
+
+FIXTURE_DIR = Path(__file__).resolve().parents[2] / 'fixtures'
 
 
 class Command(BaseCommand):
-    help = 'Load all story content from fixtures'
+    help = (
+        'Load all story content from fixtures, upserting in batches by '
+        'scene_id, item_id and ending_id'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=str(FIXTURE_DIR),
+                            help='Directory with scenes, items, choices and endings '
+                                 'as .json fixtures or .jsonl (default: the shipped story)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'Rows per bulk upsert (default: {BATCH_SIZE})')
 
     def handle(self, *args, **options):
+        try:
+            paths = find_story_files(Path(options['dir']))
+        except StoryImportError as exc:
+            raise CommandError(str(exc))
+        importer = StoryImporter(options['batch_size'])
+
         self.stdout.write('Loading story content...')
         self.stdout.write('')
 
-        self.stdout.write('Loading scenes...')
-        call_command('loaddata', 'scenes', verbosity=0)
-        self.stdout.write(self.style.SUCCESS('✓ Scenes loaded'))
-
-        self.stdout.write('Loading items...')
-        call_command('loaddata', 'items', verbosity=0)
-        self.stdout.write(self.style.SUCCESS('✓ Items loaded'))
-
-        self.stdout.write('Loading choices...')
-        call_command('loaddata', 'choices', verbosity=0)
-        self.stdout.write(self.style.SUCCESS('✓ Choices loaded'))
-
-        self.stdout.write('Loading endings...')
-        call_command('loaddata', 'endings', verbosity=0)
-        self.stdout.write(self.style.SUCCESS('✓ Endings loaded'))
+        try:
+            with transaction.atomic():
+                for name in CONTENT:
+                    path = paths[name]
+                    self.stdout.write(f'Loading {name}...')
+                    with open(path, encoding='utf-8') as f:
+                        count = getattr(importer, f'import_{name}')(iter_json_objects(f))
+                    self.stdout.write(self.style.SUCCESS(f'✓ {name.capitalize()} loaded ({count})'))
+                importer.check_ending_rules()
+                bump_story_version()
+        except StoryImportError as exc:
+            raise CommandError(f'{path.name}: {exc}')
 
         self.stdout.write('')
         self.stdout.write(self.style.SUCCESS('Story content loaded successfully!'))
+
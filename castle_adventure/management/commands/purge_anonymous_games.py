@@ -0,0 +1,114 @@
+"""
+Management command to purge abandoned anonymous games and ending unlocks.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from castle_adventure.models import GameState, EndingUnlock
+
+
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete anonymous GameState and EndingUnlock rows whose session has '
+        'expired or that have not been touched for --days days'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Purge anonymous games not updated for this many days (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows examined per batch (default: 1000)')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches (default: 0.1)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the rows that would be deleted without deleting them')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['sleep']
+        self.dry_run = options['dry_run']
+        self.use_sessions = settings.SESSION_ENGINE in DB_SESSION_ENGINES
+        if not self.use_sessions:
+            self.stdout.write(self.style.WARNING(
+                'Sessions are not stored in the database; '
+                'only rows older than the cutoff will be purged.'
+            ))
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        started = time.perf_counter()
+        games = self.purge(
+            GameState.objects.filter(user__isnull=True, session_key__isnull=False),
+            'last_updated',
+            cutoff,
+        )
+        unlocks = self.purge(
+            EndingUnlock.objects.filter(user__isnull=True, session_key__isnull=False),
+            'unlocked_at',
+            # Unlocks are kept for as long as their session is alive
+            cutoff if not self.use_sessions else None,
+        )
+        elapsed = time.perf_counter() - started
+
+        verb = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {games} games and {unlocks} ending unlocks in {elapsed:.1f}s '
+            f'({(games + unlocks) / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+
+    def purge(self, queryset, timestamp_field, cutoff):
+        """
+        Walk ``queryset`` in pk order, deleting stale rows batch by batch.
+
+        A row is stale if its session no longer exists (when sessions are
+        stored in the database) or its timestamp is older than ``cutoff``.
+        Each batch is a short transaction; the walk pauses between batches.
+        """
+        removed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'session_key', timestamp_field)[:self.batch_size]
+            )
+            if not batch:
+                return removed
+            last_pk = batch[-1][0]
+
+            live_sessions = self.live_sessions({session_key for _, session_key, _ in batch})
+            stale = [
+                pk for pk, session_key, timestamp in batch
+                if (live_sessions is not None and session_key not in live_sessions) or
+                (cutoff is not None and timestamp < cutoff)
+            ]
+            if stale and not self.dry_run:
+                with transaction.atomic():
+                    queryset.model.objects.filter(pk__in=stale).delete()
+            removed += len(stale)
+
+            if len(batch) < self.batch_size:
+                return removed
+            if self.pause:
+                time.sleep(self.pause)
+
+    def live_sessions(self, session_keys):
+        """Session keys that still have an unexpired session, or None if unknown."""
+        if not self.use_sessions:
+            return None
+        from django.contrib.sessions.models import Session
+
+        return set(
+            Session.objects.filter(session_key__in=session_keys, expire_date__gt=timezone.now())
+            .values_list('session_key', flat=True)
+        )
@@ -0,0 +1,219 @@
+"""
+Per-view request metrics for Castle Adventure.
+
+MetricsMiddleware records, for each URL name, the wall time, database
+query count and time, template render time and response size of every
+request. They are kept in per-process histograms and served in the
+Prometheus text format by the ``metrics`` view when
+CASTLE_ADVENTURE_METRICS is True.
+
+Template render time is only measured when templates are rendered by
+``castle_adventure.metrics.DjangoTemplates``; use it as the ``BACKEND``
+in place of Django's own.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+UNMATCHED_VIEW = '<unmatched>'
+
+
+class Histogram:
+    """
+    A labelled histogram that threads update without locking.
+
+    Each thread counts into its own shard; shards are only summed when the
+    metrics are exported.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'series', None)
+        if shard is None:
+            shard = self._local.series = {}
+            self._shards.append(shard)
+        return shard
+
+    def observe(self, label, value):
+        shard = self._shard()
+        series = shard.get(label)
+        if series is None:
+            # One count per bucket plus +Inf, then the sum
+            series = shard[label] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self):
+        """Return {label: (cumulative bucket counts, sum)} over all threads."""
+        totals = {}
+        for shard in list(self._shards):
+            for label, series in list(shard.items()):
+                total = totals.setdefault(label, [0] * len(series))
+                for index, value in enumerate(series):
+                    total[index] += value
+        result = {}
+        for label, total in totals.items():
+            cumulative, running = [], 0
+            for count in total[:-1]:
+                running += count
+                cumulative.append(running)
+            result[label] = (cumulative, total[-1])
+        return result
+
+    def reset(self):
+        for shard in list(self._shards):
+            shard.clear()
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        bounds = [_format_number(bound) for bound in self.buckets] + ['+Inf']
+        for label, (counts, total) in sorted(self.collect().items()):
+            view = _escape(label)
+            for bound, count in zip(bounds, counts):
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {_format_number(total)}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {counts[-1]}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'castle_request_duration_seconds', 'Wall time of requests by URL name.', DURATION_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'castle_db_queries', 'Database queries per request by URL name.', QUERY_BUCKETS
+)
+DB_DURATION = Histogram(
+    'castle_db_duration_seconds', 'Database time per request by URL name.', DURATION_BUCKETS
+)
+TEMPLATE_DURATION = Histogram(
+    'castle_template_render_seconds', 'Template render time per request by URL name.',
+    DURATION_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'castle_response_size_bytes', 'Response body size by URL name.', SIZE_BUCKETS
+)
+
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, TEMPLATE_DURATION, RESPONSE_SIZE)
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetrics:
+    """Totals gathered while one request is handled."""
+
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+# Context variables follow async views into sync_to_async threads
+current_request = ContextVar('castle_adventure_request_metrics', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper adding each query to the current request's totals."""
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def install_query_timers():
+    """Time queries on this thread's open connections and on any new ones."""
+    connection_created.connect(install_query_timer, dispatch_uid='castle_adventure_metrics')
+    for connection in connections.all(initialized_only=True):
+        install_query_timer(connection)
+
+
+def record(request, response, metrics, elapsed):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else UNMATCHED_VIEW
+    REQUEST_DURATION.observe(view, elapsed)
+    DB_QUERIES.observe(view, metrics.queries)
+    DB_DURATION.observe(view, metrics.db_time)
+    TEMPLATE_DURATION.observe(view, metrics.template_time)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(view, len(response.content))
+
+
+def reset_metrics():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    """Prometheus text export; 404 unless CASTLE_ADVENTURE_METRICS is True."""
+    if not getattr(settings, 'CASTLE_ADVENTURE_METRICS', False):
+        raise Http404("Metrics are disabled")
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TimedTemplate(django_backend.Template):
+    """Template that adds its render time to the current request's totals."""
+
+    def render(self, context=None, request=None):
+        metrics = current_request.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Django's template backend with render times reported to MetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,78 @@
+"""
+Middleware for Castle Adventure.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from . import metrics
+from .stores import get_game_state_store
+
+
+class GameStateStoreMiddleware:
+    """Give the configured GameStateStore a chance to update each response."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return get_game_state_store().process_response(request, response) or response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return await get_game_state_store().aprocess_response(request, response) or response
+
+
+class MetricsMiddleware:
+    """
+    Record per-view timings and sizes for the metrics view.
+
+    Place it first in MIDDLEWARE so the timings cover the whole stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timers_installed = False
+        metrics.install_query_timers()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics.install_query_timers()
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        metrics.record(request, response, request_metrics, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.timers_installed:
+            # The ORM's thread may already have connections open
+            await sync_to_async(metrics.install_query_timers)()
+            self.timers_installed = True
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        metrics.record(request, response, request_metrics, time.perf_counter() - started)
+        return response
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+def create_story_version(apps, schema_editor):
+    StoryVersion = apps.get_model('castle_adventure', 'StoryVersion')
+    StoryVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('castle_adventure', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_story_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def _set_bit(data, index):
+    byte = index >> 3
+    if byte >= len(data):
+        data.extend(bytes(byte + 1 - len(data)))
+    data[byte] |= 1 << (index & 7)
+
+
+def _iter_bits(data):
+    for byte_index, byte in enumerate(bytes(data)):
+        for bit in range(8):
+            if byte >> bit & 1:
+                yield (byte_index << 3) + bit
+
+
+def _encode(ids, bit_indexes):
+    data = bytearray()
+    unindexed = []
+    for content_id in dict.fromkeys(ids or []):
+        if content_id in bit_indexes:
+            _set_bit(data, bit_indexes[content_id])
+        else:
+            unindexed.append(content_id)
+    return bytes(data), unindexed
+
+
+def assign_bit_indexes(model):
+    """Number rows densely in primary key order."""
+    rows = list(model.objects.order_by('pk'))
+    for index, row in enumerate(rows):
+        row.bit_index = index
+    model.objects.bulk_update(rows, ['bit_index'], batch_size=BATCH_SIZE)
+
+
+def json_to_bitsets(apps, schema_editor):
+    Scene = apps.get_model('castle_adventure', 'Scene')
+    Item = apps.get_model('castle_adventure', 'Item')
+    GameState = apps.get_model('castle_adventure', 'GameState')
+
+    assign_bit_indexes(Scene)
+    assign_bit_indexes(Item)
+    scene_bits = dict(Scene.objects.values_list('scene_id', 'bit_index'))
+    item_bits = dict(Item.objects.values_list('item_id', 'bit_index'))
+
+    batch = []
+    for state in GameState.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        state.inventory_bits, state.unindexed_inventory = _encode(state.inventory, item_bits)
+        state.visited_bits, state.unindexed_visited = _encode(state.visited_scenes, scene_bits)
+        batch.append(state)
+        if len(batch) >= BATCH_SIZE:
+            GameState.objects.bulk_update(batch, [
+                'inventory_bits', 'unindexed_inventory', 'visited_bits', 'unindexed_visited',
+            ])
+            batch = []
+    if batch:
+        GameState.objects.bulk_update(batch, [
+            'inventory_bits', 'unindexed_inventory', 'visited_bits', 'unindexed_visited',
+        ])
+
+
+def bitsets_to_json(apps, schema_editor):
+    Scene = apps.get_model('castle_adventure', 'Scene')
+    Item = apps.get_model('castle_adventure', 'Item')
+    GameState = apps.get_model('castle_adventure', 'GameState')
+
+    scenes = dict(Scene.objects.values_list('bit_index', 'scene_id'))
+    items = dict(Item.objects.values_list('bit_index', 'item_id'))
+
+    batch = []
+    for state in GameState.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        state.inventory = [
+            items[i] for i in _iter_bits(state.inventory_bits) if i in items
+        ] + list(state.unindexed_inventory)
+        state.visited_scenes = [
+            scenes[i] for i in _iter_bits(state.visited_bits) if i in scenes
+        ] + list(state.unindexed_visited)
+        batch.append(state)
+        if len(batch) >= BATCH_SIZE:
+            GameState.objects.bulk_update(batch, ['inventory', 'visited_scenes'])
+            batch = []
+    if batch:
+        GameState.objects.bulk_update(batch, ['inventory', 'visited_scenes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('castle_adventure', '0002_story_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scene',
+            name='bit_index',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='bit_index',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='gamestate',
+            name='inventory_bits',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name='gamestate',
+            name='visited_bits',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name='gamestate',
+            name='unindexed_inventory',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='gamestate',
+            name='unindexed_visited',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(json_to_bitsets, bitsets_to_json),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('castle_adventure', '0003_game_state_bitsets'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='gamestate',
+            name='inventory',
+        ),
+        migrations.RemoveField(
+            model_name='gamestate',
+            name='visited_scenes',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('castle_adventure', '0004_remove_json_inventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamestate',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
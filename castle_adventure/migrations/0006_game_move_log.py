@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('castle_adventure', '0005_game_state_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameMove',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('choice_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('item_id', models.CharField(blank=True, max_length=20, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='castle_adventure.gamestate')),
+            ],
+            options={
+                'ordering': ['game', 'sequence'],
+                'unique_together': {('game', 'sequence')},
+            },
+        ),
+    ]
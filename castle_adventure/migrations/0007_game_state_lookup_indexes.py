@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:11
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def close_duplicate_active_games(apps, schema_editor):
+    """
+    Keep one active game per user and session before adding the constraints.
+
+    Views served the lowest pk (``.first()``), so that game stays active and
+    any others are marked complete.
+    """
+    GameState = apps.get_model('castle_adventure', 'GameState')
+    active = GameState.objects.filter(is_complete=False)
+    for field in ('user', 'session_key'):
+        keep = (
+            active.exclude(**{f'{field}__isnull': True})
+            .values(field)
+            .order_by()
+            .annotate(keep_pk=Min('pk'))
+            .values('keep_pk')
+        )
+        active.exclude(**{f'{field}__isnull': True}).exclude(pk__in=keep).update(is_complete=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('castle_adventure', '0006_game_move_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_active_games, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='gamestate',
+            index=models.Index(fields=['user', 'is_complete'], name='gamestate_user_complete'),
+        ),
+        migrations.AddIndex(
+            model_name='gamestate',
+            index=models.Index(fields=['session_key', 'is_complete'], name='gamestate_session_complete'),
+        ),
+        migrations.AddConstraint(
+            model_name='gamestate',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_complete', False)), fields=('user',), name='one_active_game_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='gamestate',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_complete', False)), fields=('session_key',), name='one_active_game_per_session'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('castle_adventure', '0007_game_state_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_id', models.PositiveIntegerField(unique=True)),
+                ('session_key', models.CharField(blank=True, max_length=40, null=True)),
+                ('final_scene_id', models.CharField(max_length=10)),
+                ('ending_reached', models.CharField(blank=True, max_length=10, null=True)),
+                ('choices_made', models.IntegerField(default=0)),
+                ('deaths', models.IntegerField(default=0)),
+                ('items_collected', models.IntegerField(default=0)),
+                ('game_started', models.DateTimeField()),
+                ('game_finished', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
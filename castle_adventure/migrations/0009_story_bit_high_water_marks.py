@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('castle_adventure', '0008_archived_game'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storyversion',
+            name='next_item_bit',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='storyversion',
+            name='next_scene_bit',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -2,8 +2,15 @@
 Database models for Castle Adventure game.
 Implements story graph, game state, and progression tracking.
 """
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Max
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .bitset import has_bit, set_bit, count_bits, iter_bits, from_indexes
+from .ending_logic import RuleError, compile_rule, is_rule
+from .story_graph import STORY_VERSION_PK, get_story_graph
 
 
 class Scene(models.Model):
@@ -24,6 +31,8 @@ class Scene(models.Model):
     is_death = models.BooleanField(default=False)
     scene_type = models.CharField(max_length=20, choices=SCENE_TYPES)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Dense per-story position in GameState.visited_bits
+    bit_index = models.PositiveIntegerField(null=True, blank=True, unique=True, editable=False)
 
     class Meta:
         ordering = ['scene_id']
@@ -47,6 +56,8 @@ class Item(models.Model):
     is_consumable = models.BooleanField(default=False)
     is_trap = models.BooleanField(default=False)
     icon = models.CharField(max_length=10, default='📦')
+    # Dense per-story position in GameState.inventory_bits
+    bit_index = models.PositiveIntegerField(null=True, blank=True, unique=True, editable=False)
 
     def __str__(self):
         return f"{self.item_id}: {self.name}"
@@ -83,6 +94,37 @@ class Choice(models.Model):
         return f"[{self.choice_letter}] {self.choice_text}"
 
 
+class StoryVersion(models.Model):
+    """Single-row version stamp bumped whenever story content changes."""
+
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Next unused Scene/Item bit_index; never goes down, even when content is deleted
+    next_scene_bit = models.PositiveIntegerField(default=0)
+    next_item_bit = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Story content v{self.version}"
+
+    @classmethod
+    def allocate_bit_indexes(cls, model, count=1):
+        """
+        Reserve ``count`` new bit positions for Scene or Item; return the first.
+
+        A deleted row's bit stays set in saved games, so it is never handed
+        to new content that those games would then appear to hold or have
+        visited.
+        """
+        field = f'next_{model._meta.model_name}_bit'
+        with transaction.atomic():
+            stamp, _ = cls.objects.select_for_update().get_or_create(pk=STORY_VERSION_PK)
+            # Rows indexed before the mark existed, or with explicit indexes
+            highest = model.objects.aggregate(highest=Max('bit_index'))['highest']
+            first = max(getattr(stamp, field), 0 if highest is None else highest + 1)
+            cls.objects.filter(pk=stamp.pk).update(**{field: first + count})
+        return first
+
+
 class GameState(models.Model):
     """Tracks a player's current game progress."""
 
@@ -101,8 +143,12 @@ class GameState(models.Model):
         related_name='active_games',
         on_delete=models.CASCADE
     )
-    inventory = models.JSONField(default=list)
-    visited_scenes = models.JSONField(default=list)
+    # Bitmaps indexed by Item.bit_index / Scene.bit_index
+    inventory_bits = models.BinaryField(default=bytes)
+    visited_bits = models.BinaryField(default=bytes)
+    # Ids with no bit index in the current story (e.g. removed content)
+    unindexed_inventory = models.JSONField(default=list, blank=True)
+    unindexed_visited = models.JSONField(default=list, blank=True)
     flags = models.JSONField(default=dict)
 
     # Metadata
@@ -116,22 +162,321 @@ class GameState(models.Model):
     deaths = models.IntegerField(default=0)
     items_collected = models.IntegerField(default=0)
 
+    # Optimistic concurrency: bumped by every conditional write
+    version = models.PositiveIntegerField(default=0)
+
+    # Fields changed by moves, pickups and completion
+    PROGRESS_FIELDS = [
+        'current_scene_id', 'inventory_bits', 'visited_bits', 'unindexed_inventory',
+        'unindexed_visited', 'flags', 'last_updated', 'is_complete', 'ending_reached',
+        'choices_made', 'deaths', 'items_collected', 'version',
+    ]
+
+    # Set by write-behind stores: commits only update this instance
+    defer_writes = False
+    # GameMove records for commits not yet written to the move log
+    pending_moves = ()
+
+    class Meta:
+        constraints = [
+            # At most one active game per player; these partial unique
+            # indexes also serve the active-game lookup in every view.
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(is_complete=False),
+                name='one_active_game_per_user'
+            ),
+            models.UniqueConstraint(
+                fields=['session_key'],
+                condition=models.Q(is_complete=False),
+                name='one_active_game_per_session'
+            ),
+        ]
+        indexes = [
+            # Used on backends without partial indexes, and for completed games
+            models.Index(fields=['user', 'is_complete'], name='gamestate_user_complete'),
+            models.Index(fields=['session_key', 'is_complete'], name='gamestate_session_complete'),
+        ]
+
+    @property
+    def inventory(self):
+        """Item ids held by the player."""
+        items = get_story_graph().items_by_index
+        return [
+            items[index].item_id for index in iter_bits(self.inventory_bits) if index in items
+        ] + list(self.unindexed_inventory)
+
+    @inventory.setter
+    def inventory(self, item_ids):
+        self.inventory_bits, self.unindexed_inventory = _encode_ids(
+            item_ids, get_story_graph().item_bits
+        )
+
+    @property
+    def visited_scenes(self):
+        """Scene ids the player has visited."""
+        scenes = get_story_graph().scenes_by_index
+        return [
+            scenes[index].scene_id for index in iter_bits(self.visited_bits) if index in scenes
+        ] + list(self.unindexed_visited)
+
+    @visited_scenes.setter
+    def visited_scenes(self, scene_ids):
+        self.visited_bits, self.unindexed_visited = _encode_ids(
+            scene_ids, get_story_graph().scene_bits
+        )
+
+    @property
+    def inventory_count(self):
+        """Number of items held, ignoring bits of deleted items."""
+        return (
+            count_bits(self.inventory_bits, get_story_graph().item_mask)
+            + len(self.unindexed_inventory)
+        )
+
+    @property
+    def visited_count(self):
+        """Number of scenes visited, ignoring bits of deleted scenes."""
+        return (
+            count_bits(self.visited_bits, get_story_graph().scene_mask)
+            + len(self.unindexed_visited)
+        )
+
     def has_item(self, item_id):
         """Check if item is in inventory."""
-        return item_id in self.inventory
+        index = get_story_graph().item_bits.get(item_id)
+        if index is None:
+            return item_id in self.unindexed_inventory
+        return has_bit(self.inventory_bits, index)
 
     def add_item(self, item_id):
-        """Add item to inventory if not already present."""
-        if item_id not in self.inventory:
-            self.inventory.append(item_id)
-            self.items_collected += 1
-            self.save()
+        """
+        Add item to inventory if not already present.
+
+        Returns False if the row changed since it was read; the caller
+        should refresh and retry.
+        """
+        if self.has_item(item_id):
+            return True
+        return self._commit(**self._item_changes(item_id))
+
+    async def aadd_item(self, item_id):
+        """Async version of add_item."""
+        if self.has_item(item_id):
+            return True
+        return await self._acommit(**self._item_changes(item_id))
+
+    def _item_changes(self, item_id):
+        index = get_story_graph().item_bits.get(item_id)
+        if index is None:
+            self.unindexed_inventory.append(item_id)
+        else:
+            self.inventory_bits = set_bit(self.inventory_bits, index)
+        return {
+            'move': {'item_id': item_id},
+            'inventory_bits': self.inventory_bits,
+            'unindexed_inventory': self.unindexed_inventory,
+            'items_collected': self.items_collected + 1,
+        }
+
+    def has_visited(self, scene_id):
+        """Check if the player has visited a scene."""
+        index = get_story_graph().scene_bits.get(scene_id)
+        if index is None:
+            return scene_id in self.unindexed_visited
+        return has_bit(self.visited_bits, index)
+
+    def mark_visited(self, scene_id):
+        """Record a scene visit. Returns True if it is a first visit."""
+        if self.has_visited(scene_id):
+            return False
+        index = get_story_graph().scene_bits.get(scene_id)
+        if index is None:
+            self.unindexed_visited.append(scene_id)
+        else:
+            self.visited_bits = set_bit(self.visited_bits, index)
+        return True
+
+    def commit_move(self, choice, to_scene):
+        """
+        Commit a move along ``choice`` in a single conditional UPDATE.
+
+        The update only applies while the game is still on the choice's
+        from_scene and at the version that was read, so double-clicks and
+        parallel tabs cannot apply two moves or lose counter increments.
+        Returns False if another request changed the game first.
+        """
+        return self._commit(**self._move_changes(choice, to_scene))
+
+    async def acommit_move(self, choice, to_scene):
+        """Async version of commit_move."""
+        return await self._acommit(**self._move_changes(choice, to_scene))
+
+    def _move_changes(self, choice, to_scene):
+        changes = {
+            'current_scene_id_was': choice.from_scene_pk,
+            'move': {'choice_id': choice.id},
+            'current_scene_id': to_scene.pk,
+            'choices_made': self.choices_made + 1,
+        }
+        if self.mark_visited(to_scene.scene_id):
+            changes['visited_bits'] = self.visited_bits
+            changes['unindexed_visited'] = self.unindexed_visited
+        if to_scene.is_death:
+            changes['deaths'] = self.deaths + 1
+        return changes
+
+    def touch(self):
+        """Mark the game as saved now. Returns False on a stale read."""
+        return self._commit()
+
+    def complete(self, ending_id):
+        """Mark the game finished. Returns False on a stale read."""
+        return self._commit(is_complete=True, ending_reached=ending_id)
+
+    async def acomplete(self, ending_id):
+        """Async version of complete."""
+        return await self._acommit(is_complete=True, ending_reached=ending_id)
+
+    def commit_progress(self, version_was):
+        """
+        Write every progress field in one conditional UPDATE.
+
+        Used after several commits were applied in memory with defer_writes
+        set. Returns False if the row is no longer at ``version_was``.
+        """
+        if self.pk is None or self.defer_writes:
+            return True
+        return bool(GameState.objects.filter(pk=self.pk, version=version_was).update(
+            **{field: getattr(self, field) for field in self.PROGRESS_FIELDS}
+        ))
+
+    def _commit(self, current_scene_id_was=None, move=None, **changes):
+        """
+        Write ``changes`` only if the row is still at ``self.version``.
+
+        On success the version is incremented, the changes are applied to
+        this instance and ``move`` (if given) is queued in pending_moves
+        with the new version as its sequence number. Unsaved instances and
+        instances with defer_writes set are updated in memory only and
+        persisted by their GameStateStore.
+        """
+        changes['last_updated'] = timezone.now()
+        query = self._commit_query(current_scene_id_was)
+        if query is None:
+            # Cookie-backed or write-behind game: the store persists it.
+            if current_scene_id_was not in (None, self.current_scene_id):
+                return False
+        elif not query.update(version=models.F('version') + 1, **changes):
+            return False
+        self._apply_commit(changes, move)
+        return True
+
+    async def _acommit(self, current_scene_id_was=None, move=None, **changes):
+        """Async version of _commit."""
+        changes['last_updated'] = timezone.now()
+        query = self._commit_query(current_scene_id_was)
+        if query is None:
+            if current_scene_id_was not in (None, self.current_scene_id):
+                return False
+        elif not await query.aupdate(version=models.F('version') + 1, **changes):
+            return False
+        self._apply_commit(changes, move)
+        return True
+
+    def _commit_query(self, current_scene_id_was):
+        """The row a conditional write applies to, or None for in-memory games."""
+        if self.pk is None or self.defer_writes:
+            return None
+        conditions = {'pk': self.pk, 'version': self.version}
+        if current_scene_id_was is not None:
+            conditions['current_scene_id'] = current_scene_id_was
+        return GameState.objects.filter(**conditions)
+
+    def _apply_commit(self, changes, move):
+        for field, value in changes.items():
+            setattr(self, field, value)
+        self.version += 1
+        if move is not None:
+            self.pending_moves += (GameMove(
+                game_id=self.pk,
+                sequence=self.version,
+                created_at=changes['last_updated'],
+                **move
+            ),)
 
     def __str__(self):
         user_display = self.user.username if self.user else f"Session {self.session_key[:8]}"
         return f"{user_display} - {self.current_scene.title}"
 
 
+def _encode_ids(ids, bit_indexes):
+    """Split content ids into a bitmap of indexed ids and a list of the rest."""
+    indexes = []
+    unindexed = []
+    for content_id in dict.fromkeys(ids):
+        index = bit_indexes.get(content_id)
+        if index is None:
+            unindexed.append(content_id)
+        else:
+            indexes.append(index)
+    return from_indexes(indexes), unindexed
+
+
+class GameMove(models.Model):
+    """Append-only log of moves and pickups, one row per GameState version."""
+
+    game = models.ForeignKey(
+        GameState,
+        related_name='moves',
+        on_delete=models.CASCADE
+    )
+    sequence = models.PositiveIntegerField()
+    choice_id = models.PositiveIntegerField(null=True, blank=True)
+    item_id = models.CharField(max_length=20, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['game', 'sequence']
+        unique_together = [['game', 'sequence']]
+
+    def __str__(self):
+        action = f"choice {self.choice_id}" if self.choice_id else f"pickup {self.item_id}"
+        return f"Game {self.game_id} #{self.sequence}: {action}"
+
+
+class ArchivedGame(models.Model):
+    """
+    Compact record of a finished game, moved out of the GameState table.
+
+    Written by the archive_completed_games command so GameState only holds
+    games that are still being played.
+    """
+
+    game_id = models.PositiveIntegerField(unique=True)
+    user = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE
+    )
+    session_key = models.CharField(max_length=40, null=True, blank=True)
+    final_scene_id = models.CharField(max_length=10)
+    ending_reached = models.CharField(max_length=10, null=True, blank=True)
+
+    choices_made = models.IntegerField(default=0)
+    deaths = models.IntegerField(default=0)
+    items_collected = models.IntegerField(default=0)
+
+    game_started = models.DateTimeField()
+    game_finished = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        user_display = self.user.username if self.user else f"Session {self.session_key[:8]}"
+        return f"{user_display} - {self.ending_reached or self.final_scene_id}"
+
+
 class Ending(models.Model):
     """A possible ending to the game."""
 
@@ -152,6 +497,18 @@ class Ending(models.Model):
     is_secret = models.BooleanField(default=False)
     requirements = models.JSONField(default=dict)
 
+    def clean(self):
+        # Once one ending uses rules the story graph compiles every ending's
+        # requirements as a rule, so the other formats are no longer allowed
+        if is_rule(self.requirements) or any(
+            is_rule(requirements) for requirements in
+            Ending.objects.exclude(pk=self.pk).values_list('requirements', flat=True)
+        ):
+            try:
+                compile_rule(self.requirements)
+            except RuleError as exc:
+                raise ValidationError({'requirements': str(exc)})
+
     def __str__(self):
         return f"{self.ending_id}: {self.title}"
 
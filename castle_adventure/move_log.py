@@ -0,0 +1,135 @@
+"""
+Append-only move log for Castle Adventure.
+
+Every move and pickup committed by a GameState is recorded as a narrow
+GameMove row keyed by the game version it produced. The log supports
+replay, analytics and undo, and lets EventSourcedGameStateStore treat the
+GameState row as a periodically compacted snapshot.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .models import GameMove, GameState
+from .story_graph import get_story_graph
+
+
+logger = logging.getLogger(__name__)
+
+
+def move_log_enabled():
+    """Whether the database store should record moves."""
+    return getattr(settings, 'CASTLE_ADVENTURE_MOVE_LOG', False)
+
+
+class MoveLogBuffer:
+    """
+    Process-wide buffer that writes moves with batched inserts.
+
+    Moves are flushed with a single bulk_create once
+    CASTLE_ADVENTURE_MOVE_LOG_BATCH are pending or
+    CASTLE_ADVENTURE_MOVE_LOG_INTERVAL seconds have passed, and at exit.
+    """
+
+    def __init__(self):
+        self._moves = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self._moves)
+
+    def add(self, moves):
+        with self._lock:
+            self._moves.extend(moves)
+            due = (
+                len(self._moves) >= getattr(settings, 'CASTLE_ADVENTURE_MOVE_LOG_BATCH', 200) or
+                time.monotonic() - self._last_flush >= getattr(settings, 'CASTLE_ADVENTURE_MOVE_LOG_INTERVAL', 5)
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Insert all buffered moves. Returns the number written.
+
+        Moves of games deleted since they were buffered (new game, archiving,
+        purging) are dropped. The flush runs inside whichever request
+        happens to fill the buffer, so database errors are logged rather
+        than raised into that unrelated response.
+        """
+        with self._lock:
+            moves, self._moves = self._moves, []
+            self._last_flush = time.monotonic()
+        if not moves:
+            return 0
+        try:
+            with transaction.atomic():
+                existing = set(GameState.objects.filter(
+                    pk__in={move.game_id for move in moves}
+                ).values_list('pk', flat=True))
+                moves = [move for move in moves if move.game_id in existing]
+                GameMove.objects.bulk_create(moves, batch_size=500, ignore_conflicts=True)
+        except DatabaseError:
+            logger.exception("Could not write %d logged moves", len(moves))
+            return 0
+        return len(moves)
+
+    def clear(self):
+        with self._lock:
+            self._moves = []
+
+
+move_log_buffer = MoveLogBuffer()
+atexit.register(move_log_buffer.flush)
+
+
+def replay_moves(game_state, moves, graph=None):
+    """
+    Apply logged moves to ``game_state`` in memory.
+
+    Moves use the same rules as the views; any that no longer fit the
+    current story are skipped. The game's version ends at the last
+    sequence applied.
+    """
+    graph = graph or get_story_graph()
+    defer_writes = game_state.defer_writes
+    game_state.defer_writes = True
+    try:
+        for move in moves:
+            if move.choice_id is not None:
+                choice = graph.choices.get(move.choice_id)
+                if choice is None:
+                    continue
+                game_state.commit_move(choice, graph.scenes_by_pk[choice.to_scene_pk])
+            elif move.item_id:
+                game_state.add_item(move.item_id)
+            game_state.version = move.sequence
+    finally:
+        game_state.defer_writes = defer_writes
+        game_state.pending_moves = ()
+    return game_state
+
+
+def rebuild_game(game, upto_sequence=None):
+    """
+    Rebuild a game from the start scene by replaying its full move log.
+
+    Pass ``upto_sequence`` to see the game as it was at an earlier
+    version (e.g. to undo the last move). Returns an unsaved GameState.
+    """
+    graph = get_story_graph()
+    moves = GameMove.objects.filter(game=game)
+    if upto_sequence is not None:
+        moves = moves.filter(sequence__lte=upto_sequence)
+    game_state = GameState(
+        user_id=game.user_id,
+        session_key=game.session_key,
+        current_scene_id=graph.scenes['01'].pk,
+        game_started=game.game_started,
+    )
+    return replay_moves(game_state, moves.order_by('sequence'), graph)
@@ -0,0 +1,209 @@
+"""
+Query budgets for the game views.
+
+``measure_playthrough`` plays a scripted game through every URL in
+castle_adventure.urls (with the story fixtures loaded) and records, per
+URL name, the most SQL queries any one request made and the total query
+time. ``check_budget`` compares the result with the checked-in budget
+file and describes every view that went over, so N+1 regressions fail
+the build instead of shipping.
+
+The budget file maps URL names to ``{"queries": N}``, optionally with a
+``"time_ms"`` limit on total query time.
+"""
+import difflib
+import json
+from pathlib import Path
+
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .story_graph import get_story_graph
+
+
+BUDGET_FILE = Path(__file__).with_name('query_budget.json')
+
+FIXTURES = ('scenes', 'items', 'choices', 'endings')
+
+# (method, URL name, argument). Choices are given as (scene_id, letter);
+# api_moves takes a list of ("choice", (scene_id, letter)) or ("pickup", item_id).
+PLAYTHROUGH = (
+    ('GET', 'landing', None),
+    ('GET', 'start', None),
+    ('GET', 'scene', '01'),
+    ('POST', 'choice', ('01', 'A')),
+    ('GET', 'scene', '02'),
+    ('POST', 'choice', ('02', 'A')),
+    ('GET', 'scene', '03'),
+    ('POST', 'choice', ('03', 'B')),
+    ('GET', 'scene', '04'),
+    ('POST', 'choice', ('04', 'A')),
+    ('GET', 'scene', '05'),
+    ('POST', 'api_choice', ('05', 'A')),
+    ('GET', 'api_game', None),
+    ('GET', 'api_scene', '07'),
+    ('POST', 'api_moves', [
+        ('choice', ('07', 'A')), ('pickup', 'ITEM_003'), ('choice', ('08', 'A')),
+    ]),
+    ('GET', 'scene', '09'),
+    ('POST', 'choice', ('09', 'B')),
+    ('GET', 'scene', '12'),
+    ('POST', 'choice', ('12', 'A')),
+    ('GET', 'scene', '13'),
+    ('POST', 'pickup_item', 'ITEM_001'),
+    ('GET', 'scene', '13'),
+    ('GET', 'inventory', None),
+    ('POST', 'choice', ('13', 'A')),
+    ('POST', 'choice', ('09', 'C')),
+    ('GET', 'scene', '14'),
+    ('POST', 'api_pickup', 'ITEM_004'),
+    ('POST', 'choice', ('14', 'A')),
+    ('POST', 'save', None),
+    ('GET', 'load', None),
+    ('POST', 'choice', ('15', 'A')),
+    ('POST', 'choice', ('09', 'A')),
+    ('GET', 'scene', '10'),
+    ('POST', 'choice', ('10', 'B')),
+    ('POST', 'pickup_item', 'ITEM_005'),
+    ('POST', 'choice', ('11', 'A')),
+    ('POST', 'choice', ('17', 'A')),
+    ('POST', 'choice', ('18', 'A')),
+    ('POST', 'choice', ('19', 'A')),
+    ('POST', 'choice', ('20', 'A')),
+    ('POST', 'choice', ('21', 'A')),
+    ('GET', 'display_ending', 'E1'),
+    ('GET', 'endings_collection', None),
+    ('POST', 'new_game', None),
+    ('GET', 'metrics', None),
+)
+
+
+class PlaythroughError(Exception):
+    """Raised when a scripted step does not get a successful response."""
+
+
+def url_names():
+    """All URL names in castle_adventure.urls."""
+    from . import urls
+
+    return sorted(pattern.name for pattern in urls.urlpatterns if pattern.name)
+
+
+def choice_id(graph, scene_id, letter):
+    for choice in graph.scenes[scene_id].choices:
+        if choice.choice_letter == letter:
+            return choice.id
+    raise PlaythroughError(f"Scene {scene_id} has no choice {letter}")
+
+
+def _request(client, graph, method, name, argument):
+    data = {}
+    content_type = None
+    if name in ('choice', 'api_choice'):
+        args = [choice_id(graph, *argument)]
+    elif name == 'api_moves':
+        args = []
+        data = json.dumps({'moves': [
+            {'choice': choice_id(graph, *target)} if kind == 'choice' else {'pickup': target}
+            for kind, target in argument
+        ]})
+        content_type = 'application/json'
+    else:
+        args = [argument] if argument is not None else []
+    path = reverse(f'castle_adventure:{name}', args=args)
+    if method == 'POST':
+        if content_type:
+            return client.post(path, data, content_type=content_type)
+        return client.post(path, data)
+    return client.get(path)
+
+
+def measure_playthrough(client=None, steps=PLAYTHROUGH):
+    """
+    Play ``steps`` and return {url_name: {"requests", "queries", "time_ms"}}.
+
+    ``queries`` is the highest count for a single request. The story
+    fixtures must be loaded. The periodic story version check is turned
+    off so counts do not depend on timing.
+    """
+    client = client or Client()
+    results = {}
+    with override_settings(
+        CASTLE_ADVENTURE_STORY_VERSION_CHECK_INTERVAL=float('inf'),
+        CASTLE_ADVENTURE_METRICS=True,
+    ):
+        graph = get_story_graph()
+        for method, name, argument in steps:
+            with CaptureQueriesContext(connection) as queries:
+                response = _request(client, graph, method, name, argument)
+            if response.status_code >= 400:
+                raise PlaythroughError(
+                    f"{method} {name} {argument!r} returned {response.status_code}"
+                )
+            entry = results.setdefault(name, {'requests': 0, 'queries': 0, 'time_ms': 0.0})
+            entry['requests'] += 1
+            entry['queries'] = max(entry['queries'], len(queries))
+            entry['time_ms'] += sum(float(query['time']) for query in queries) * 1000
+    return results
+
+
+def load_budget(path=BUDGET_FILE):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def budget_from(results):
+    """A budget that the given results exactly meet."""
+    return {name: {'queries': entry['queries']} for name, entry in sorted(results.items())}
+
+
+def check_budget(results, budget):
+    """
+    Return a list of problems: views over budget, unmeasured or unbudgeted.
+
+    The list ends with a diff between the budget and what was measured.
+    """
+    problems = []
+    for name in url_names():
+        if name not in results:
+            problems.append(f"{name}: not exercised by the playthrough")
+        elif name not in budget:
+            problems.append(f"{name}: no budget ({results[name]['queries']} queries)")
+    for name, limit in sorted(budget.items()):
+        entry = results.get(name)
+        if entry is None:
+            continue
+        if entry['queries'] > limit['queries']:
+            problems.append(
+                f"{name}: {entry['queries']} queries, budget {limit['queries']} "
+                f"(+{entry['queries'] - limit['queries']})"
+            )
+        if 'time_ms' in limit and entry['time_ms'] > limit['time_ms']:
+            problems.append(
+                f"{name}: {entry['time_ms']:.1f} ms in queries, budget {limit['time_ms']} ms"
+            )
+    if problems:
+        problems.extend(difflib.unified_diff(
+            _dump(budget).splitlines(), _dump({**budget, **budget_from(results)}).splitlines(),
+            'budget', 'measured', lineterm='',
+        ))
+    return problems
+
+
+def _dump(budget):
+    return json.dumps(budget, indent=2, sort_keys=True)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin that fails when a game view exceeds its query budget."""
+
+    query_budget_file = BUDGET_FILE
+
+    def assertWithinQueryBudget(self, results=None):
+        if results is None:
+            results = measure_playthrough(self.client)
+        problems = check_budget(results, load_budget(self.query_budget_file))
+        if problems:
+            self.fail('Query budget exceeded:\n' + '\n'.join(problems))
@@ -0,0 +1,86 @@
+"""
+Signal receivers for Castle Adventure.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from .models import Scene, Choice, Item, Ending, StoryVersion
+from .story_graph import bump_story_version, invalidate_story_graph
+
+
+STORY_CONTENT_MODELS = (Scene, Choice, Item, Ending)
+
+
+def assign_bit_index(sender, instance, **kwargs):
+    """
+    Give new scenes and items a bitmap position no row has used before.
+
+    Rows reloaded from fixtures keep the index they already have so saved
+    GameState bitmaps stay valid.
+    """
+    if instance.bit_index is not None:
+        return
+    if instance.pk is not None:
+        instance.bit_index = sender.objects.filter(pk=instance.pk).values_list(
+            'bit_index', flat=True
+        ).first()
+        if instance.bit_index is not None:
+            return
+    instance.bit_index = StoryVersion.allocate_bit_indexes(sender)
+
+
+_suppressed = threading.local()
+
+
+@contextmanager
+def story_version_bumps_suppressed():
+    """
+    Don't bump the story version for each row saved or deleted inside.
+
+    For bulk changes that delete through the ORM (so cascades still run)
+    and bump the version once themselves when they finish.
+    """
+    depth = getattr(_suppressed, 'depth', 0)
+    _suppressed.depth = depth + 1
+    try:
+        yield
+    finally:
+        _suppressed.depth = depth
+
+
+def story_content_changed(sender, raw=False, **kwargs):
+    """
+    Bump the story version when content is edited.
+
+    Fixture loading (raw saves) only invalidates this process; bulk loaders
+    such as load_story_content bump the version once when they finish.
+    """
+    if raw or getattr(_suppressed, 'depth', 0):
+        invalidate_story_graph()
+    else:
+        bump_story_version()
+
+
+for model in (Scene, Item):
+    pre_save.connect(assign_bit_index, sender=model,
+                     dispatch_uid=f'castle_adventure_bit_index_{model.__name__}')
+
+for model in STORY_CONTENT_MODELS:
+    post_save.connect(story_content_changed, sender=model,
+                      dispatch_uid=f'castle_adventure_story_save_{model.__name__}')
+    post_delete.connect(story_content_changed, sender=model,
+                        dispatch_uid=f'castle_adventure_story_delete_{model.__name__}')
+
+
+def game_state_login(sender, request, user, **kwargs):
+    """Let the game state store claim an anonymous game on login."""
+    if request is None:
+        return
+    from .stores import get_game_state_store
+    get_game_state_store().on_login(request, user)
+
+
+user_logged_in.connect(game_state_login, dispatch_uid='castle_adventure_game_state_login')
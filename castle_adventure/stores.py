@@ -0,0 +1,567 @@
+"""
+Pluggable storage backends for player game state.
+
+Views never query GameState directly; they go through the store named by
+the CASTLE_ADVENTURE_GAME_STATE_STORE setting:
+
+    CASTLE_ADVENTURE_GAME_STATE_STORE = 'castle_adventure.stores.SignedCookieGameStateStore'
+
+Every store except DatabaseGameStateStore (and that one too with
+CASTLE_ADVENTURE_MOVE_LOG on) writes when the response goes out, so it
+needs castle_adventure.middleware.GameStateStoreMiddleware in MIDDLEWARE.
+The castle_adventure.E001 system check reports it missing.
+"""
+import atexit
+import base64
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import GameMove, GameState
+from .move_log import move_log_buffer, move_log_enabled, replay_moves
+from .story_graph import get_story_graph
+
+
+DEFAULT_GAME_STATE_STORE = 'castle_adventure.stores.DatabaseGameStateStore'
+
+_stores = {}
+
+
+def get_game_state_store():
+    """Return the configured store instance (one per configured class)."""
+    path = getattr(settings, 'CASTLE_ADVENTURE_GAME_STATE_STORE', DEFAULT_GAME_STATE_STORE)
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = import_string(path)()
+    return store
+
+
+class GameStateStore:
+    """
+    Interface for loading and persisting a player's active game.
+
+    Mutations themselves are GameState methods (commit_move, add_item,
+    touch, complete); a store decides where the resulting state lives.
+
+    The async hooks run the sync ones in a worker thread. Only
+    DatabaseGameStateStore has native async versions, so stores built on
+    it reset aload and aprocess_response to these defaults.
+    """
+
+    def load(self, request):
+        """Return the player's active GameState, or None."""
+        raise NotImplementedError
+
+    def create(self, request, scene):
+        """Start a new game on ``scene`` (a SceneNode) and return it."""
+        raise NotImplementedError
+
+    def delete(self, request, game_state):
+        """Discard a game."""
+        raise NotImplementedError
+
+    def save(self, request, game_state):
+        """Explicit save. Returns False if the write was stale."""
+        raise NotImplementedError
+
+    def on_login(self, request, user):
+        """Hook called after a player logs in."""
+
+    def process_response(self, request, response):
+        """
+        Hook called by GameStateStoreMiddleware for every response.
+
+        May return a response to send instead of ``response``.
+        """
+
+    async def aload(self, request):
+        """Async version of load; by default load runs in a worker thread."""
+        return await sync_to_async(self.load)(request)
+
+    async def aprocess_response(self, request, response):
+        """Async version of process_response."""
+        return await sync_to_async(self.process_response)(request, response)
+
+
+class DatabaseGameStateStore(GameStateStore):
+    """
+    Keeps every game as a GameState row.
+
+    With CASTLE_ADVENTURE_MOVE_LOG enabled, each move and pickup is also
+    appended to the GameMove log through the batched move_log_buffer.
+    """
+
+    def load(self, request):
+        games = GameState.objects.select_related('current_scene').filter(is_complete=False)
+        if request.user.is_authenticated:
+            game_state = games.filter(user=request.user).first()
+        else:
+            session_key = request.session.session_key
+            if not session_key:
+                request.session.create()
+                session_key = request.session.session_key
+            game_state = games.filter(session_key=session_key).first()
+        request._castle_db_game = game_state
+        return game_state
+
+    async def aload(self, request):
+        games = GameState.objects.select_related('current_scene').filter(is_complete=False)
+        user = await aget_user(request)
+        if user.is_authenticated:
+            game_state = await games.filter(user=user).afirst()
+        else:
+            if not request.session.session_key:
+                await sync_to_async(request.session.create)()
+            game_state = await games.filter(session_key=request.session.session_key).afirst()
+        request._castle_db_game = game_state
+        return game_state
+
+    def create(self, request, scene):
+        try:
+            with transaction.atomic():
+                game_state = GameState.objects.create(
+                    user=request.user if request.user.is_authenticated else None,
+                    session_key=(
+                        request.session.session_key
+                        if not request.user.is_authenticated else None
+                    ),
+                    current_scene_id=scene.pk
+                )
+        except IntegrityError:
+            # A parallel request (e.g. a double-clicked Start) created the
+            # player's one active game first; carry on with that one
+            game_state = self.load(request)
+            if game_state is None:
+                raise
+            return game_state
+        request._castle_db_game = game_state
+        return game_state
+
+    def delete(self, request, game_state):
+        game_state.delete()
+        request._castle_db_game = None
+
+    def save(self, request, game_state):
+        return game_state.touch()
+
+    def process_response(self, request, response):
+        game_state = getattr(request, '_castle_db_game', None)
+        if game_state is not None:
+            self.log_moves(game_state)
+
+    async def aprocess_response(self, request, response):
+        game_state = getattr(request, '_castle_db_game', None)
+        if game_state is not None and game_state.pending_moves:
+            await sync_to_async(self.log_moves)(game_state)
+
+    def log_moves(self, game_state):
+        """Hand a game's pending moves to the move log, if it is enabled."""
+        moves, game_state.pending_moves = game_state.pending_moves, ()
+        if moves and game_state.pk is not None and move_log_enabled():
+            move_log_buffer.add(moves)
+
+
+class SignedCookieGameStateStore(DatabaseGameStateStore):
+    """
+    Keeps anonymous games in a signed, compressed cookie.
+
+    Anonymous play needs no session and no database writes. The game moves
+    to a GameState row when the player saves explicitly or logs in, or if
+    it outgrows the cookie. Authenticated players always use the database.
+    """
+
+    salt = 'castle_adventure.stores.SignedCookieGameStateStore'
+    # Stay under the 4096-byte per-cookie limit of most browsers
+    max_cookie_size = 3800
+
+    aload = GameStateStore.aload
+    aprocess_response = GameStateStore.aprocess_response
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'CASTLE_ADVENTURE_GAME_COOKIE_NAME', 'castle_game')
+
+    @property
+    def cookie_max_age(self):
+        return getattr(settings, 'CASTLE_ADVENTURE_GAME_COOKIE_AGE', 60 * 60 * 24 * 30)
+
+    def load(self, request):
+        if request.user.is_authenticated:
+            return super().load(request)
+        game_state = self.decode(request.COOKIES.get(self.cookie_name))
+        if game_state is not None:
+            self._track(request, game_state, game_state.version)
+            return game_state
+        if not request.session.session_key:
+            return None
+        # Explicitly saved anonymous games live in the database
+        return super().load(request)
+
+    def create(self, request, scene):
+        if request.user.is_authenticated:
+            return super().create(request, scene)
+        now = timezone.now()
+        game_state = GameState(
+            current_scene_id=scene.pk,
+            game_started=now,
+            last_updated=now,
+        )
+        self._track(request, game_state, None)
+        return game_state
+
+    def delete(self, request, game_state):
+        if game_state.pk is not None:
+            super().delete(request, game_state)
+        request._castle_cookie_delete = True
+        request._castle_cookie_game = None
+
+    def save(self, request, game_state):
+        if game_state.pk is not None:
+            return super().save(request, game_state)
+        self.persist(request, game_state)
+        return True
+
+    def persist(self, request, game_state):
+        """Move an in-memory anonymous game into the database."""
+        if not request.session.session_key:
+            request.session.create()
+        game_state.session_key = request.session.session_key
+        try:
+            with transaction.atomic():
+                game_state.save()
+        except IntegrityError:
+            # A parallel save already moved this session's game to the
+            # database; that row is loaded once the cookie is gone
+            game_state.pk = None
+        request._castle_cookie_delete = True
+        request._castle_cookie_game = None
+
+    def on_login(self, request, user):
+        game_state = self.decode(request.COOKIES.get(self.cookie_name))
+        if game_state is None:
+            return
+        if not GameState.objects.filter(user=user, is_complete=False).exists():
+            game_state.user = user
+            try:
+                with transaction.atomic():
+                    game_state.save()
+            except IntegrityError:
+                # The account got an active game in the meantime; it wins
+                pass
+        request._castle_cookie_delete = True
+
+    def process_response(self, request, response):
+        super().process_response(request, response)
+        game_state = getattr(request, '_castle_cookie_game', None)
+        if game_state is not None and game_state.pk is None and not game_state.is_complete:
+            if game_state.version == request._castle_cookie_version:
+                return
+            value = self.encode(game_state)
+            if len(value) <= self.max_cookie_size:
+                response.set_cookie(
+                    self.cookie_name,
+                    value,
+                    max_age=self.cookie_max_age,
+                    secure=settings.SESSION_COOKIE_SECURE,
+                    httponly=True,
+                    samesite='Lax',
+                )
+                return
+            self.persist(request, game_state)
+        if game_state is not None or getattr(request, '_castle_cookie_delete', False):
+            response.delete_cookie(self.cookie_name, samesite='Lax')
+
+    def _track(self, request, game_state, version):
+        """Remember the cookie game and the version it was read at."""
+        request._castle_cookie_game = game_state
+        request._castle_cookie_version = version
+
+    def encode(self, game_state):
+        """Serialize a game into a signed cookie value."""
+        scene = get_story_graph().scenes_by_pk[game_state.current_scene_id]
+        payload = {
+            's': scene.scene_id,
+            'c': game_state.choices_made,
+            'd': game_state.deaths,
+            'n': game_state.items_collected,
+            'r': game_state.version,
+            'g': int(game_state.game_started.timestamp()),
+            'u': int(game_state.last_updated.timestamp()),
+        }
+        if game_state.inventory_bits:
+            payload['i'] = _b64encode(game_state.inventory_bits)
+        if game_state.visited_bits:
+            payload['v'] = _b64encode(game_state.visited_bits)
+        if game_state.unindexed_inventory:
+            payload['ui'] = game_state.unindexed_inventory
+        if game_state.unindexed_visited:
+            payload['uv'] = game_state.unindexed_visited
+        if game_state.flags:
+            payload['f'] = game_state.flags
+        return signing.dumps(payload, salt=self.salt, compress=True)
+
+    def decode(self, value):
+        """Rebuild an unsaved GameState from a cookie value, or None."""
+        if not value:
+            return None
+        try:
+            payload = signing.loads(value, salt=self.salt, max_age=self.cookie_max_age)
+            scene = get_story_graph().scenes.get(payload['s'])
+            if scene is None:
+                return None
+            return GameState(
+                current_scene_id=scene.pk,
+                inventory_bits=base64.urlsafe_b64decode(payload.get('i', '')),
+                visited_bits=base64.urlsafe_b64decode(payload.get('v', '')),
+                unindexed_inventory=payload.get('ui', []),
+                unindexed_visited=payload.get('uv', []),
+                flags=payload.get('f', {}),
+                choices_made=payload['c'],
+                deaths=payload['d'],
+                items_collected=payload['n'],
+                version=payload['r'],
+                game_started=_from_timestamp(payload['g']),
+                last_updated=_from_timestamp(payload['u']),
+            )
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+
+
+class CachedGameStateStore(DatabaseGameStateStore):
+    """
+    Keeps hot games in Django's cache and writes them back in batches.
+
+    Moves and pickups only update the cache. Each process remembers which
+    games it dirtied and flushes them with bulk_update once
+    CASTLE_ADVENTURE_WRITE_BEHIND_BATCH games are pending or
+    CASTLE_ADVENTURE_WRITE_BEHIND_INTERVAL seconds have passed, on an
+    explicit save, when a game completes, and at interpreter exit.
+
+    Use a shared cache (Redis, Memcached) in production and size it so hot
+    games are not evicted before they are flushed. Concurrent writes to
+    the same game are last-writer-wins inside the cache.
+    """
+
+    key_prefix = 'castle_adventure:game'
+    flush_fields = [
+        'current_scene', 'inventory_bits', 'visited_bits', 'unindexed_inventory',
+        'unindexed_visited', 'flags', 'last_updated', 'is_complete', 'ending_reached',
+        'choices_made', 'deaths', 'items_collected', 'version',
+    ]
+
+    aload = GameStateStore.aload
+    aprocess_response = GameStateStore.aprocess_response
+
+    def __init__(self):
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'CASTLE_ADVENTURE_GAME_STATE_CACHE', 'default')]
+
+    @property
+    def cache_timeout(self):
+        return getattr(settings, 'CASTLE_ADVENTURE_GAME_STATE_CACHE_TIMEOUT', 60 * 60)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'CASTLE_ADVENTURE_WRITE_BEHIND_INTERVAL', 5)
+
+    @property
+    def flush_batch_size(self):
+        return getattr(settings, 'CASTLE_ADVENTURE_WRITE_BEHIND_BATCH', 100)
+
+    def cache_key(self, request):
+        """Cache key of the requesting player's active game."""
+        if request.user.is_authenticated:
+            return f'{self.key_prefix}:user:{request.user.pk}'
+        if not request.session.session_key:
+            request.session.create()
+        return f'{self.key_prefix}:session:{request.session.session_key}'
+
+    def load(self, request):
+        key = self.cache_key(request)
+        values = self.cache.get(key)
+        if values is not None:
+            game_state = self.from_cache(values)
+        else:
+            game_state = super().load(request)
+            if game_state is None:
+                return None
+            game_state.defer_writes = True
+            self.cache.set(key, self.to_cache(game_state), self.cache_timeout)
+        request._castle_cached_game = (key, game_state, game_state.version)
+        return game_state
+
+    def create(self, request, scene):
+        game_state = super().create(request, scene)
+        game_state.defer_writes = True
+        key = self.cache_key(request)
+        self.cache.set(key, self.to_cache(game_state), self.cache_timeout)
+        request._castle_cached_game = (key, game_state, game_state.version)
+        return game_state
+
+    def delete(self, request, game_state):
+        with self._lock:
+            self._dirty.pop(game_state.pk, None)
+        self.cache.delete(self.cache_key(request))
+        request._castle_cached_game = None
+        super().delete(request, game_state)
+
+    def save(self, request, game_state):
+        game_state.touch()
+        key = self.cache_key(request)
+        self.write(key, game_state)
+        self.flush()
+        request._castle_cached_game = (key, game_state, game_state.version)
+        return True
+
+    def process_response(self, request, response):
+        tracked = getattr(request, '_castle_cached_game', None)
+        if tracked is None:
+            return
+        key, game_state, version_read = tracked
+        self.log_moves(game_state)
+        if game_state.version != version_read:
+            self.write(key, game_state)
+        if game_state.is_complete:
+            self.flush()
+            self.cache.delete(key)
+        elif (len(self._dirty) >= self.flush_batch_size or
+              time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def write(self, key, game_state):
+        """Store a changed game in the cache and mark it for flushing."""
+        self.cache.set(key, self.to_cache(game_state), self.cache_timeout)
+        with self._lock:
+            self._dirty[game_state.pk] = key
+
+    def flush(self):
+        """Write every game this process dirtied back to the database."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._last_flush = time.monotonic()
+        if not dirty:
+            return 0
+        cached = self.cache.get_many(list(dirty.values()))
+        games = [self.from_cache(values) for values in cached.values()]
+        GameState.objects.bulk_update(games, self.flush_fields, batch_size=500)
+        return len(games)
+
+    def to_cache(self, game_state):
+        """Plain field values of a game, safe to pickle into the cache."""
+        values = {}
+        for field in GameState._meta.concrete_fields:
+            value = getattr(game_state, field.attname)
+            if isinstance(value, (bytearray, memoryview)):
+                value = bytes(value)
+            values[field.attname] = value
+        return values
+
+    def from_cache(self, values):
+        """Rebuild a write-behind GameState from cached field values."""
+        game_state = GameState.from_db('default', list(values), list(values.values()))
+        game_state.defer_writes = True
+        return game_state
+
+
+class EventSourcedGameStateStore(DatabaseGameStateStore):
+    """
+    Treats the GameMove log as the source of truth for database games.
+
+    Moves and pickups only append narrow GameMove rows; the wide GameState
+    row becomes a snapshot that is rewritten once
+    CASTLE_ADVENTURE_SNAPSHOT_INTERVAL moves have accumulated past it, on
+    an explicit save and when the game completes. Loading replays the
+    moves logged after the snapshot.
+
+    The (game, sequence) unique constraint stands in for the optimistic
+    version check: if a parallel request appended the same sequence
+    number first, the move is rejected with 409 Conflict.
+    """
+
+    snapshot_fields = GameState.PROGRESS_FIELDS
+
+    aload = GameStateStore.aload
+    aprocess_response = GameStateStore.aprocess_response
+
+    @property
+    def snapshot_interval(self):
+        return getattr(settings, 'CASTLE_ADVENTURE_SNAPSHOT_INTERVAL', 20)
+
+    def load(self, request):
+        game_state = super().load(request)
+        if game_state is None:
+            return None
+        snapshot_version = game_state.version
+        replay_moves(game_state, game_state.moves.filter(sequence__gt=snapshot_version))
+        self._track(request, game_state, snapshot_version)
+        return game_state
+
+    def create(self, request, scene):
+        game_state = super().create(request, scene)
+        self._track(request, game_state, game_state.version)
+        return game_state
+
+    def save(self, request, game_state):
+        game_state.touch()
+        self.snapshot(game_state)
+        request._castle_snapshot_version = game_state.version
+        return True
+
+    def process_response(self, request, response):
+        game_state = getattr(request, '_castle_db_game', None)
+        if game_state is None:
+            return
+        moves, game_state.pending_moves = game_state.pending_moves, ()
+        if moves:
+            try:
+                with transaction.atomic():
+                    GameMove.objects.bulk_create(moves)
+            except IntegrityError:
+                from .views import CONFLICT_MESSAGE
+
+                return HttpResponse(CONFLICT_MESSAGE, status=409)
+        if (game_state.is_complete or
+                game_state.version - request._castle_snapshot_version >= self.snapshot_interval):
+            self.snapshot(game_state)
+
+    def snapshot(self, game_state):
+        """Compact the logged moves into the GameState row."""
+        GameState.objects.filter(pk=game_state.pk, version__lt=game_state.version).update(
+            **{field: getattr(game_state, field) for field in self.snapshot_fields}
+        )
+
+    def _track(self, request, game_state, snapshot_version):
+        game_state.defer_writes = True
+        request._castle_snapshot_version = snapshot_version
+
+
+async def aget_user(request):
+    """Resolve ``request.user`` from async code."""
+    if hasattr(request, 'auser'):
+        return await request.auser()
+    # Loading the lazy user reads the session and user tables
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(bytes(data)).decode('ascii')
+
+
+def _from_timestamp(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
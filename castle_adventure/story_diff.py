@@ -0,0 +1,234 @@
+"""
+Content-hash diff of a story bundle against the database.
+
+Every scene, item, choice and ending is hashed on the fields an upsert
+would write, with foreign keys replaced by natural ids, both in the
+bundle and in the database. Rows whose hash differs are upserted with
+StoryImporter, rows missing from the bundle are deleted and everything
+else is left alone, so an edit to one scene writes one row.
+
+The diff also records which scenes' pages changed. Scene pages are
+cached and validated by scene revision (see StoryGraph.revision), so
+those are the only pages that get rendered again.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+
+from .models import Choice, Ending, EndingUnlock, GameState, Item, Scene
+from .signals import story_version_bumps_suppressed
+from .story_import import (
+    BATCH_SIZE, CONTENT, StoryImportError, StoryImporter, batched, iter_json_objects,
+)
+
+
+MODELS = {'scenes': Scene, 'items': Item, 'choices': Choice, 'endings': Ending}
+
+UNIQUE_FIELDS = {
+    'scenes': ('scene_id',),
+    'items': ('item_id',),
+    'choices': ('from_scene', 'choice_letter'),
+    'endings': ('ending_id',),
+}
+
+# The field naming the scene whose page shows a row
+SCENE_FIELDS = {'scenes': 'scene_id', 'items': 'found_in_scene', 'choices': 'from_scene'}
+
+
+def content_hash(values):
+    return hashlib.md5(
+        json.dumps(values, sort_keys=True, default=str, ensure_ascii=False).encode()
+    ).digest()
+
+
+@dataclass
+class ContentDiff:
+    """Natural keys of one model's rows to insert, update and delete."""
+
+    inserted: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def changed(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+
+class StoryDiff:
+    """
+    Compare story files with the database and apply the difference.
+
+    ``paths`` maps each name in CONTENT to its file. Call ``compare`` to
+    fill in ``diffs`` and ``scenes_changed``, then ``apply`` inside a
+    transaction to write them.
+    """
+
+    def __init__(self, paths, batch_size=BATCH_SIZE):
+        self.paths = paths
+        self.importer = StoryImporter(batch_size)
+        self.diffs = {}
+        self.scenes_changed = set()
+        # Natural ids of scenes and items by fixture pk and by database pk
+        self.bundle_ids = {Scene: {}, Item: {}}
+        self.db_ids = {Scene: {}, Item: {}}
+        self._deleted_pks = {}
+        self._fields = {}
+
+    @property
+    def changed(self):
+        return any(diff.changed for diff in self.diffs.values())
+
+    def compare(self):
+        """Hash both sides and return {name: ContentDiff}."""
+        for name in CONTENT:
+            bundle = self.hash_bundle(name)
+            database = self.hash_database(name)
+            diff = ContentDiff()
+            for key, (digest, scene_id) in bundle.items():
+                current = database.pop(key, None)
+                if current is None:
+                    diff.inserted.append(key)
+                    self.scenes_changed.add(scene_id)
+                elif current[0] != digest:
+                    diff.updated.append(key)
+                    self.scenes_changed.update((scene_id, current[1]))
+                else:
+                    diff.unchanged += 1
+            for key, (digest, scene_id, pk) in database.items():
+                diff.deleted.append(key)
+                self.scenes_changed.add(scene_id)
+            for keys in (diff.inserted, diff.updated, diff.deleted):
+                keys.sort()
+            self._deleted_pks[name] = [database[key][2] for key in diff.deleted]
+            self.diffs[name] = diff
+        self.scenes_changed.discard(None)
+        return self.diffs
+
+    def hash_bundle(self, name):
+        """{natural key: (hash, scene_id)} for one story file."""
+        model = MODELS[name]
+        hashes = {}
+        with open(self.paths[name], encoding='utf-8') as f:
+            for record in iter_json_objects(f):
+                row = self.bundle_row(name, record)
+                key = self.key(name, row)
+                if key in hashes:
+                    raise StoryImportError(f"Duplicate {model.__name__} {key!r}")
+                hashes[key] = (self.hash_row(name, row), row.get(SCENE_FIELDS.get(name)))
+                if model in self.bundle_ids and 'pk' in record:
+                    self.bundle_ids[model][record['pk']] = key
+        return hashes
+
+    def hash_database(self, name):
+        """{natural key: (hash, scene_id, pk)} for one table."""
+        model = MODELS[name]
+        fields = self.fields(name)
+        hashes = {}
+        rows = model.objects.values('pk', *(field.attname for field in fields))
+        for values in rows.iterator(chunk_size=self.importer.batch_size):
+            row = {
+                field.name: (
+                    self.db_ids[field.related_model].get(values[field.attname])
+                    if field.many_to_one else values[field.attname]
+                )
+                for field in fields
+            }
+            key = self.key(name, row)
+            hashes[key] = (self.hash_row(name, row), row.get(SCENE_FIELDS.get(name)), values['pk'])
+            if model in self.db_ids:
+                self.db_ids[model][values['pk']] = key
+        return hashes
+
+    def fields(self, name):
+        """The unique fields and the fields an upsert writes."""
+        if name not in self._fields:
+            model = MODELS[name]
+            names = [*UNIQUE_FIELDS[name], *self.importer.update_fields(model, UNIQUE_FIELDS[name])]
+            self._fields[name] = [model._meta.get_field(field_name) for field_name in names]
+        return self._fields[name]
+
+    def bundle_row(self, name, record):
+        """Field values of a fixture record, with foreign keys as natural ids."""
+        model = MODELS[name]
+        values = record.get('fields')
+        if record.get('model', model._meta.label_lower) != model._meta.label_lower \
+                or not isinstance(values, dict):
+            raise StoryImportError(
+                f"Expected a {model._meta.label_lower} fixture record, got {record!r}"
+            )
+        row = {}
+        for field in self.fields(name):
+            value = values[field.name] if field.name in values else field.get_default()
+            if field.many_to_one:
+                if value is not None:
+                    try:
+                        value = self.bundle_ids[field.related_model][value]
+                    except KeyError:
+                        raise StoryImportError(
+                            f"{model.__name__}.{field.name} refers to unknown "
+                            f"{field.related_model.__name__} {value!r}"
+                        ) from None
+            else:
+                value = self.importer.to_python(field, value)
+            row[field.name] = value
+        return row
+
+    def key(self, name, row):
+        unique_fields = UNIQUE_FIELDS[name]
+        if len(unique_fields) == 1:
+            return row[unique_fields[0]]
+        return tuple(row[field_name] for field_name in unique_fields)
+
+    def hash_row(self, name, row):
+        return content_hash([row[field.name] for field in self.fields(name)])
+
+    def progress_lost(self):
+        """Games on deleted scenes and unlocks of deleted endings: (games, unlocks)."""
+        games = sum(
+            GameState.objects.filter(current_scene__in=batch).count()
+            for batch in batched(self._deleted_pks['scenes'], self.importer.batch_size)
+        )
+        unlocks = sum(
+            EndingUnlock.objects.filter(ending__in=batch).count()
+            for batch in batched(self._deleted_pks['endings'], self.importer.batch_size)
+        )
+        return games, unlocks
+
+    def apply(self):
+        """
+        Upsert inserted and updated rows, then delete removed ones.
+
+        Run inside a transaction after ``compare``, then bump the story
+        version. Deleting a scene deletes the games on it and deleting an
+        ending its unlocks, so check ``progress_lost`` first.
+        """
+        for name in CONTENT:
+            model = MODELS[name]
+            wanted = {*self.diffs[name].inserted, *self.diffs[name].updated}
+            if wanted:
+                with open(self.paths[name], encoding='utf-8') as f:
+                    records = (
+                        record for record in iter_json_objects(f)
+                        if self.key(name, self.bundle_row(name, record)) in wanted
+                    )
+                    getattr(self.importer, f'import_{name}')(records)
+            if model in self.bundle_ids:
+                self.map_unchanged(model)
+
+        # Choices first, so removed scenes and items are no longer referenced.
+        # The caller bumps the story version once, not once per deleted row.
+        with story_version_bumps_suppressed():
+            for name in ('choices', 'items', 'scenes', 'endings'):
+                for batch in batched(self._deleted_pks[name], self.importer.batch_size):
+                    MODELS[name].objects.filter(pk__in=batch).delete()
+        self.importer.check_ending_rules()
+
+    def map_unchanged(self, model):
+        """Point the importer's fixture pks of untouched rows at their database pks."""
+        pk_map = self.importer.scene_pks if model is Scene else self.importer.item_pks
+        db_pks = {key: pk for pk, key in self.db_ids[model].items()}
+        for fixture_pk, key in self.bundle_ids[model].items():
+            if fixture_pk not in pk_map:
+                pk_map[fixture_pk] = db_pks[key]
+
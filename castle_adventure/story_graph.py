@@ -0,0 +1,364 @@
+"""
+In-memory story graph for Castle Adventure.
+
+Story content (scenes, choices, items, endings) almost never changes, so it
+is compiled once per process into immutable nodes and served from memory.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .bitset import from_indexes
+from .ending_logic import compile_ending_rules
+
+
+@dataclass(frozen=True)
+class SceneNode:
+    """Immutable snapshot of a Scene row."""
+
+    pk: int
+    scene_id: str
+    title: str
+    description: str
+    ascii_art: str
+    scene_type: str
+    is_ending: bool
+    is_death: bool
+    bit_index: int = None
+    choices: tuple = ()
+    items: tuple = ()
+
+
+@dataclass(frozen=True)
+class ChoiceNode:
+    """Immutable snapshot of a Choice row."""
+
+    id: int
+    from_scene_pk: int
+    to_scene_pk: int
+    from_scene_id: str
+    to_scene_id: str
+    choice_text: str
+    choice_letter: str
+    requires_item_id: str = None
+    order: int = 0
+    is_locked: bool = False
+
+
+@dataclass(frozen=True)
+class ItemNode:
+    """Immutable snapshot of an Item row."""
+
+    pk: int
+    item_id: str
+    name: str
+    description: str
+    found_in_scene_pk: int
+    found_in_scene_id: str
+    is_critical: bool
+    is_consumable: bool
+    is_trap: bool
+    icon: str
+    bit_index: int = None
+
+
+@dataclass(frozen=True)
+class EndingNode:
+    """Immutable snapshot of an Ending row."""
+
+    pk: int
+    ending_id: str
+    title: str
+    description: str
+    ending_type: str
+    icon: str
+    achievement_text: str
+    is_secret: bool
+    requirements: MappingProxyType
+
+
+class LRUCache:
+    """Small thread-safe least-recently-used cache with a bounded size."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class StoryGraph:
+    """
+    Read-only lookup tables for all story content.
+
+    ``fragments`` caches rendered scene bodies keyed by scene revision. A
+    rebuilt graph is handed the previous graph's cache, so only scenes
+    whose content changed are rendered again.
+    """
+
+    def __init__(self, scenes, choices, items, endings, version=0, fragments=None):
+        self.version = version
+        if fragments is None:
+            fragments = LRUCache(
+                getattr(settings, 'CASTLE_ADVENTURE_SCENE_FRAGMENT_CACHE_SIZE', 1024)
+            )
+        self.fragments = fragments
+        self._revisions = {}
+        self.scenes = MappingProxyType({s.scene_id: s for s in scenes})
+        self.scenes_by_pk = MappingProxyType({s.pk: s for s in scenes})
+        self.choices = MappingProxyType({c.id: c for c in choices})
+        self.items = MappingProxyType({i.item_id: i for i in items})
+        self.endings = MappingProxyType({e.ending_id: e for e in endings})
+        # A bad rule saved past validation must not take every game view down
+        self.ending_rules = compile_ending_rules(endings, skip_invalid=True)
+        # Dense bit positions used by GameState bitmaps
+        self.scene_bits = MappingProxyType(
+            {s.scene_id: s.bit_index for s in scenes if s.bit_index is not None}
+        )
+        self.scenes_by_index = MappingProxyType(
+            {s.bit_index: s for s in scenes if s.bit_index is not None}
+        )
+        self.item_bits = MappingProxyType(
+            {i.item_id: i.bit_index for i in items if i.bit_index is not None}
+        )
+        self.items_by_index = MappingProxyType(
+            {i.bit_index: i for i in items if i.bit_index is not None}
+        )
+        # Bits of content that still exists, to ignore those of deleted rows
+        self.scene_mask = int.from_bytes(from_indexes(self.scene_bits.values()), 'little')
+        self.item_mask = int.from_bytes(from_indexes(self.item_bits.values()), 'little')
+
+    def revision(self, scene):
+        """
+        Content hash of ``scene`` with its choices and items.
+
+        It only changes when something shown on the scene's page changes,
+        so it can stand in for the story version in caches and ETags.
+        """
+        revision = self._revisions.get(scene.pk)
+        if revision is None:
+            revision = hashlib.md5(repr(scene).encode()).hexdigest()
+            self._revisions[scene.pk] = revision
+        return revision
+
+    @classmethod
+    def build(cls, version=0, fragments=None):
+        """Load all story content from the database (four queries)."""
+        from .models import Scene, Choice, Item, Ending
+
+        scene_rows = list(Scene.objects.order_by('scene_id').values(
+            'pk', 'scene_id', 'title', 'description', 'ascii_art',
+            'scene_type', 'is_ending', 'is_death', 'bit_index',
+        ))
+        scene_ids = {row['pk']: row['scene_id'] for row in scene_rows}
+
+        items = [
+            ItemNode(
+                pk=row['id'],
+                item_id=row['item_id'],
+                name=row['name'],
+                description=row['description'],
+                found_in_scene_pk=row['found_in_scene_id'],
+                found_in_scene_id=scene_ids[row['found_in_scene_id']],
+                is_critical=row['is_critical'],
+                is_consumable=row['is_consumable'],
+                is_trap=row['is_trap'],
+                icon=row['icon'],
+                bit_index=row['bit_index'],
+            )
+            for row in Item.objects.order_by('pk').values()
+        ]
+        item_ids = {item.pk: item.item_id for item in items}
+
+        choices = [
+            ChoiceNode(
+                id=row['id'],
+                from_scene_pk=row['from_scene_id'],
+                to_scene_pk=row['to_scene_id'],
+                from_scene_id=scene_ids[row['from_scene_id']],
+                to_scene_id=scene_ids[row['to_scene_id']],
+                choice_text=row['choice_text'],
+                choice_letter=row['choice_letter'],
+                requires_item_id=item_ids.get(row['requires_item_id']),
+                order=row['order'],
+            )
+            for row in Choice.objects.order_by('order', 'pk').values()
+        ]
+
+        endings = [
+            EndingNode(
+                pk=row['id'],
+                ending_id=row['ending_id'],
+                title=row['title'],
+                description=row['description'],
+                ending_type=row['ending_type'],
+                icon=row['icon'],
+                achievement_text=row['achievement_text'],
+                is_secret=row['is_secret'],
+                requirements=MappingProxyType(row['requirements'] or {}),
+            )
+            for row in Ending.objects.order_by('ending_id').values()
+        ]
+
+        choices_by_scene = {}
+        for choice in choices:
+            choices_by_scene.setdefault(choice.from_scene_pk, []).append(choice)
+        items_by_scene = {}
+        for item in items:
+            items_by_scene.setdefault(item.found_in_scene_pk, []).append(item)
+
+        scenes = [
+            SceneNode(
+                choices=tuple(choices_by_scene.get(row['pk'], ())),
+                items=tuple(items_by_scene.get(row['pk'], ())),
+                **row,
+            )
+            for row in scene_rows
+        ]
+        return cls(scenes, choices, items, endings, version=version, fragments=fragments)
+
+
+STORY_VERSION_PK = 1
+
+_graph = None
+_generation = 0
+_stale = False
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def get_check_interval():
+    """Seconds between story version checks in each process."""
+    return getattr(settings, 'CASTLE_ADVENTURE_STORY_VERSION_CHECK_INTERVAL', 5)
+
+
+def get_story_version():
+    """Return the current story content version stamp."""
+    from .models import StoryVersion
+
+    version = StoryVersion.objects.filter(pk=STORY_VERSION_PK).values_list(
+        'version', flat=True
+    ).first()
+    return version or 0
+
+
+def bump_story_version():
+    """Increment the story content version so every process rebuilds."""
+    from .models import StoryVersion
+
+    updated = StoryVersion.objects.filter(pk=STORY_VERSION_PK).update(
+        version=F('version') + 1,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        StoryVersion.objects.get_or_create(pk=STORY_VERSION_PK)
+    invalidate_story_graph()
+
+
+def get_story_graph():
+    """
+    Return the process-wide story graph.
+
+    The first call builds the graph. Afterwards the story version is checked
+    at most once per interval; when it has moved on, one thread rebuilds
+    while the others keep serving the previous graph.
+    """
+    graph = _graph
+    if graph is None:
+        with _lock:
+            if _graph is None:
+                _rebuild()
+            return _graph
+    if _stale or time.monotonic() - _last_check >= get_check_interval():
+        # The event loop must not block on queries; aget_story_graph refreshes
+        if not _in_event_loop() and _lock.acquire(blocking=False):
+            try:
+                _refresh()
+            finally:
+                _lock.release()
+        return _graph
+    return graph
+
+
+async def aget_story_graph():
+    """
+    Async version of get_story_graph.
+
+    Returns the cached graph without leaving the event loop unless it has
+    to be built or its version is due to be checked.
+    """
+    graph = _graph
+    if graph is not None and not _stale and time.monotonic() - _last_check < get_check_interval():
+        return graph
+    return await sync_to_async(get_story_graph)()
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _refresh():
+    """Rebuild the graph if it is stale. Caller must hold the lock."""
+    global _last_check
+    if not _stale:
+        _last_check = time.monotonic()
+        if get_story_version() == _graph.version:
+            return
+    _rebuild()
+
+
+def _rebuild():
+    """Build and publish a new graph. Caller must hold the lock."""
+    global _graph, _stale, _last_check
+    generation = _generation
+    version = get_story_version()
+    # Fragments are keyed by scene revision, so unchanged scenes keep theirs
+    _graph = StoryGraph.build(
+        version=version, fragments=_graph.fragments if _graph is not None else None
+    )
+    _last_check = time.monotonic()
+    # If content changed locally while we were reading it, keep serving
+    # this copy but rebuild again on the next request.
+    _stale = generation != _generation
+
+
+def invalidate_story_graph(**kwargs):
+    """Mark the cached story graph stale (usable as a signal receiver)."""
+    global _generation, _stale
+    _generation += 1
+    _stale = True
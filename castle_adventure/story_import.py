@@ -0,0 +1,226 @@
+"""
+Streaming bulk import of story content.
+
+Reads Django fixture files (a JSON array) or JSON Lines, one object at a
+time, and upserts them in batches keyed by the natural ids (scene_id,
+item_id, ending_id, and from_scene plus choice_letter). Fixture primary
+keys are only used to resolve foreign keys between the files; rows keep
+the primary key and bit_index they already have in the database.
+
+Signals are not sent, so callers bump the story version once when done.
+"""
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .ending_logic import RuleError, compile_ending_rules, compile_rule, is_rule
+from .models import Choice, Ending, Item, Scene, StoryVersion
+
+
+# Story files, in the order they are imported so foreign keys resolve
+CONTENT = ('scenes', 'items', 'choices', 'endings')
+
+READ_SIZE = 64 * 1024
+
+BATCH_SIZE = 500
+
+
+class StoryImportError(ValueError):
+    """Raised for story files that cannot be imported."""
+
+
+def find_story_files(directory):
+    """Return {name: path} for CONTENT in ``directory``, preferring .jsonl."""
+    paths = {}
+    for name in CONTENT:
+        for suffix in ('.jsonl', '.json'):
+            path = directory / f'{name}{suffix}'
+            if path.exists():
+                paths[name] = path
+                break
+        else:
+            raise StoryImportError(f'No {name}.json or {name}.jsonl in {directory}')
+    return paths
+
+
+def iter_json_objects(fp, read_size=READ_SIZE):
+    """
+    Yield the objects of a JSON array or JSON Lines file one at a time.
+
+    Only as much of the file as the object being decoded is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        # Skip whitespace, the array brackets and separators between objects
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = fp.read(read_size), 0
+            eof = not buffer
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as exc:
+            if eof:
+                raise StoryImportError(f"Invalid JSON: {exc}") from None
+            chunk = fp.read(read_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if not isinstance(obj, dict):
+            raise StoryImportError(f"Expected an object, got {obj!r}")
+        yield obj
+        position = end
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class StoryImporter:
+    """
+    Upsert scenes, items, choices and endings in batches.
+
+    Import scenes before items and items before choices; the fixture pk
+    maps built along the way resolve the later files' foreign keys.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.scene_pks = {}
+        self.item_pks = {}
+        self._fields = {}
+
+    def import_scenes(self, records):
+        return self.upsert(Scene, records, ('scene_id',), self.scene_pks)
+
+    def import_items(self, records):
+        return self.upsert(Item, records, ('item_id',), self.item_pks)
+
+    def import_choices(self, records):
+        return self.upsert(Choice, records, ('from_scene', 'choice_letter'))
+
+    def import_endings(self, records):
+        return self.upsert(Ending, records, ('ending_id',))
+
+    def upsert(self, model, records, unique_fields, pk_map=None):
+        """Upsert ``records`` of ``model`` and return how many were written."""
+        count = 0
+        for batch in batched(records, self.batch_size):
+            objects = [self.build(model, record) for record in batch]
+            if hasattr(model, 'bit_index'):
+                self.assign_bit_indexes(model, objects, unique_fields[0])
+            model.objects.bulk_create(
+                objects,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=self.update_fields(model, unique_fields),
+            )
+            if pk_map is not None:
+                self.map_pks(model, batch, objects, unique_fields[0], pk_map)
+            count += len(objects)
+        return count
+
+    def build(self, model, record):
+        """An unsaved instance from one fixture record, with foreign keys mapped."""
+        label = record.get('model', model._meta.label_lower)
+        if label != model._meta.label_lower or not isinstance(record.get('fields'), dict):
+            raise StoryImportError(
+                f"Expected a {model._meta.label_lower} fixture record, got {record!r}"
+            )
+        fields = self.fields_of(model)
+        values = {}
+        for name, value in record['fields'].items():
+            field = fields.get(name)
+            if field is None:
+                raise StoryImportError(f"{model.__name__} has no field '{name}'")
+            if field.many_to_one:
+                values[field.attname] = self.resolve(field, value)
+            elif name != 'bit_index':
+                values[name] = self.to_python(field, value)
+        obj = model(**values)
+        if model is Ending and is_rule(obj.requirements):
+            try:
+                compile_rule(obj.requirements)
+            except RuleError as exc:
+                raise StoryImportError(f"Ending {obj.ending_id}: {exc}") from None
+        return obj
+
+    def check_ending_rules(self):
+        """
+        Fail unless the endings now in the database compile together.
+
+        Call once every ending is written: an import that mixes rules with
+        the older requirement format would leave endings unreachable.
+        """
+        try:
+            compile_ending_rules(Ending.objects.only('ending_id', 'requirements'))
+        except RuleError as exc:
+            raise StoryImportError(str(exc)) from None
+
+    def fields_of(self, model):
+        if model not in self._fields:
+            self._fields[model] = {field.name: field for field in model._meta.concrete_fields}
+        return self._fields[model]
+
+    def resolve(self, field, value):
+        if value is None:
+            return None
+        pk_map = self.scene_pks if field.related_model is Scene else self.item_pks
+        try:
+            return pk_map[value]
+        except KeyError:
+            raise StoryImportError(
+                f"{field.model.__name__}.{field.name} refers to unknown "
+                f"{field.related_model.__name__} {value!r}"
+            ) from None
+
+    def to_python(self, field, value):
+        if isinstance(field, models.JSONField) or value is None:
+            return value
+        value = field.to_python(value)
+        if isinstance(field, models.DateTimeField) and value is not None:
+            if settings.USE_TZ and timezone.is_naive(value):
+                value = timezone.make_aware(value)
+        return value
+
+    def update_fields(self, model, unique_fields):
+        """Fields an upsert overwrites: content, but never bit_index or creation time."""
+        return [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key and field.name not in unique_fields
+            and field.name != 'bit_index' and not getattr(field, 'auto_now_add', False)
+        ]
+
+    def assign_bit_indexes(self, model, objects, natural_key):
+        """Keep existing rows' bit_index and reserve new positions for new rows."""
+        existing = dict(model.objects.filter(
+            **{f'{natural_key}__in': [getattr(obj, natural_key) for obj in objects]}
+        ).values_list(natural_key, 'bit_index'))
+        for obj in objects:
+            obj.bit_index = existing.get(getattr(obj, natural_key))
+        new = [obj for obj in objects if obj.bit_index is None]
+        if new:
+            first = StoryVersion.allocate_bit_indexes(model, len(new))
+            for offset, obj in enumerate(new):
+                obj.bit_index = first + offset
+
+    def map_pks(self, model, batch, objects, natural_key, pk_map):
+        """Record the database pk of each fixture pk in ``batch``."""
+        db_pks = dict(model.objects.filter(
+            **{f'{natural_key}__in': [getattr(obj, natural_key) for obj in objects]}
+        ).values_list(natural_key, 'pk'))
+        for record, obj in zip(batch, objects):
+            if 'pk' in record:
+                pk_map[record['pk']] = db_pks[getattr(obj, natural_key)]
+
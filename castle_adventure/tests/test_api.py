@@ -0,0 +1,222 @@
+"""
+Tests for the JSON game API.
+"""
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth.models import User
+from castle_adventure.models import Scene, Choice, Item, GameState
+
+
+class GameApiTestCase(TestCase):
+    """Tests for the game state, move and pickup endpoints."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+        self.game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+
+    def test_game_state_payload(self):
+        """Test that the current scene and player state are returned."""
+        response = self.client.get(reverse('castle_adventure:api_game'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['scene']['scene_id'], '01')
+        self.assertEqual(data['scene']['choices'][0]['requires_item'], 'key')
+        self.assertEqual(data['state']['locked_choices'], [self.choice1.id])
+        self.assertEqual(data['state']['items_here'], ['key'])
+        self.assertEqual(data['state']['inventory'], [])
+
+    def test_pickup_returns_updated_state(self):
+        """Test that a pickup answers with the new state in one response."""
+        response = self.client.post(reverse('castle_adventure:api_pickup', args=['key']))
+
+        self.assertEqual(response.status_code, 200)
+        state = response.json()['state']
+        self.assertEqual(state['inventory'], ['key'])
+        self.assertEqual(state['locked_choices'], [])
+        self.assertEqual(state['items_here'], [])
+
+    def test_move_returns_next_scene(self):
+        """Test that a move answers with the next scene directly."""
+        self.client.post(reverse('castle_adventure:api_pickup', args=['key']))
+        response = self.client.post(reverse('castle_adventure:api_choice', args=[self.choice1.id]))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['scene']['title'], 'Hall')
+        self.assertEqual(data['state']['choices_made'], 1)
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene2)
+
+    def test_locked_move_is_rejected(self):
+        """Test that a move without its required item is a JSON 400."""
+        response = self.client.post(reverse('castle_adventure:api_choice', args=[self.choice1.id]))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Missing required item')
+
+    def test_writes_require_post(self):
+        """Test that moves cannot be made with GET."""
+        response = self.client.get(reverse('castle_adventure:api_choice', args=[self.choice1.id]))
+        self.assertEqual(response.status_code, 405)
+
+    def test_writes_use_csrf_token_from_game_state(self):
+        """Test that API writes need the CSRF token that game/ hands out, and fail as JSON."""
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='testuser', password='testpass')
+        pickup = reverse('castle_adventure:api_pickup', args=['key'])
+
+        response = client.post(pickup)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('CSRF', response.json()['error'])
+
+        token = client.get(reverse('castle_adventure:api_game')).cookies['csrftoken'].value
+        response = client.post(pickup, HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['state']['inventory'], ['key'])
+
+        response = client.post(
+            reverse('castle_adventure:api_moves'), '{"moves": []}',
+            content_type='application/json', HTTP_X_CSRFTOKEN=token,
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_game_is_json_404(self):
+        """Test that a player without a game gets a JSON error."""
+        self.game_state.delete()
+
+        response = self.client.get(reverse('castle_adventure:api_game'))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+    def test_static_scene_revalidates(self):
+        """Test that scene text is cacheable independently of the player."""
+        url = reverse('castle_adventure:api_scene', args=['02'])
+        response = Client().get(url)
+        self.assertEqual(response.json()['title'], 'Hall')
+
+        response = Client().get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class BatchMovesApiTestCase(TestCase):
+    """Tests for submitting several moves in one request."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(scene_id='01', title='Entrance', scene_type='story')
+        self.scene2 = Scene.objects.create(scene_id='02', title='Hall', scene_type='story')
+        self.scene3 = Scene.objects.create(scene_id='03', title='Tower', scene_type='story')
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+        self.choice2 = Choice.objects.create(
+            from_scene=self.scene2,
+            to_scene=self.scene3,
+            choice_text='Climb',
+            choice_letter='A'
+        )
+        self.game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+
+    def post_moves(self, moves):
+        return self.client.post(
+            reverse('castle_adventure:api_moves'),
+            data={'moves': moves},
+            content_type='application/json'
+        )
+
+    def test_batch_applies_all_moves_with_one_write(self):
+        """Test that the whole batch is saved by a single UPDATE."""
+        from castle_adventure.story_graph import get_story_graph
+        get_story_graph()
+        moves = [{'pickup': 'key'}, {'choice': self.choice1.id}, {'choice': self.choice2.id}]
+
+        # session, user, game state lookup, then one UPDATE
+        with self.assertNumQueries(4):
+            response = self.post_moves(moves)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['scene']['scene_id'], '03')
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene3)
+        self.assertTrue(self.game_state.has_item('key'))
+        self.assertEqual(self.game_state.choices_made, 2)
+        self.assertEqual(self.game_state.version, 3)
+
+    def test_illegal_move_reports_index_and_saves_nothing(self):
+        """Test that the first illegal move is reported and the game is untouched."""
+        moves = [{'choice': self.choice1.id}, {'pickup': 'key'}]
+
+        response = self.post_moves(moves)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Missing required item', 'index': 0})
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.version, 0)
+        self.assertFalse(self.game_state.has_item('key'))
+
+    def test_later_illegal_move_rolls_back_earlier_ones(self):
+        """Test that legal moves before an illegal one are not saved."""
+        moves = [{'pickup': 'key'}, {'choice': self.choice1.id}, {'choice': self.choice1.id}]
+
+        response = self.post_moves(moves)
+
+        self.assertEqual(response.json()['index'], 2)
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene1)
+
+    def test_malformed_body_is_rejected(self):
+        """Test that a body without a moves list is a 400."""
+        self.assertEqual(self.post_moves('nope').status_code, 400)
+        self.assertEqual(self.post_moves([{'jump': 1}]).json()['index'], 0)
+
+    def test_boolean_choice_id_is_rejected(self):
+        """Test that {"choice": true} is not read as choice id 1."""
+        from types import SimpleNamespace
+        from castle_adventure.api import apply_move
+        from castle_adventure.story_graph import get_story_graph
+
+        graph = SimpleNamespace(choices={1: get_story_graph().choices[self.choice1.id]})
+
+        self.assertEqual(apply_move(self.game_state, {'choice': True}, graph), 'No such choice')
+        self.assertEqual(self.post_moves([{'choice': True}]).json()['error'], 'No such choice')
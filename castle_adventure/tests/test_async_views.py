@@ -0,0 +1,119 @@
+"""
+Tests for the async game flow views.
+"""
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+from castle_adventure.models import Scene, Choice, Item, Ending, EndingUnlock, GameState
+from castle_adventure.story_graph import get_story_graph
+
+
+urlpatterns = [
+    path('', include('castle_adventure.async_urls')),
+]
+
+
+@override_settings(ROOT_URLCONF='castle_adventure.tests.test_async_views')
+class AsyncViewsTestCase(TestCase):
+    """Tests for async_views served through async_urls."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Throne Room',
+            description='The end',
+            scene_type='ending',
+            is_ending=True
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+        Ending.objects.create(ending_id='E1', title='Heroic Rescue', requirements={})
+        self.game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.async_client.force_login(self.user)
+        get_story_graph()
+
+    async def test_display_scene(self):
+        """Test that the async scene view renders the current scene."""
+        response = await self.async_client.get(reverse('castle_adventure:scene', args=['01']))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Dark entrance')
+        self.assertContains(response, 'Locked - requires item')
+
+    async def test_pickup_and_move(self):
+        """Test that pickups and moves commit through the async ORM."""
+        response = await self.async_client.post(
+            reverse('castle_adventure:pickup_item', args=['key'])
+        )
+        self.assertRedirects(
+            response, reverse('castle_adventure:scene', args=['01']), fetch_redirect_response=False
+        )
+
+        response = await self.async_client.post(
+            reverse('castle_adventure:choice', args=[self.choice1.id])
+        )
+        self.assertRedirects(
+            response, reverse('castle_adventure:scene', args=['02']), fetch_redirect_response=False
+        )
+
+        game_state = await GameState.objects.aget(pk=self.game_state.pk)
+        self.assertEqual(game_state.current_scene_id, self.scene2.pk)
+        self.assertTrue(game_state.has_item('key'))
+        self.assertEqual(game_state.version, 2)
+
+    async def test_locked_choice_rejected(self):
+        """Test that the async move applies the same rules."""
+        response = await self.async_client.post(
+            reverse('castle_adventure:choice', args=[self.choice1.id])
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_view_inventory(self):
+        """Test that the async inventory lists held items."""
+        await GameState.objects.filter(pk=self.game_state.pk).aupdate(inventory_bits=b'\x01')
+
+        response = await self.async_client.get(reverse('castle_adventure:inventory'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Rusty Key')
+
+    async def test_ending_unlocks_and_collection(self):
+        """Test that the async ending completes the game and records the unlock."""
+        await GameState.objects.filter(pk=self.game_state.pk).aupdate(current_scene=self.scene2)
+
+        response = await self.async_client.get(
+            reverse('castle_adventure:display_ending', args=['02'])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Heroic Rescue')
+        self.assertTrue(await EndingUnlock.objects.filter(user=self.user).aexists())
+        game_state = await GameState.objects.aget(pk=self.game_state.pk)
+        self.assertTrue(game_state.is_complete)
+
+        response = await self.async_client.get(reverse('castle_adventure:endings_collection'))
+        self.assertEqual(response.context['unlocked_count'], 1)
+
+    async def test_missing_game_is_404(self):
+        """Test that a player without a game gets a 404."""
+        await GameState.objects.filter(pk=self.game_state.pk).adelete()
+
+        response = await self.async_client.get(reverse('castle_adventure:scene', args=['01']))
+        self.assertEqual(response.status_code, 404)
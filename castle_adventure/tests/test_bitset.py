@@ -0,0 +1,144 @@
+"""
+Tests for bitmap inventory and visited-scene storage.
+"""
+from django.test import TestCase
+from django.contrib.auth.models import User
+from castle_adventure.bitset import has_bit, set_bit, popcount, iter_bits, from_indexes
+from castle_adventure.models import Scene, Item, GameState
+
+
+class BitsetHelpersTestCase(TestCase):
+    """Tests for the bitmap helper functions."""
+
+    def test_set_and_test_bits(self):
+        """Test setting bits grows the bitmap and reports membership."""
+        data = set_bit(b'', 0)
+        data = set_bit(data, 13)
+
+        self.assertTrue(has_bit(data, 0))
+        self.assertTrue(has_bit(data, 13))
+        self.assertFalse(has_bit(data, 1))
+        self.assertFalse(has_bit(data, 1000))
+        self.assertEqual(len(data), 2)
+
+    def test_set_bit_updates_bytearray_in_place(self):
+        """Test that a bytearray is not copied on add."""
+        data = bytearray(4)
+        self.assertIs(set_bit(data, 9), data)
+
+    def test_popcount_and_iteration(self):
+        """Test counting and listing set bits."""
+        data = from_indexes([3, 8, 64, 3])
+
+        self.assertEqual(popcount(data), 3)
+        self.assertEqual(list(iter_bits(data)), [3, 8, 64])
+        self.assertEqual(popcount(b''), 0)
+
+
+class GameStateBitsetTestCase(TestCase):
+    """Tests for GameState inventory and visited bitmaps."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.sword = Item.objects.create(
+            item_id='sword',
+            name='Sword',
+            description='Sharp',
+            found_in_scene=self.scene2
+        )
+
+    def test_bit_indexes_are_dense(self):
+        """Test that new scenes and items get consecutive bit indexes."""
+        self.assertEqual(self.scene1.bit_index, 0)
+        self.assertEqual(self.scene2.bit_index, 1)
+        self.assertEqual(self.key.bit_index, 0)
+        self.assertEqual(self.sword.bit_index, 1)
+
+    def test_bit_index_kept_on_resave(self):
+        """Test that saving a row again keeps its bit index."""
+        self.sword.bit_index = None
+        self.sword.save()
+        self.sword.refresh_from_db()
+        self.assertEqual(self.sword.bit_index, 1)
+
+    def test_add_item_sets_inventory_bit(self):
+        """Test that known items are stored in the bitmap."""
+        game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        game_state.add_item('sword')
+        game_state.refresh_from_db()
+
+        self.assertEqual(bytes(game_state.inventory_bits), b'\x02')
+        self.assertEqual(game_state.unindexed_inventory, [])
+        self.assertEqual(game_state.inventory, ['sword'])
+        self.assertEqual(game_state.inventory_count, 1)
+
+    def test_unknown_items_are_kept(self):
+        """Test that ids without a bit index are stored separately."""
+        game_state = GameState.objects.create(
+            user=self.user,
+            current_scene=self.scene1,
+            inventory=['key', 'lost_amulet']
+        )
+        game_state.refresh_from_db()
+
+        self.assertTrue(game_state.has_item('key'))
+        self.assertTrue(game_state.has_item('lost_amulet'))
+        self.assertEqual(game_state.unindexed_inventory, ['lost_amulet'])
+        self.assertEqual(game_state.inventory_count, 2)
+
+    def test_mark_visited(self):
+        """Test visited scenes are tracked in the bitmap."""
+        game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+
+        self.assertTrue(game_state.mark_visited('02'))
+        self.assertFalse(game_state.mark_visited('02'))
+        game_state.save()
+        game_state.refresh_from_db()
+
+        self.assertTrue(game_state.has_visited('02'))
+        self.assertFalse(game_state.has_visited('01'))
+        self.assertEqual(game_state.visited_scenes, ['02'])
+
+    def test_deleted_bit_index_not_reused(self):
+        """Test that new content never takes the bit of deleted content."""
+        game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        game_state.add_item('sword')
+        self.sword.delete()
+
+        shield = Item.objects.create(
+            item_id='shield', name='Shield', description='Sturdy', found_in_scene=self.scene1
+        )
+        game_state.refresh_from_db()
+
+        self.assertEqual(shield.bit_index, 2)
+        self.assertFalse(game_state.has_item('shield'))
+        self.assertEqual(game_state.inventory, [])
+        self.assertEqual(game_state.inventory_count, 0)
+
+    def test_visited_count_ignores_deleted_scenes(self):
+        """Test that visits to deleted scenes are not counted."""
+        game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        game_state.visited_scenes = ['01', '02']
+        self.assertEqual(game_state.visited_count, 2)
+
+        self.scene2.delete()
+
+        self.assertEqual(game_state.visited_count, 1)
@@ -0,0 +1,238 @@
+"""
+Tests for maintenance management commands.
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from castle_adventure.models import Scene, Choice, Ending, GameState, EndingUnlock, ArchivedGame
+
+
+class PurgeAnonymousGamesTestCase(TestCase):
+    """Tests for purge_anonymous_games."""
+
+    def setUp(self):
+        self.scene = Scene.objects.create(scene_id='01', title='Start', scene_type='story')
+        self.ending = Ending.objects.create(
+            ending_id='E1',
+            title='Escape',
+            description='You escaped',
+            requirements={}
+        )
+        session = SessionStore()
+        session.create()
+        self.live_key = session.session_key
+
+    def create_game(self, session_key, days_old=0):
+        game_state = GameState.objects.create(session_key=session_key, current_scene=self.scene)
+        GameState.objects.filter(pk=game_state.pk).update(
+            last_updated=timezone.now() - timedelta(days=days_old)
+        )
+        return game_state
+
+    def purge(self, **options):
+        out = StringIO()
+        call_command('purge_anonymous_games', sleep=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_purges_rows_of_expired_sessions(self):
+        """Test that games and unlocks without a session are deleted."""
+        live = self.create_game(self.live_key)
+        self.create_game('expired')
+        EndingUnlock.objects.create(session_key=self.live_key, ending=self.ending)
+        EndingUnlock.objects.create(session_key='expired', ending=self.ending)
+
+        output = self.purge()
+
+        self.assertEqual(list(GameState.objects.all()), [live])
+        self.assertEqual(EndingUnlock.objects.get().session_key, self.live_key)
+        self.assertIn('Deleted 1 games and 1 ending unlocks', output)
+
+    def test_purges_stale_games_of_live_sessions(self):
+        """Test that games untouched for --days days are deleted."""
+        self.create_game(self.live_key, days_old=10)
+
+        self.purge(days=7)
+
+        self.assertFalse(GameState.objects.exists())
+
+    def test_keeps_user_games(self):
+        """Test that logged-in players' rows are never purged."""
+        user = User.objects.create_user(username='testuser', password='testpass')
+        GameState.objects.create(user=user, current_scene=self.scene)
+        EndingUnlock.objects.create(user=user, ending=self.ending)
+
+        self.purge(days=0)
+
+        self.assertEqual(GameState.objects.count(), 1)
+        self.assertEqual(EndingUnlock.objects.count(), 1)
+
+    def test_batches_walk_every_row(self):
+        """Test that keyset batches cover rows beyond the first batch."""
+        for n in range(7):
+            self.create_game(f'expired-{n}')
+
+        output = self.purge(batch_size=3)
+
+        self.assertFalse(GameState.objects.exists())
+        self.assertIn('Deleted 7 games', output)
+
+    def test_dry_run_deletes_nothing(self):
+        """Test that --dry-run only counts."""
+        self.create_game('expired')
+
+        output = self.purge(dry_run=True)
+
+        self.assertEqual(GameState.objects.count(), 1)
+        self.assertIn('Would delete 1 games', output)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_cutoff_only_without_database_sessions(self):
+        """Test that only old rows are purged when sessions are not in the database."""
+        self.create_game('recent')
+        self.create_game('old', days_old=40)
+
+        self.purge()
+
+        self.assertEqual(GameState.objects.get().session_key, 'recent')
+
+
+class ArchiveCompletedGamesTestCase(TestCase):
+    """Tests for archive_completed_games."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene = Scene.objects.create(scene_id='30', title='Throne', scene_type='ending')
+
+    def archive(self, **options):
+        out = StringIO()
+        call_command('archive_completed_games', sleep=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_moves_completed_games_to_archive(self):
+        """Test that finished games leave the hot table with their stats."""
+        finished = GameState.objects.create(
+            user=self.user,
+            current_scene=self.scene,
+            is_complete=True,
+            ending_reached='E5',
+            choices_made=12,
+            deaths=2,
+            items_collected=8
+        )
+        active = GameState.objects.create(user=self.user, current_scene=self.scene)
+
+        output = self.archive()
+
+        self.assertEqual(list(GameState.objects.all()), [active])
+        archived = ArchivedGame.objects.get()
+        self.assertEqual(archived.game_id, finished.pk)
+        self.assertEqual(archived.user, self.user)
+        self.assertEqual(archived.final_scene_id, '30')
+        self.assertEqual(archived.ending_reached, 'E5')
+        self.assertEqual(
+            (archived.choices_made, archived.deaths, archived.items_collected), (12, 2, 8)
+        )
+        self.assertIn('Archived 1 completed games', output)
+
+    def test_archives_in_batches(self):
+        """Test that every completed game is archived across batches."""
+        for n in range(5):
+            GameState.objects.create(
+                session_key=f'session-{n}', current_scene=self.scene, is_complete=True
+            )
+
+        self.archive(batch_size=2)
+
+        self.assertFalse(GameState.objects.exists())
+        self.assertEqual(ArchivedGame.objects.count(), 5)
+
+    def test_min_age_keeps_recent_games(self):
+        """Test that --min-age leaves just-finished games in place."""
+        GameState.objects.create(user=self.user, current_scene=self.scene, is_complete=True)
+
+        self.archive(min_age=10)
+
+        self.assertEqual(GameState.objects.count(), 1)
+        self.assertFalse(ArchivedGame.objects.exists())
+
+
+class GenerateStoryTestCase(TestCase):
+    """Tests for generate_story."""
+
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_story', seed=5, stdout=out, **options)
+        return out.getvalue()
+
+    def test_generated_story_is_playable(self):
+        """Test that every scene is reachable and every gate's item is on the way."""
+        from castle_adventure.story_graph import get_story_graph
+
+        self.generate(scenes=300, branching=3, item_gates=0.2)
+        graph = get_story_graph()
+
+        self.assertEqual(len(graph.scenes), 300)
+        self.assertEqual(sorted(graph.scene_bits.values()), list(range(300)))
+        self.assertEqual(sorted(graph.item_bits.values()), list(range(len(graph.items))))
+        self.assertEqual(len(graph.ending_rules), 5)
+        self.assertTrue(any(scene.is_ending and not scene.is_death for scene in graph.scenes.values()))
+
+        # Walk from 01, only taking gated choices once their item has been seen
+        found, reached, changed = set(), {'01'}, True
+        while changed:
+            changed = False
+            for scene_id in list(reached):
+                scene = graph.scenes[scene_id]
+                found.update(item.item_id for item in scene.items)
+                for choice in scene.choices:
+                    if choice.requires_item_id and choice.requires_item_id not in found:
+                        continue
+                    target = graph.scenes_by_pk[choice.to_scene_pk].scene_id
+                    if target not in reached:
+                        reached.add(target)
+                        changed = True
+        self.assertEqual(len(reached), 300)
+
+    def test_refuses_to_mix_with_existing_story(self):
+        """Test that existing content is only removed with --replace."""
+        from django.core.management.base import CommandError
+
+        Scene.objects.create(scene_id='01', title='Start', scene_type='story')
+
+        with self.assertRaisesMessage(CommandError, '--replace'):
+            self.generate(scenes=10)
+
+        archived = ArchivedGame.objects.create(
+            game_id=1, session_key='s', final_scene_id='01',
+            game_started=timezone.now(), game_finished=timezone.now(),
+        )
+
+        self.generate(scenes=10, replace=True)
+        self.assertEqual(Scene.objects.count(), 10)
+        self.assertTrue(ArchivedGame.objects.filter(pk=archived.pk).exists())
+        self.assertEqual(Scene.objects.get(scene_id='01').bit_index, 0)
+        self.assertTrue(Choice.objects.filter(from_scene__scene_id='01').exists())
+
+
+class CastleLoadtestTestCase(TransactionTestCase):
+    """Tests for castle_loadtest."""
+
+    def setUp(self):
+        call_command('loaddata', 'scenes', 'items', 'choices', 'endings', verbosity=0)
+
+    def test_reports_latency_per_view(self):
+        """Test that concurrent players play games and each view gets a latency line."""
+        out = StringIO()
+        call_command('castle_loadtest', players=2, duration=1, seed=7, stdout=out)
+
+        report = out.getvalue()
+        self.assertIn('p95 ms', report)
+        for view in ('start', 'scene', 'choice'):
+            self.assertRegex(report, rf'\n{view} +[1-9]')
+        self.assertIn('from 2 players', report)
+        self.assertTrue(GameState.objects.exists())
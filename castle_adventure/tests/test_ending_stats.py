@@ -0,0 +1,153 @@
+"""
+Tests for batch ending evaluation.
+"""
+import json
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from castle_adventure.models import Scene, Item, GameState
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class EndingStatsTestCase(TestCase):
+    """Tests for evaluating ending rules over many games at once."""
+
+    fixtures = ['endings']
+
+    def setUp(self):
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Start',
+            description='Start scene',
+            scene_type='story'
+        )
+        for n in range(1, 9):
+            Item.objects.create(
+                item_id=f'ITEM_00{n}',
+                name=f'Item {n}',
+                description='An item',
+                found_in_scene=self.scene1
+            )
+        befriended = {'dragon_befriended': True, 'troll_befriended': True, 'wizard_helped': True}
+        all_items = [f'ITEM_00{n}' for n in range(1, 9)]
+        self.games = [
+            self.make_game(),
+            self.make_game(flags={'killed_npcs': True}),
+            self.make_game(flags={'npc_relations': -2}),
+            self.make_game(flags=befriended),
+            self.make_game(inventory=['ITEM_004'], flags=befriended),
+            self.make_game(inventory=['ITEM_004'], flags={**befriended, 'chaos_level': 11}),
+            self.make_game(inventory=all_items, flags={**befriended, 'sat_on_throne': True}),
+            self.make_game(inventory=['ITEM_004', 'ITEM_999'], flags=befriended,
+                           is_complete=True, ending_reached='E1'),
+        ]
+
+    def make_game(self, **kwargs):
+        user = User.objects.create_user(username=f'player{User.objects.count()}')
+        return GameState.objects.create(user=user, current_scene=self.scene1, **kwargs)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_matches_per_game_evaluation(self):
+        """Test that the vectorized result agrees with determine_ending."""
+        from castle_adventure.ending_logic import determine_ending
+        from castle_adventure.ending_stats import ending_distribution
+
+        expected = {}
+        for game in GameState.objects.all():
+            ending_id = determine_ending(game)
+            expected[ending_id] = expected.get(ending_id, 0) + 1
+
+        counts = ending_distribution(GameState.objects.all(), chunk_size=3)
+
+        self.assertEqual(dict(counts), expected)
+        self.assertEqual(counts['E3'], 2)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_non_numeric_flags_match_per_game_evaluation(self):
+        """Test that both evaluators fail comparisons on the same non-numeric flags."""
+        from castle_adventure.ending_stats import ending_distribution, override_rules
+        from castle_adventure.story_graph import get_story_graph
+
+        self.make_game(flags={'chaos_level': 'lots', 'npc_relations': 'friendly'})
+        self.make_game(flags={'chaos_level': None, 'npc_relations': None})
+        rules = override_rules(get_story_graph(), {
+            'E3': {'priority': 30, 'flags': {'chaos_level': '!=0'}},
+        })
+
+        expected = {}
+        for game in GameState.objects.all():
+            held = frozenset(game.inventory)
+            ending_id = next(
+                (rule.ending_id for rule in rules if rule.matches(game, held)),
+                rules[-1].ending_id,
+            )
+            expected[ending_id] = expected.get(ending_id, 0) + 1
+
+        counts = ending_distribution(GameState.objects.all(), rules=rules, chunk_size=3)
+
+        self.assertEqual(dict(counts), expected)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_trial_rules_redistribute_completed_games(self):
+        """Test that changed rules are compared with the recorded ending."""
+        from castle_adventure.ending_stats import ending_transitions, override_rules
+        from castle_adventure.story_graph import get_story_graph
+
+        self.assertEqual(ending_transitions(), {('E1', 'E3'): 1})
+
+        rules = override_rules(get_story_graph(), {'E3': {'priority': 30, 'flags': {'never': True}}})
+        self.assertEqual(ending_transitions(rules=rules), {('E1', 'E1'): 1})
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_command_reports_counts(self):
+        """Test that the command prints a count per ending."""
+        out = StringIO()
+        call_command('ending_distribution', stdout=out)
+
+        self.assertIn('E3  Everyone Escapes Together: 1 (14.3%)', out.getvalue())
+        self.assertIn('Evaluated 7 incomplete games', out.getvalue())
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_completed_report_mentions_archived_games(self):
+        """Test that --completed says how many archived games it left out."""
+        from django.utils import timezone
+        from castle_adventure.models import ArchivedGame
+
+        out = StringIO()
+        call_command('ending_distribution', completed=True, stdout=out)
+        self.assertNotIn('archived', out.getvalue())
+
+        ArchivedGame.objects.create(
+            game_id=999, final_scene_id='21', ending_reached='E1',
+            game_started=timezone.now(), game_finished=timezone.now(),
+        )
+        out = StringIO()
+        call_command('ending_distribution', completed=True, stdout=out)
+
+        self.assertIn('1 of 1 completed games', out.getvalue())
+        self.assertIn('1 archived games are not included', out.getvalue())
+
+    def test_command_rejects_invalid_trial_rules(self):
+        """Test that a rules file with a broken rule is reported."""
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'E2': {'counters': {'gold': '>1'}}}, f)
+            f.flush()
+            with self.assertRaisesMessage(CommandError, "unknown counter 'gold'"):
+                call_command('ending_distribution', rules=f.name, stdout=StringIO())
+
+    def test_missing_numpy_is_explained(self):
+        """Test that the command says how to install NumPy when it is absent."""
+        with mock.patch.dict(sys.modules, {'numpy': None}):
+            with self.assertRaisesMessage(CommandError, 'requires NumPy'):
+                call_command('ending_distribution', stdout=StringIO())
@@ -474,3 +474,145 @@ class EndingsIntegrationTestCase(TestCase):
         response = self.client.get(reverse('castle_adventure:endings_collection'))
 
         self.assertEqual(response.context['unlocked_count'], 1)
+
+
+class EndingRuleEngineTestCase(TestCase):
+    """Tests for endings driven by rules in Ending.requirements."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Start',
+            description='Start scene',
+            scene_type='story'
+        )
+
+    def make_state(self, **kwargs):
+        return GameState(user=self.user, current_scene=self.scene1, **kwargs)
+
+    def test_rules_tried_in_priority_order(self):
+        """Test that the highest-priority matching rule wins."""
+        from castle_adventure.ending_logic import determine_ending
+
+        Ending.objects.create(ending_id='A', title='Default', requirements={'priority': 0})
+        Ending.objects.create(ending_id='B', title='Veteran', requirements={
+            'priority': 10, 'counters': {'deaths': '>=2'}
+        })
+        Ending.objects.create(ending_id='C', title='Hoarder', requirements={
+            'priority': 20, 'items': ['gem'], 'flags': {'greedy': True}
+        })
+
+        self.assertEqual(determine_ending(self.make_state()), 'A')
+        self.assertEqual(determine_ending(self.make_state(deaths=2)), 'B')
+        self.assertEqual(determine_ending(self.make_state(
+            deaths=2, inventory=['gem'], flags={'greedy': True}
+        )), 'C')
+        self.assertEqual(determine_ending(self.make_state(inventory=['gem'])), 'A')
+
+    def test_any_and_comparisons(self):
+        """Test that 'any' needs one alternative and flags compare numerically."""
+        from castle_adventure.ending_logic import determine_ending
+
+        Ending.objects.create(ending_id='A', title='Default', requirements={'priority': 0})
+        Ending.objects.create(ending_id='B', title='Villain', requirements={
+            'priority': 5,
+            'any': [{'flags': {'karma': '<0'}}, {'flags': {'betrayed': True}}],
+        })
+
+        self.assertEqual(determine_ending(self.make_state(flags={'karma': -1})), 'B')
+        self.assertEqual(determine_ending(self.make_state(flags={'betrayed': True})), 'B')
+        self.assertEqual(determine_ending(self.make_state(flags={'karma': 0})), 'A')
+
+    def test_non_numeric_flag_fails_comparisons(self):
+        """Test that a string flag fails every comparison and a null one counts as 0."""
+        from castle_adventure.ending_logic import determine_ending
+
+        Ending.objects.create(ending_id='A', title='Default', requirements={'priority': 0})
+        Ending.objects.create(ending_id='B', title='Calm', requirements={
+            'priority': 5, 'flags': {'karma': '!=3'}
+        })
+        Ending.objects.create(ending_id='C', title='Wild', requirements={
+            'priority': 9, 'flags': {'karma': '>10'}
+        })
+
+        self.assertEqual(determine_ending(self.make_state(flags={'karma': 'lots'})), 'A')
+        self.assertEqual(determine_ending(self.make_state(flags={'karma': None})), 'B')
+        self.assertEqual(determine_ending(self.make_state(flags={'karma': 11})), 'C')
+
+    def test_lowest_priority_ending_is_default(self):
+        """Test that an unmatched game falls back to the lowest-priority ending."""
+        from castle_adventure.ending_logic import determine_ending
+
+        Ending.objects.create(ending_id='A', title='Fallback', requirements={
+            'priority': 1, 'flags': {'never': True}
+        })
+        Ending.objects.create(ending_id='B', title='Special', requirements={
+            'priority': 9, 'flags': {'never': True}
+        })
+
+        self.assertEqual(determine_ending(self.make_state()), 'A')
+
+    def test_invalid_rule_rejected(self):
+        """Test that malformed rules raise RuleError and fail model validation."""
+        from django.core.exceptions import ValidationError
+        from castle_adventure.ending_logic import RuleError, compile_rule
+
+        with self.assertRaises(RuleError):
+            compile_rule({'counters': {'gold': '>1'}})
+        with self.assertRaises(RuleError):
+            compile_rule({'flags': {'karma': '>lots'}})
+
+        ending = Ending(ending_id='X', title='Broken', requirements={'any': []})
+        with self.assertRaises(ValidationError) as cm:
+            ending.full_clean()
+        self.assertIn('requirements', cm.exception.message_dict)
+
+    def test_mixed_requirement_formats_rejected(self):
+        """Test that old-format requirements fail validation once rules are in use."""
+        from django.core.exceptions import ValidationError
+
+        Ending.objects.create(ending_id='A', title='Default', requirements={'priority': 0})
+        ending = Ending(ending_id='X', title='Old', description='', ending_type='defeat',
+                        icon='!', achievement_text='', requirements={'npc_relations': -1})
+
+        with self.assertRaises(ValidationError) as cm:
+            ending.full_clean()
+        self.assertIn('requirements', cm.exception.message_dict)
+
+    def test_invalid_saved_rule_skipped(self):
+        """Test that an invalid rule saved without validation only loses its ending."""
+        from castle_adventure.ending_logic import determine_ending
+        from castle_adventure.story_graph import get_story_graph
+
+        Ending.objects.create(ending_id='A', title='Default', requirements={'priority': 0})
+        Ending.objects.create(ending_id='X', title='Old', requirements={'npc_relations': -1})
+
+        with self.assertLogs('castle_adventure.ending_logic', 'ERROR'):
+            rules = get_story_graph().ending_rules
+        self.assertEqual([rule.ending_id for rule in rules], ['A'])
+        self.assertEqual(determine_ending(self.make_state()), 'A')
+
+    def test_fixture_rules_match_builtin_logic(self):
+        """Test that the shipped ending rules reproduce the built-in endings."""
+        from django.core.management import call_command
+        from castle_adventure.ending_logic import determine_ending, determine_legacy_ending
+        from castle_adventure.story_graph import get_story_graph
+
+        call_command('loaddata', 'endings', verbosity=0)
+        self.assertEqual(len(get_story_graph().ending_rules), 5)
+        befriended = {'dragon_befriended': True, 'troll_befriended': True, 'wizard_helped': True}
+        all_items = [f'ITEM_00{n}' for n in range(1, 9)]
+        states = [
+            self.make_state(),
+            self.make_state(flags={'killed_npcs': True}),
+            self.make_state(flags={'npc_relations': -2}),
+            self.make_state(flags=befriended),
+            self.make_state(inventory=['ITEM_004'], flags=befriended),
+            self.make_state(inventory=['ITEM_004'], flags={**befriended, 'chaos_level': 11}),
+            self.make_state(inventory=all_items, flags=befriended),
+            self.make_state(inventory=all_items, flags={**befriended, 'sat_on_throne': True}),
+        ]
+
+        for game_state in states:
+            self.assertEqual(determine_ending(game_state), determine_legacy_ending(game_state))
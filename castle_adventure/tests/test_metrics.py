@@ -0,0 +1,129 @@
+"""
+Tests for request metrics and the Prometheus export.
+"""
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, override_settings
+from django.urls import include, path, reverse
+from castle_adventure import metrics
+from castle_adventure.models import Scene, GameState
+
+
+urlpatterns = [
+    path('', include('castle_adventure.async_urls')),
+]
+
+METRICS_SETTINGS = {
+    'CASTLE_ADVENTURE_METRICS': True,
+    'MIDDLEWARE': ['castle_adventure.middleware.MetricsMiddleware'] + settings.MIDDLEWARE,
+    'TEMPLATES': [
+        {**settings.TEMPLATES[0], 'BACKEND': 'castle_adventure.metrics.DjangoTemplates'},
+    ],
+}
+
+
+class HistogramTestCase(TestCase):
+    """Tests for the per-thread histograms."""
+
+    def test_buckets_are_cumulative(self):
+        """Test that exported bucket counts include all smaller observations."""
+        histogram = metrics.Histogram('test_seconds', 'Test.', (0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe('view', value)
+
+        counts, total = histogram.collect()['view']
+
+        self.assertEqual(counts, [1, 2, 3])
+        self.assertAlmostEqual(total, 5.55)
+
+    def test_threads_are_merged(self):
+        """Test that observations from several threads are summed on export."""
+        histogram = metrics.Histogram('test_seconds', 'Test.', (1,))
+        threads = [
+            threading.Thread(target=lambda: [histogram.observe('view', 0.5) for _ in range(100)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(histogram.collect()['view'][0], [400, 400])
+
+
+@override_settings(**METRICS_SETTINGS)
+class MetricsMiddlewareTestCase(TestCase):
+    """Tests for MetricsMiddleware and the metrics view."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+        metrics.reset_metrics()
+
+    def test_request_recorded_by_url_name(self):
+        """Test that a scene request records time, queries, templates and size."""
+        response = self.client.get(reverse('castle_adventure:scene', args=['01']))
+        self.assertEqual(response.status_code, 200)
+
+        view = 'castle_adventure:scene'
+        self.assertEqual(metrics.REQUEST_DURATION.collect()[view][0][-1], 1)
+        self.assertGreater(metrics.DB_QUERIES.collect()[view][1], 0)
+        self.assertGreater(metrics.DB_DURATION.collect()[view][1], 0)
+        self.assertGreater(metrics.TEMPLATE_DURATION.collect()[view][1], 0)
+        self.assertEqual(metrics.RESPONSE_SIZE.collect()[view][1], len(response.content))
+
+    def test_prometheus_export(self):
+        """Test that the metrics view serves the Prometheus text format."""
+        self.client.get(reverse('castle_adventure:scene', args=['01']))
+
+        response = self.client.get(reverse('castle_adventure:metrics'))
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE castle_request_duration_seconds histogram', body)
+        self.assertIn(
+            'castle_request_duration_seconds_count{view="castle_adventure:scene"} 1', body
+        )
+        self.assertIn('castle_db_queries_bucket{view="castle_adventure:scene",le="+Inf"} 1', body)
+
+    @override_settings(CASTLE_ADVENTURE_METRICS=False)
+    def test_export_is_opt_in(self):
+        """Test that the metrics view is hidden unless enabled."""
+        response = self.client.get(reverse('castle_adventure:metrics'))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='castle_adventure.tests.test_metrics', **METRICS_SETTINGS)
+class AsyncMetricsMiddlewareTestCase(TestCase):
+    """Tests for MetricsMiddleware in front of the async views."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.async_client.force_login(self.user)
+        metrics.reset_metrics()
+
+    async def test_async_queries_counted(self):
+        """Test that queries run through the async ORM are attributed to the view."""
+        response = await self.async_client.get(reverse('castle_adventure:scene', args=['01']))
+        self.assertEqual(response.status_code, 200)
+
+        counts, queries = metrics.DB_QUERIES.collect()['castle_adventure:scene']
+        self.assertEqual(counts[-1], 1)
+        self.assertGreater(queries, 0)
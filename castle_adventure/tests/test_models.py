@@ -263,6 +263,25 @@ class GameStateModelTestCase(TestCase):
         self.assertIsNone(game_state2.user)
         self.assertIsNotNone(game_state2.session_key)
 
+    def test_one_active_game_per_user(self):
+        """Test that a user cannot have two incomplete games."""
+        GameState.objects.create(user=self.user, current_scene=self.scene)
+        with self.assertRaises(IntegrityError):
+            GameState.objects.create(user=self.user, current_scene=self.scene)
+
+    def test_one_active_game_per_session(self):
+        """Test that a session cannot have two incomplete games."""
+        GameState.objects.create(session_key='abc123', current_scene=self.scene)
+        with self.assertRaises(IntegrityError):
+            GameState.objects.create(session_key='abc123', current_scene=self.scene)
+
+    def test_completed_games_do_not_count_as_active(self):
+        """Test that finished games allow a new active game."""
+        GameState.objects.create(user=self.user, current_scene=self.scene, is_complete=True)
+        GameState.objects.create(user=self.user, current_scene=self.scene, is_complete=True)
+        GameState.objects.create(user=self.user, current_scene=self.scene)
+        self.assertEqual(GameState.objects.filter(user=self.user).count(), 3)
+
 
 class EndingModelTestCase(TestCase):
     """Test Ending model."""
@@ -319,3 +338,23 @@ class EndingUnlockModelTestCase(TestCase):
         EndingUnlock.objects.create(user=self.user, ending=self.ending)
         with self.assertRaises(IntegrityError):
             EndingUnlock.objects.create(user=self.user, ending=self.ending)
+
+
+class GameStateLookupBenchmarkTestCase(TestCase):
+    """Test the benchmark_game_state_lookups command."""
+
+    def test_benchmark_reports_and_cleans_up(self):
+        """Test that the benchmark times both runs and removes its rows."""
+        from io import StringIO
+        from django.core.management import call_command
+
+        Scene.objects.create(scene_id='01', title='Start', scene_type='story')
+        out = StringIO()
+        call_command('benchmark_game_state_lookups', rows=50, lookups=5, stdout=out)
+
+        self.assertIn('With indexes', out.getvalue())
+        self.assertIn('Without indexes', out.getvalue())
+        self.assertFalse(GameState.objects.exists())
+        with self.assertRaises(IntegrityError):
+            GameState.objects.create(session_key='abc123', current_scene=Scene.objects.get())
+            GameState.objects.create(session_key='abc123', current_scene=Scene.objects.get())
@@ -0,0 +1,208 @@
+"""
+Tests for the append-only move log and the event-sourced store.
+"""
+from unittest import mock
+
+from django.db import IntegrityError
+from django.http import HttpResponse
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from castle_adventure.models import Scene, Choice, Item, GameState, GameMove
+from castle_adventure.move_log import move_log_buffer, rebuild_game
+from castle_adventure.stores import get_game_state_store
+
+
+EVENT_SOURCED_STORE = 'castle_adventure.stores.EventSourcedGameStateStore'
+
+
+class MoveLogTestMixin:
+    """Shared story: 01 -(key)-> 02 -> 03."""
+
+    def setUp(self):
+        move_log_buffer.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.scene3 = Scene.objects.create(
+            scene_id='03',
+            title='Tower',
+            description='Tall tower',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+        self.choice2 = Choice.objects.create(
+            from_scene=self.scene2,
+            to_scene=self.scene3,
+            choice_text='Climb',
+            choice_letter='A'
+        )
+        self.game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+
+    def tearDown(self):
+        move_log_buffer.clear()
+
+    def play_to_tower(self):
+        self.client.post(reverse('castle_adventure:pickup_item', args=['key']))
+        self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+        return self.client.post(reverse('castle_adventure:choice', args=[self.choice2.id]))
+
+
+@override_settings(CASTLE_ADVENTURE_MOVE_LOG=True, CASTLE_ADVENTURE_MOVE_LOG_BATCH=100,
+                   CASTLE_ADVENTURE_MOVE_LOG_INTERVAL=3600)
+class MoveLogBufferTestCase(MoveLogTestMixin, TestCase):
+    """Tests for batched move logging by the database store."""
+
+    def test_moves_are_buffered_until_flush(self):
+        """Test that moves are inserted in one batch."""
+        self.play_to_tower()
+        self.assertFalse(GameMove.objects.exists())
+        self.assertEqual(len(move_log_buffer), 3)
+
+        # A savepoint around the game existence check and one insert
+        with self.assertNumQueries(4):
+            self.assertEqual(move_log_buffer.flush(), 3)
+
+        moves = list(GameMove.objects.filter(game=self.game_state))
+        self.assertEqual([move.sequence for move in moves], [1, 2, 3])
+        self.assertEqual(moves[0].item_id, 'key')
+        self.assertEqual([move.choice_id for move in moves[1:]], [self.choice1.id, self.choice2.id])
+
+    @override_settings(CASTLE_ADVENTURE_MOVE_LOG_BATCH=2)
+    def test_batch_threshold_flushes(self):
+        """Test that reaching the batch size writes the buffer."""
+        self.play_to_tower()
+        self.assertEqual(GameMove.objects.count(), 2)
+        self.assertEqual(len(move_log_buffer), 1)
+
+    def test_rebuild_game_replays_and_undoes(self):
+        """Test that the log rebuilds the game at any version."""
+        self.play_to_tower()
+        move_log_buffer.flush()
+
+        replayed = rebuild_game(self.game_state)
+        self.game_state.refresh_from_db()
+        self.assertEqual(replayed.current_scene_id, self.scene3.pk)
+        self.assertTrue(replayed.has_item('key'))
+        self.assertEqual(replayed.choices_made, self.game_state.choices_made)
+        self.assertEqual(replayed.version, self.game_state.version)
+
+        undone = rebuild_game(self.game_state, upto_sequence=2)
+        self.assertEqual(undone.current_scene_id, self.scene2.pk)
+        self.assertEqual(undone.choices_made, 1)
+        self.assertFalse(undone.has_visited('03'))
+
+    def test_moves_of_deleted_game_are_dropped(self):
+        """Test that a game deleted before the flush does not fail it."""
+        self.play_to_tower()
+        other = User.objects.create_user(username='other', password='pass')
+        other_game = GameState.objects.create(user=other, current_scene=self.scene1)
+        other_client = Client()
+        other_client.login(username='other', password='pass')
+        other_client.post(reverse('castle_adventure:pickup_item', args=['key']))
+
+        self.client.post(reverse('castle_adventure:new_game'), {'confirm_overwrite': '1'})
+
+        self.assertEqual(move_log_buffer.flush(), 1)
+        self.assertEqual(list(GameMove.objects.values_list('game', flat=True)), [other_game.pk])
+
+    def test_flush_errors_are_logged(self):
+        """Test that a failed insert is logged instead of raised."""
+        self.play_to_tower()
+
+        with mock.patch.object(GameMove.objects, 'bulk_create', side_effect=IntegrityError), \
+                self.assertLogs('castle_adventure.move_log', 'ERROR'):
+            self.assertEqual(move_log_buffer.flush(), 0)
+        self.assertEqual(len(move_log_buffer), 0)
+
+    @override_settings(CASTLE_ADVENTURE_MOVE_LOG=False)
+    def test_disabled_logs_nothing(self):
+        """Test that nothing is logged when the move log is off."""
+        self.play_to_tower()
+        self.assertEqual(len(move_log_buffer), 0)
+
+
+@override_settings(CASTLE_ADVENTURE_GAME_STATE_STORE=EVENT_SOURCED_STORE,
+                   CASTLE_ADVENTURE_SNAPSHOT_INTERVAL=20)
+class EventSourcedStoreTestCase(MoveLogTestMixin, TestCase):
+    """Tests for games stored as a snapshot plus a move log."""
+
+    def test_moves_append_without_rewriting_snapshot(self):
+        """Test that moves insert GameMove rows and leave GameState alone."""
+        response = self.play_to_tower()
+        self.assertRedirects(response, reverse('castle_adventure:scene', args=['03']))
+
+        self.assertEqual(GameMove.objects.filter(game=self.game_state).count(), 3)
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.version, 0)
+        self.assertEqual(self.game_state.current_scene, self.scene1)
+
+    def test_load_replays_moves_after_snapshot(self):
+        """Test that the next request sees the replayed state."""
+        self.play_to_tower()
+
+        response = self.client.get(reverse('castle_adventure:scene', args=['03']))
+        self.assertEqual(response.status_code, 200)
+        game_state = response.context['game_state']
+        self.assertTrue(game_state.has_item('key'))
+        self.assertEqual(game_state.choices_made, 2)
+        self.assertEqual(game_state.version, 3)
+
+    @override_settings(CASTLE_ADVENTURE_SNAPSHOT_INTERVAL=2)
+    def test_snapshot_after_interval(self):
+        """Test that the snapshot is compacted every few moves."""
+        self.play_to_tower()
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.version, 2)
+        self.assertEqual(self.game_state.current_scene, self.scene2)
+
+        response = self.client.get(reverse('castle_adventure:scene', args=['03']))
+        self.assertEqual(response.context['game_state'].version, 3)
+
+    def test_save_writes_snapshot(self):
+        """Test that an explicit save compacts the log."""
+        self.play_to_tower()
+        self.client.post(reverse('castle_adventure:save'))
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene3)
+        self.assertEqual(self.game_state.version, 4)
+
+    def test_conflicting_sequence_is_rejected(self):
+        """Test that a move logged by a parallel request causes a 409."""
+        request = RequestFactory().get('/')
+        request.user = self.user
+        store = get_game_state_store()
+        game_state = store.load(request)
+        # Another request logs its pickup first
+        GameMove.objects.create(game=self.game_state, sequence=1, item_id='key')
+
+        game_state.add_item('key')
+        response = store.process_response(request, HttpResponse())
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(GameMove.objects.filter(game=self.game_state).count(), 1)
@@ -0,0 +1,96 @@
+"""
+Tests for the view query budgets.
+"""
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, Client
+from castle_adventure.query_budget import (
+    FIXTURES, QueryBudgetMixin, budget_from, check_budget, load_budget, measure_playthrough,
+)
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Play the scripted game and hold every view to its query budget."""
+
+    def setUp(self):
+        call_command('loaddata', *FIXTURES, verbosity=0)
+        self.client = Client()
+        self.user = User.objects.create_user(username='testplayer', password='testpass')
+        self.client.login(username='testplayer', password='testpass')
+
+    def test_views_within_budget(self):
+        """Test that no game view makes more queries than its budget."""
+        self.assertWithinQueryBudget()
+
+    def test_regression_reported_with_diff(self):
+        """Test that a view over budget is named and shown in a diff."""
+        results = measure_playthrough(self.client)
+        budget = budget_from(results)
+        budget['scene'] = {'queries': results['scene']['queries'] - 1}
+
+        problems = check_budget(results, budget)
+
+        self.assertIn(
+            f"scene: {results['scene']['queries']} queries, "
+            f"budget {budget['scene']['queries']} (+1)",
+            problems,
+        )
+        self.assertIn('--- budget', problems)
+        self.assertIn(f"+    \"queries\": {results['scene']['queries']}", problems)
+
+    def test_every_url_is_budgeted(self):
+        """Test that views missing from the playthrough or budget are reported."""
+        results = measure_playthrough(self.client)
+        del results['inventory']
+        budget = load_budget()
+        del budget['load']
+
+        problems = check_budget(results, budget)
+
+        self.assertIn('inventory: not exercised by the playthrough', problems)
+        self.assertIn('load: no budget (3 queries)', problems)
+
+
+class CheckQueryBudgetCommandTestCase(TestCase):
+    """Tests for the check_query_budget management command."""
+
+    def test_passes_and_leaves_no_data(self):
+        """Test that the command passes on this tree and rolls back its game."""
+        User.objects.create_user(username='query-budget-player')
+        out = StringIO()
+        call_command('check_query_budget', use_current_database=True, stdout=out)
+
+        self.assertIn('within budget', out.getvalue())
+        self.assertEqual(list(User.objects.values_list('username', flat=True)),
+                         ['query-budget-player'])
+
+    def test_uses_test_database_by_default(self):
+        """Test that the command creates and destroys a test database around its run."""
+        from unittest import mock
+        from django.db import connection
+
+        name = connection.settings_dict['NAME']
+        creation = connection.creation
+        with mock.patch.object(creation, 'create_test_db') as create, \
+                mock.patch.object(creation, 'destroy_test_db') as destroy:
+            call_command('check_query_budget', interactive=False, stdout=StringIO())
+
+        create.assert_called_once_with(verbosity=0, autoclobber=True, serialize=False)
+        destroy.assert_called_once_with(name, verbosity=0)
+
+    def test_fails_over_budget(self):
+        """Test that the command fails when a budget is too tight."""
+        import json
+        import tempfile
+
+        budget = load_budget()
+        budget['display_ending']['queries'] = 1
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump(budget, f)
+            f.flush()
+            with self.assertRaisesMessage(CommandError, 'display_ending'):
+                call_command('check_query_budget', budget=f.name, use_current_database=True,
+                             stdout=StringIO())
@@ -339,3 +339,90 @@ class SaveLoadIntegrationTestCase(TestCase):
 
         game_state = GameState.objects.get(user=self.user)
         self.assertEqual(game_state.current_scene, self.scene2)
+
+
+class OptimisticConcurrencyTestCase(TestCase):
+    """Tests for the GameState version column."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Enter hall',
+            choice_letter='A'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.game_state = GameState.objects.create(
+            user=self.user,
+            current_scene=self.scene1
+        )
+
+    def test_writes_increment_version(self):
+        """Test that each conditional write bumps the version."""
+        self.assertEqual(self.game_state.version, 0)
+        self.game_state.add_item('key')
+        self.assertTrue(self.game_state.touch())
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.version, 2)
+
+    def test_stale_add_item_is_rejected(self):
+        """Test that a pickup based on an outdated read does not apply."""
+        stale = GameState.objects.get(pk=self.game_state.pk)
+        self.assertTrue(self.game_state.touch())
+
+        self.assertFalse(stale.add_item('key'))
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.items_collected, 0)
+
+    def test_pickup_retries_after_concurrent_write(self):
+        """Test that pickup_item re-reads and succeeds after a stale write."""
+        from unittest import mock
+        self.client.login(username='testuser', password='testpass')
+        original = GameState.add_item
+        calls = []
+
+        def racing_add_item(game_state, item_id):
+            if not calls:
+                GameState.objects.filter(pk=game_state.pk).update(version=5)
+            calls.append(item_id)
+            return original(game_state, item_id)
+
+        with mock.patch.object(GameState, 'add_item', racing_add_item):
+            response = self.client.post(reverse('castle_adventure:pickup_item', args=['key']))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(calls), 2)
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.items_collected, 1)
+        self.assertEqual(self.game_state.version, 6)
+
+    def test_persistently_stale_write_returns_conflict(self):
+        """Test that a move losing every version check gets 409."""
+        from unittest import mock
+        self.client.login(username='testuser', password='testpass')
+
+        with mock.patch.object(GameState, 'commit_move', return_value=False):
+            response = self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+
+        self.assertEqual(response.status_code, 409)
@@ -0,0 +1,288 @@
+"""
+Tests for pluggable game state stores.
+"""
+from django.conf import settings
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.models import Session
+from castle_adventure.models import Scene, Choice, Item, GameState
+from castle_adventure.stores import get_game_state_store, DatabaseGameStateStore
+from castle_adventure.story_graph import get_story_graph
+
+
+COOKIE_STORE = 'castle_adventure.stores.SignedCookieGameStateStore'
+
+
+class StoreSelectionTestCase(TestCase):
+    """Tests for choosing the store from settings."""
+
+    def test_database_store_is_default(self):
+        """Test that games live in the database unless configured."""
+        self.assertIsInstance(get_game_state_store(), DatabaseGameStateStore)
+
+    @override_settings(CASTLE_ADVENTURE_GAME_STATE_STORE=COOKIE_STORE)
+    def test_store_from_settings(self):
+        """Test that the store class comes from settings."""
+        self.assertEqual(type(get_game_state_store()).__name__, 'SignedCookieGameStateStore')
+
+
+class DatabaseGameStateStoreTestCase(TestCase):
+    """Tests for the default database store."""
+
+    def test_parallel_create_returns_existing_game(self):
+        """Test that a double-clicked Start reuses the game the first click created."""
+        user = User.objects.create_user(username='testuser', password='testpass')
+        scene = Scene.objects.create(scene_id='01', title='Entrance', scene_type='story')
+        existing = GameState.objects.create(user=user, current_scene=scene)
+        request = RequestFactory().get('/')
+        request.user = user
+
+        game_state = DatabaseGameStateStore().create(request, get_story_graph().scenes['01'])
+
+        self.assertEqual(game_state.pk, existing.pk)
+        self.assertEqual(GameState.objects.count(), 1)
+
+
+@override_settings(CASTLE_ADVENTURE_GAME_STATE_STORE=COOKIE_STORE)
+class SignedCookieStoreTestCase(TestCase):
+    """Tests for anonymous games kept in a signed cookie."""
+
+    def setUp(self):
+        self.client = Client()
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+
+    def play_to_hall(self):
+        self.client.get(reverse('castle_adventure:start'))
+        self.client.post(reverse('castle_adventure:pickup_item', args=['key']))
+        return self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+
+    def test_anonymous_play_writes_nothing_to_database(self):
+        """Test that anonymous games create no GameState or session rows."""
+        response = self.play_to_hall()
+
+        self.assertRedirects(response, reverse('castle_adventure:scene', args=['02']))
+        self.assertFalse(GameState.objects.exists())
+        self.assertFalse(Session.objects.exists())
+        self.assertIn('castle_game', self.client.cookies)
+
+    def test_cookie_game_state_round_trips(self):
+        """Test that inventory and counters survive between requests."""
+        self.play_to_hall()
+
+        response = self.client.get(reverse('castle_adventure:scene', args=['02']))
+        game_state = response.context['game_state']
+        self.assertTrue(game_state.has_item('key'))
+        self.assertTrue(game_state.has_visited('02'))
+        self.assertEqual(game_state.choices_made, 1)
+        self.assertEqual(game_state.items_collected, 1)
+
+    def test_tampered_cookie_is_ignored(self):
+        """Test that a cookie with a bad signature does not load."""
+        self.client.get(reverse('castle_adventure:start'))
+        self.client.cookies['castle_game'] = self.client.cookies['castle_game'].value + 'x'
+
+        response = self.client.get(reverse('castle_adventure:scene', args=['01']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_explicit_save_moves_game_to_database(self):
+        """Test that saving stores the game as a session-keyed row."""
+        self.play_to_hall()
+
+        response = self.client.post(reverse('castle_adventure:save'))
+
+        self.assertRedirects(response, reverse('castle_adventure:scene', args=['02']))
+        game_state = GameState.objects.get()
+        self.assertIsNotNone(game_state.session_key)
+        self.assertEqual(game_state.current_scene, self.scene2)
+        self.assertTrue(game_state.has_item('key'))
+        self.assertEqual(self.client.cookies['castle_game'].value, '')
+
+        response = self.client.get(reverse('castle_adventure:scene', args=['02']))
+        self.assertEqual(response.status_code, 200)
+
+    def test_double_save_keeps_first_game(self):
+        """Test that saving the same cookie game twice does not hit the one-game constraint."""
+        self.play_to_hall()
+        cookie = self.client.cookies['castle_game'].value
+        self.client.post(reverse('castle_adventure:save'))
+
+        # A second click sent before the first response cleared the cookie
+        self.client.cookies['castle_game'] = cookie
+        response = self.client.post(reverse('castle_adventure:save'))
+
+        self.assertRedirects(response, reverse('castle_adventure:scene', args=['02']))
+        self.assertEqual(GameState.objects.count(), 1)
+
+    def test_login_moves_game_to_user(self):
+        """Test that logging in claims the anonymous game."""
+        user = User.objects.create_user(username='testuser', password='testpass')
+        self.play_to_hall()
+
+        request = RequestFactory().get('/')
+        request.COOKIES = {'castle_game': self.client.cookies['castle_game'].value}
+        user_logged_in.send(sender=User, request=request, user=user)
+
+        game_state = GameState.objects.get(user=user)
+        self.assertEqual(game_state.current_scene, self.scene2)
+        self.assertEqual(game_state.choices_made, 1)
+        self.assertTrue(request._castle_cookie_delete)
+
+    def test_new_game_clears_cookie(self):
+        """Test that abandoning a cookie game starts over."""
+        self.play_to_hall()
+
+        self.client.post(reverse('castle_adventure:new_game'), {'confirm_overwrite': '1'})
+        self.client.get(reverse('castle_adventure:start'))
+
+        response = self.client.get(reverse('castle_adventure:scene', args=['01']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['game_state'].choices_made, 0)
+
+
+CACHED_STORE = 'castle_adventure.stores.CachedGameStateStore'
+
+
+@override_settings(
+    CASTLE_ADVENTURE_GAME_STATE_STORE=CACHED_STORE,
+    CASTLE_ADVENTURE_WRITE_BEHIND_INTERVAL=3600,
+    CASTLE_ADVENTURE_WRITE_BEHIND_BATCH=100,
+)
+class CachedGameStateStoreTestCase(TestCase):
+    """Tests for the cache-backed write-behind store."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.store = get_game_state_store()
+        self.store._dirty.clear()
+
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Enter the hall',
+            choice_letter='A'
+        )
+        self.game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+
+    def tearDown(self):
+        self.store._dirty.clear()
+
+    def test_moves_stay_in_cache_until_flush(self):
+        """Test that moves and pickups do not write the GameState row."""
+        self.client.post(reverse('castle_adventure:pickup_item', args=['key']))
+        response = self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+        self.assertRedirects(response, reverse('castle_adventure:scene', args=['02']))
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene1)
+
+        self.assertEqual(self.store.flush(), 1)
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene2)
+        self.assertTrue(self.game_state.has_item('key'))
+        self.assertEqual(self.game_state.choices_made, 1)
+        self.assertEqual(self.game_state.version, 2)
+
+    def test_cached_game_served_without_game_state_query(self):
+        """Test that the next request reads the game from the cache."""
+        self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+
+        response = self.client.get(reverse('castle_adventure:scene', args=['02']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['game_state'].choices_made, 1)
+
+    def test_save_game_flushes(self):
+        """Test that an explicit save writes through to the database."""
+        self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+        self.client.post(reverse('castle_adventure:save'))
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene2)
+        self.assertEqual(self.store._dirty, {})
+
+    @override_settings(CASTLE_ADVENTURE_WRITE_BEHIND_BATCH=1)
+    def test_batch_threshold_flushes(self):
+        """Test that reaching the batch size triggers a flush."""
+        self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.current_scene, self.scene2)
+
+
+class StoreMiddlewareCheckTestCase(TestCase):
+    """Tests for the system check that stores have their middleware."""
+
+    def run_check(self, **overrides):
+        from castle_adventure.checks import MIDDLEWARE_PATH, check_game_state_store_middleware
+
+        middleware = [path for path in settings.MIDDLEWARE if path != MIDDLEWARE_PATH]
+        with override_settings(MIDDLEWARE=middleware, **overrides):
+            return [error.id for error in check_game_state_store_middleware(None)]
+
+    def test_database_store_needs_no_middleware(self):
+        """Test that the default store works without the middleware."""
+        self.assertEqual(self.run_check(), [])
+
+    def test_other_stores_need_middleware(self):
+        """Test that stores writing in process_response are reported."""
+        for store in (COOKIE_STORE, CACHED_STORE):
+            self.assertEqual(
+                self.run_check(CASTLE_ADVENTURE_GAME_STATE_STORE=store),
+                ['castle_adventure.E001'],
+            )
+        self.assertEqual(self.run_check(CASTLE_ADVENTURE_MOVE_LOG=True),
+                         ['castle_adventure.E001'])
+
+    def test_installed_middleware_passes(self):
+        """Test that the check is quiet when the middleware is installed."""
+        from castle_adventure.checks import check_game_state_store_middleware
+
+        with override_settings(CASTLE_ADVENTURE_GAME_STATE_STORE=COOKIE_STORE):
+            self.assertEqual(check_game_state_store_middleware(None), [])
@@ -0,0 +1,149 @@
+"""
+Tests for applying story updates as a content-hash diff.
+"""
+import io
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from castle_adventure.models import Scene, Choice, Item, GameState
+from castle_adventure.story_graph import get_story_graph, get_story_version
+
+FIXTURE_DIR = Path(__file__).resolve().parents[1] / 'fixtures'
+
+
+class ApplyStoryDiffTestCase(TestCase):
+    """Tests for the apply_story_diff command."""
+
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir)
+        for name in ('scenes', 'items', 'choices', 'endings'):
+            shutil.copy(FIXTURE_DIR / f'{name}.json', self.dir)
+        call_command('load_story_content', dir=str(self.dir), stdout=io.StringIO())
+
+    def edit(self, name, change):
+        path = self.dir / f'{name}.json'
+        with open(path) as f:
+            records = json.load(f)
+        records = change(records) or records
+        with open(path, 'w') as f:
+            json.dump(records, f)
+
+    def apply(self, **options):
+        out = io.StringIO()
+        call_command('apply_story_diff', dir=str(self.dir), batch_size=7, stdout=out, **options)
+        return out.getvalue()
+
+    def retitle(self, scene_id, title):
+        def change(records):
+            for record in records:
+                if record['fields']['scene_id'] == scene_id:
+                    record['fields']['title'] = title
+        self.edit('scenes', change)
+
+    def test_unchanged_story_writes_nothing(self):
+        """Test that reapplying the loaded story leaves the version alone."""
+        version = get_story_version()
+
+        # One read per table, inside a savepoint
+        with self.assertNumQueries(6):
+            output = self.apply()
+
+        self.assertIn('Scenes: 0 inserted, 0 updated, 0 deleted, 30 unchanged', output)
+        self.assertIn('up to date', output)
+        self.assertEqual(get_story_version(), version)
+
+    def test_one_field_edit_updates_one_scene(self):
+        """Test that a title edit rewrites that scene and keeps other revisions."""
+        graph = get_story_graph()
+        before = {scene_id: graph.revision(scene) for scene_id, scene in graph.scenes.items()}
+        pk = Scene.objects.get(scene_id='05').pk
+        self.retitle('05', 'A New Title')
+
+        output = self.apply()
+
+        self.assertIn('Scenes: 0 inserted, 1 updated, 0 deleted, 29 unchanged', output)
+        self.assertIn('Scene pages invalidated: 1 (05)', output)
+        self.assertEqual(Scene.objects.get(scene_id='05').pk, pk)
+        graph = get_story_graph()
+        self.assertEqual(graph.scenes['05'].title, 'A New Title')
+        changed = [
+            scene_id for scene_id, scene in graph.scenes.items()
+            if graph.revision(scene) != before[scene_id]
+        ]
+        self.assertEqual(changed, ['05'])
+
+    def test_inserts_and_deletes(self):
+        """Test that new rows are added and rows missing from the bundle removed."""
+        def add_scene(records):
+            records.append({'model': 'castle_adventure.scene', 'pk': 999, 'fields': {
+                'scene_id': '99', 'title': 'Attic', 'description': 'Dusty',
+                'scene_type': 'story',
+            }})
+
+        def reroute(records):
+            kept = [record for record in records if record['pk'] != 34]
+            for record in kept:
+                if record['pk'] == 1:
+                    record['fields']['to_scene'] = 999
+            return kept
+
+        self.edit('scenes', add_scene)
+        self.edit('choices', reroute)
+        version = get_story_version()
+
+        output = self.apply()
+
+        self.assertEqual(get_story_version(), version + 1)
+
+        self.assertIn('Scenes: 1 inserted, 0 updated', output)
+        self.assertIn('Choices: 0 inserted, 1 updated, 1 deleted, 32 unchanged', output)
+        self.assertIn('- 21/E', output)
+        self.assertIn('Scene pages invalidated: 3 (01, 21, 99)', output)
+        choice = Choice.objects.get(from_scene__scene_id='01', choice_letter='A')
+        self.assertEqual(choice.to_scene.scene_id, '99')
+        self.assertFalse(Choice.objects.filter(from_scene__scene_id='21', choice_letter='E').exists())
+        self.assertIsNotNone(Scene.objects.get(scene_id='99').bit_index)
+
+    def test_dry_run_writes_nothing(self):
+        """Test that --dry-run reports the diff without applying it."""
+        version = get_story_version()
+        self.retitle('05', 'A New Title')
+
+        output = self.apply(dry_run=True)
+
+        self.assertIn('~ 05', output)
+        self.assertNotEqual(Scene.objects.get(scene_id='05').title, 'A New Title')
+        self.assertEqual(get_story_version(), version)
+
+    def test_deleting_scene_with_games_needs_flag(self):
+        """Test that games on a removed scene are only deleted on request."""
+        user = User.objects.create_user(username='player', password='pass')
+        GameState.objects.create(user=user, current_scene=Scene.objects.get(scene_id='14'))
+        # Scene 14 holds ITEM_004, so that and every choice touching either goes
+        with open(FIXTURE_DIR / 'scenes.json') as f:
+            scene_pk = next(r['pk'] for r in json.load(f) if r['fields']['scene_id'] == '14')
+        with open(FIXTURE_DIR / 'items.json') as f:
+            item_pk = next(r['pk'] for r in json.load(f) if r['fields']['item_id'] == 'ITEM_004')
+        self.edit('scenes', lambda records: [r for r in records if r['pk'] != scene_pk])
+        self.edit('items', lambda records: [r for r in records if r['pk'] != item_pk])
+        self.edit('choices', lambda records: [
+            r for r in records
+            if scene_pk not in (r['fields']['from_scene'], r['fields']['to_scene'])
+            and r['fields']['requires_item'] != item_pk
+        ])
+
+        with self.assertRaisesMessage(CommandError, '1 games in progress'):
+            self.apply()
+        self.assertTrue(Scene.objects.filter(scene_id='14').exists())
+
+        self.apply(delete_progress=True)
+        self.assertFalse(Scene.objects.filter(scene_id='14').exists())
+        self.assertFalse(Item.objects.filter(item_id='ITEM_004').exists())
+        self.assertFalse(GameState.objects.exists())
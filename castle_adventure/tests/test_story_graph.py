@@ -0,0 +1,306 @@
+"""
+Tests for the in-memory story graph.
+"""
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from io import StringIO
+from castle_adventure import story_graph
+from castle_adventure.models import Scene, Choice, Item, Ending, GameState, StoryVersion
+from castle_adventure.story_graph import get_story_graph, get_story_version
+
+
+class StoryGraphBuildTestCase(TestCase):
+    """Tests for building the graph from the content tables."""
+
+    def setUp(self):
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.choice = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+        Ending.objects.create(
+            ending_id='E1',
+            title='Heroic Rescue',
+            description='You rescued the princess',
+            ending_type='victory',
+            icon='👑'
+        )
+
+    def test_graph_contains_all_content(self):
+        """Test that scenes, choices, items and endings are loaded."""
+        graph = get_story_graph()
+
+        self.assertEqual(set(graph.scenes), {'01', '02'})
+        self.assertEqual(graph.scenes_by_pk[self.scene1.pk].scene_id, '01')
+        self.assertIn(self.choice.id, graph.choices)
+        self.assertIn('key', graph.items)
+        self.assertIn('E1', graph.endings)
+
+    def test_scene_nodes_link_choices_and_items(self):
+        """Test that scene nodes carry their outgoing choices and items."""
+        scene = get_story_graph().scenes['01']
+
+        self.assertEqual([c.id for c in scene.choices], [self.choice.id])
+        self.assertEqual(scene.choices[0].to_scene_id, '02')
+        self.assertEqual(scene.choices[0].requires_item_id, 'key')
+        self.assertEqual([i.item_id for i in scene.items], ['key'])
+
+    def test_graph_is_reused_between_calls(self):
+        """Test that the graph is built once and then served from memory."""
+        graph = get_story_graph()
+        with self.assertNumQueries(0):
+            self.assertIs(get_story_graph(), graph)
+
+    def test_content_change_invalidates_graph(self):
+        """Test that saving story content rebuilds the graph."""
+        get_story_graph()
+        self.scene1.title = 'Front Gate'
+        self.scene1.save()
+
+        self.assertEqual(get_story_graph().scenes['01'].title, 'Front Gate')
+
+    def test_content_delete_invalidates_graph(self):
+        """Test that deleting story content rebuilds the graph."""
+        get_story_graph()
+        self.key.delete()
+
+        self.assertNotIn('key', get_story_graph().items)
+
+
+class StoryGraphViewQueriesTestCase(TestCase):
+    """Tests that game views read content from the graph."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+        GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+        get_story_graph()
+
+    def test_display_scene_makes_no_content_queries(self):
+        """Test display_scene only queries session, user and game state."""
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('castle_adventure:scene', args=['01']))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Rusty Key')
+
+    def test_display_scene_unknown_scene_returns_404(self):
+        """Test that an unknown scene id is a 404."""
+        response = self.client.get(reverse('castle_adventure:scene', args=['99']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_make_choice_unknown_choice_returns_404(self):
+        """Test that an unknown choice id is a 404."""
+        response = self.client.post(reverse('castle_adventure:choice', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SceneFragmentCacheTestCase(TestCase):
+    """Tests for the rendered scene fragment cache."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Unlock door',
+            choice_letter='A',
+            requires_item=self.key
+        )
+        self.game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+        # The cache outlives graph rebuilds, so start each test empty
+        get_story_graph().fragments.clear()
+
+    def get_scene(self):
+        return self.client.get(reverse('castle_adventure:scene', args=['01']))
+
+    def test_repeat_view_skips_fragment_rendering(self):
+        """Test that the scene body is rendered once per mask."""
+        first = self.get_scene()
+        self.assertTemplateUsed(first, 'castle_adventure/scene_body.html')
+
+        second = self.get_scene()
+        self.assertTemplateNotUsed(second, 'castle_adventure/scene_body.html')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(get_story_graph().fragments), 1)
+
+    def test_masks_select_different_fragments(self):
+        """Test that picking up the key changes the rendered body."""
+        self.assertContains(self.get_scene(), 'Locked - requires item')
+
+        self.game_state.add_item('key')
+        response = self.get_scene()
+
+        self.assertNotContains(response, 'Locked - requires item')
+        self.assertNotContains(response, '[Pick up]')
+        self.assertEqual(len(get_story_graph().fragments), 2)
+
+    def test_content_change_drops_fragments(self):
+        """Test that edited content is never served from old fragments."""
+        self.get_scene()
+        self.scene1.description = 'Bright entrance'
+        self.scene1.save()
+
+        self.assertContains(self.get_scene(), 'Bright entrance')
+
+    def test_other_content_change_keeps_fragments(self):
+        """Test that a rebuilt graph reuses the bodies of unchanged scenes."""
+        self.get_scene()
+        self.scene2.title = 'Great Hall'
+        self.scene2.save()
+
+        response = self.get_scene()
+
+        self.assertTemplateNotUsed(response, 'castle_adventure/scene_body.html')
+        self.assertEqual(get_story_graph().scenes['02'].title, 'Great Hall')
+
+    def test_lru_cache_is_bounded(self):
+        """Test that the least recently used entry is evicted."""
+        cache = story_graph.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+
+class StoryVersionTestCase(TestCase):
+    """Tests for cross-process invalidation via the story version stamp."""
+
+    def setUp(self):
+        self.scene = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+
+    def bump_from_another_process(self, title):
+        """Change content and version without local signals."""
+        Scene.objects.filter(pk=self.scene.pk).update(title=title)
+        StoryVersion.objects.filter(pk=1).update(version=get_story_version() + 1)
+
+    def test_content_save_bumps_version(self):
+        """Test that editing content increments the version stamp."""
+        before = get_story_version()
+        self.scene.title = 'Front Gate'
+        self.scene.save()
+        self.assertEqual(get_story_version(), before + 1)
+
+    def test_graph_records_version(self):
+        """Test that the graph remembers the version it was built from."""
+        self.assertEqual(get_story_graph().version, get_story_version())
+
+    def test_load_story_content_bumps_version_once(self):
+        """Test that the loader command bumps the version a single time."""
+        before = get_story_version()
+        call_command('load_story_content', stdout=StringIO())
+        self.assertEqual(get_story_version(), before + 1)
+
+    @override_settings(CASTLE_ADVENTURE_STORY_VERSION_CHECK_INTERVAL=3600)
+    def test_remote_change_ignored_until_interval(self):
+        """Test that the version is not re-checked within the interval."""
+        get_story_graph()
+        self.bump_from_another_process('Front Gate')
+
+        with self.assertNumQueries(0):
+            graph = get_story_graph()
+        self.assertEqual(graph.scenes['01'].title, 'Entrance')
+
+    def test_remote_change_picked_up_after_interval(self):
+        """Test that a version bump elsewhere triggers a rebuild."""
+        get_story_graph()
+        self.bump_from_another_process('Front Gate')
+
+        with override_settings(CASTLE_ADVENTURE_STORY_VERSION_CHECK_INTERVAL=0):
+            graph = get_story_graph()
+        self.assertEqual(graph.scenes['01'].title, 'Front Gate')
+
+    def test_unchanged_version_keeps_graph(self):
+        """Test that a version check without changes does not rebuild."""
+        graph = get_story_graph()
+        with override_settings(CASTLE_ADVENTURE_STORY_VERSION_CHECK_INTERVAL=0):
+            with self.assertNumQueries(1):
+                self.assertIs(get_story_graph(), graph)
+
+    def test_old_graph_served_during_rebuild(self):
+        """Test that requests are not blocked while another thread rebuilds."""
+        graph = get_story_graph()
+        self.scene.title = 'Front Gate'
+        self.scene.save()
+
+        with story_graph._lock:
+            with self.assertNumQueries(0):
+                self.assertIs(get_story_graph(), graph)
+
+        self.assertEqual(get_story_graph().scenes['01'].title, 'Front Gate')
@@ -0,0 +1,111 @@
+"""
+Tests for the streaming story importer and load_story_content.
+"""
+import io
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from castle_adventure.models import Scene, Choice, Item, Ending
+from castle_adventure.story_import import StoryImportError, iter_json_objects
+
+FIXTURE_DIR = Path(__file__).resolve().parents[1] / 'fixtures'
+
+
+class IterJsonObjectsTestCase(TestCase):
+    """Tests for incremental JSON parsing."""
+
+    def test_array_and_json_lines(self):
+        """Test that arrays and JSON Lines give the same objects, across small reads."""
+        records = [{'pk': n, 'fields': {'text': 'x' * n + ']},['}} for n in range(20)]
+
+        as_array = io.StringIO(json.dumps(records, indent=2))
+        as_lines = io.StringIO('\n'.join(json.dumps(record) for record in records))
+
+        self.assertEqual(list(iter_json_objects(as_array, read_size=7)), records)
+        self.assertEqual(list(iter_json_objects(as_lines, read_size=7)), records)
+
+    def test_truncated_file_rejected(self):
+        """Test that a cut-off object is an error, not silently dropped."""
+        with self.assertRaises(StoryImportError):
+            list(iter_json_objects(io.StringIO('[{"pk": 1}, {"pk": '), read_size=4))
+
+
+class LoadStoryContentTestCase(TestCase):
+    """Tests for the bulk upserting load_story_content."""
+
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir)
+        for name in ('scenes', 'items', 'choices', 'endings'):
+            shutil.copy(FIXTURE_DIR / f'{name}.json', self.dir)
+
+    def load(self):
+        call_command('load_story_content', dir=str(self.dir), batch_size=7, stdout=io.StringIO())
+
+    def test_loads_story_with_foreign_keys(self):
+        """Test that every file loads and choices point at the right scenes and items."""
+        self.load()
+
+        self.assertEqual(Scene.objects.count(), 30)
+        self.assertEqual(Item.objects.count(), 8)
+        self.assertEqual(Choice.objects.count(), 34)
+        self.assertEqual(Ending.objects.count(), 5)
+        gated = Choice.objects.get(from_scene__scene_id='10', choice_letter='B')
+        self.assertEqual(gated.to_scene.scene_id, '11')
+        self.assertEqual(gated.requires_item.item_id, 'ITEM_001')
+        self.assertEqual(Item.objects.get(item_id='ITEM_001').found_in_scene.scene_id, '13')
+        self.assertEqual(
+            sorted(Scene.objects.values_list('bit_index', flat=True)), list(range(30))
+        )
+
+    def test_upsert_keeps_pk_and_bit_index(self):
+        """Test that existing rows are updated in place, keeping their bitmap position."""
+        Scene.objects.create(scene_id='zz', title='Other', scene_type='story')
+        existing = Scene.objects.create(scene_id='13', title='Old title', scene_type='story')
+        self.assertEqual(existing.bit_index, 1)
+
+        self.load()
+        self.load()
+
+        scene = Scene.objects.get(scene_id='13')
+        self.assertEqual((scene.pk, scene.bit_index), (existing.pk, 1))
+        self.assertNotEqual(scene.title, 'Old title')
+        self.assertEqual(Scene.objects.count(), 31)
+        self.assertEqual(Choice.objects.count(), 34)
+        self.assertEqual(Item.objects.get(item_id='ITEM_001').found_in_scene, scene)
+
+    def test_bad_reference_rolls_back(self):
+        """Test that an unknown foreign key stops the load and saves nothing."""
+        with open(self.dir / 'choices.json', 'w') as f:
+            json.dump([{'model': 'castle_adventure.choice', 'pk': 1, 'fields': {
+                'from_scene': 1, 'to_scene': 999, 'choice_text': 'Nowhere', 'choice_letter': 'Z',
+            }}], f)
+
+        with self.assertRaisesMessage(CommandError, 'unknown Scene 999'):
+            self.load()
+        self.assertFalse(Scene.objects.exists())
+
+    def test_json_lines_preferred(self):
+        """Test that a .jsonl file is read in place of the .json fixture."""
+        with open(self.dir / 'endings.jsonl', 'w') as f:
+            f.write(json.dumps({'model': 'castle_adventure.ending', 'pk': 1, 'fields': {
+                'ending_id': 'E9', 'title': 'Only', 'description': '', 'ending_type': 'comedy',
+                'icon': '!', 'achievement_text': '', 'requirements': {'priority': 0},
+            }}) + '\n')
+
+        self.load()
+
+        self.assertEqual(list(Ending.objects.values_list('ending_id', flat=True)), ['E9'])
+
+    def test_mixed_ending_formats_rejected(self):
+        """Test that a load leaving rules and old-format requirements together fails."""
+        Ending.objects.create(ending_id='E9', title='Old', requirements={'npc_relations': -1})
+
+        with self.assertRaisesMessage(CommandError, "Ending E9: unknown keys ['npc_relations']"):
+            self.load()
+        self.assertFalse(Scene.objects.exists())
@@ -3,6 +3,7 @@ Tests for scene navigation views (T-003).
 """
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.utils.http import http_date
 from django.contrib.auth.models import User
 from castle_adventure.models import Scene, Choice, Item, GameState
 
@@ -395,3 +396,241 @@ class IntegrationTestCase(TestCase):
 
         self.assertIn('02', game_state.visited_scenes)
         self.assertEqual(len(game_state.visited_scenes), 1)
+
+
+class AtomicMoveTestCase(TestCase):
+    """Tests for committing moves with a single conditional UPDATE."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Entrance',
+            description='Dark entrance',
+            scene_type='story'
+        )
+        self.scene2 = Scene.objects.create(
+            scene_id='02',
+            title='Hall',
+            description='Grand hall',
+            scene_type='story'
+        )
+        self.choice1 = Choice.objects.create(
+            from_scene=self.scene1,
+            to_scene=self.scene2,
+            choice_text='Enter the hall',
+            choice_letter='A'
+        )
+        self.game_state = GameState.objects.create(
+            user=self.user,
+            current_scene=self.scene1
+        )
+
+    def test_make_choice_uses_one_update(self):
+        """Test that a move is one SELECT for the game plus one UPDATE."""
+        from castle_adventure.story_graph import get_story_graph
+        self.client.login(username='testuser', password='testpass')
+        get_story_graph()
+
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_double_submit_applies_once(self):
+        """Test that two requests racing from the same scene move once."""
+        from castle_adventure.story_graph import get_story_graph
+        graph = get_story_graph()
+        choice = graph.choices[self.choice1.id]
+        to_scene = graph.scenes['02']
+
+        first = GameState.objects.get(pk=self.game_state.pk)
+        second = GameState.objects.get(pk=self.game_state.pk)
+
+        self.assertTrue(first.commit_move(choice, to_scene))
+        self.assertFalse(second.commit_move(choice, to_scene))
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.choices_made, 1)
+        self.assertEqual(self.game_state.current_scene, self.scene2)
+
+    def test_stale_move_rejected_by_view(self):
+        """Test that a move from a scene the game already left is rejected."""
+        self.client.login(username='testuser', password='testpass')
+        self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+
+        response = self.client.post(reverse('castle_adventure:choice', args=[self.choice1.id]))
+        self.assertEqual(response.status_code, 400)
+
+        self.game_state.refresh_from_db()
+        self.assertEqual(self.game_state.choices_made, 1)
+
+
+class RequestGameStateCacheTestCase(TestCase):
+    """Tests for memoizing the active game state on the request."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(
+            scene_id='01',
+            title='Start',
+            description='Start scene',
+            scene_type='story'
+        )
+        self.game_state = GameState.objects.create(
+            user=self.user,
+            current_scene=self.scene1
+        )
+
+    def make_request(self):
+        from django.test import RequestFactory
+        request = RequestFactory().get('/fake/')
+        request.user = self.user
+        request.session = self.client.session
+        return request
+
+    def test_game_state_queried_once_per_request(self):
+        """Test repeated lookups on one request share a single query."""
+        from castle_adventure.views import get_or_create_game_state, get_game_state
+        request = self.make_request()
+
+        with self.assertNumQueries(1):
+            first = get_or_create_game_state(request)
+            second = get_game_state(request)
+        self.assertIs(first, second)
+
+    def test_current_scene_is_prefetched(self):
+        """Test that current_scene needs no extra query."""
+        from castle_adventure.views import get_game_state
+        request = self.make_request()
+
+        with self.assertNumQueries(1):
+            game_state = get_game_state(request)
+            self.assertEqual(game_state.current_scene.title, 'Start')
+
+    def test_new_game_clears_memoized_state(self):
+        """Test that deleting the save also drops it from the request."""
+        from castle_adventure.views import get_or_create_game_state, set_request_game_state
+        request = self.make_request()
+        get_or_create_game_state(request).delete()
+        set_request_game_state(request, None)
+
+        self.assertIsNone(get_or_create_game_state(request))
+
+    def test_inventory_page_query_count(self):
+        """Test inventory renders with session, user and game state queries only."""
+        from castle_adventure.story_graph import get_story_graph
+        self.client.login(username='testuser', password='testpass')
+        get_story_graph()
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('castle_adventure:inventory'))
+        self.assertEqual(response.status_code, 200)
+
+
+class ConditionalGetTestCase(TestCase):
+    """Tests for ETag revalidation of scene, inventory and endings pages."""
+
+    def setUp(self):
+        from castle_adventure.models import Ending
+        from castle_adventure.story_graph import get_story_graph
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.scene1 = Scene.objects.create(scene_id='01', title='Start', scene_type='story')
+        self.scene2 = Scene.objects.create(scene_id='02', title='Hall', scene_type='story')
+        self.key = Item.objects.create(
+            item_id='key',
+            name='Rusty Key',
+            description='Opens doors',
+            found_in_scene=self.scene1
+        )
+        self.ending = Ending.objects.create(ending_id='E1', title='Escape', requirements={})
+        self.game_state = GameState.objects.create(user=self.user, current_scene=self.scene1)
+        self.client.login(username='testuser', password='testpass')
+        get_story_graph()
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_scene_returns_304(self):
+        """Test a refresh of an unchanged scene skips the view."""
+        url = reverse('castle_adventure:scene', args=['01'])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(3):
+            response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_pickup_changes_scene_etag(self):
+        """Test that any change to the game invalidates the page."""
+        url = reverse('castle_adventure:scene', args=['01'])
+        etag = self.client.get(url)['ETag']
+
+        self.client.post(reverse('castle_adventure:pickup_item', args=['key']))
+
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_same_second_write_is_not_modified_since(self):
+        """Test that If-Modified-Since alone never answers 304 for a changed game."""
+        scene_url = reverse('castle_adventure:scene', args=['01'])
+        inventory_url = reverse('castle_adventure:inventory')
+        pickup_url = reverse('castle_adventure:pickup_item', args=['key'])
+        response = self.client.get(scene_url)
+        self.assertContains(response, pickup_url)
+        self.assertNotIn('Last-Modified', response)
+        # The same second as the fetch, as a one-second validator would see it
+        since = http_date()
+
+        self.client.post(pickup_url)
+
+        response = self.client.get(scene_url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, pickup_url)
+        response = self.client.get(inventory_url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertContains(response, 'Rusty Key')
+
+    def test_content_change_changes_etag(self):
+        """Test that edited story content invalidates the page."""
+        url = reverse('castle_adventure:inventory')
+        etag = self.client.get(url)['ETag']
+
+        self.key.name = 'Golden Key'
+        self.key.save()
+
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_scene_etag_follows_scene_revision(self):
+        """Test that only edits to the scene itself invalidate its page."""
+        url = reverse('castle_adventure:scene', args=['01'])
+        etag = self.client.get(url)['ETag']
+
+        self.scene2.title = 'Great Hall'
+        self.scene2.save()
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        self.key.name = 'Golden Key'
+        self.key.save()
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_unchanged_inventory_returns_304(self):
+        """Test that inventory revalidates against the game state."""
+        url = reverse('castle_adventure:inventory')
+        response = self.client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        self.assertEqual(self.revalidate(url, response['ETag']).status_code, 304)
+
+    def test_endings_etag_follows_unlocks(self):
+        """Test that unlocking an ending invalidates the collection."""
+        from castle_adventure.models import EndingUnlock
+        url = reverse('castle_adventure:endings_collection')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        EndingUnlock.objects.create(user=self.user, ending=self.ending)
+
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
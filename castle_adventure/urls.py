@@ -2,7 +2,7 @@
 URL configuration for castle_adventure app.
 """
 from django.urls import path
-from . import views
+from . import api, metrics, views
 
 app_name = 'castle_adventure'
 
@@ -18,4 +18,14 @@ urlpatterns = [
     path('load/', views.load_game, name='load'),
     path('ending/<str:scene_id>/', views.display_ending, name='display_ending'),
     path('endings/', views.endings_collection, name='endings_collection'),
+
+    # JSON API
+    path('api/game/', api.game_state, name='api_game'),
+    path('api/game/choice/<int:choice_id>/', api.make_choice, name='api_choice'),
+    path('api/game/pickup/<str:item_id>/', api.pickup_item, name='api_pickup'),
+    path('api/game/moves/', api.make_moves, name='api_moves'),
+    path('api/scenes/<str:scene_id>/', api.scene, name='api_scene'),
+
+    # Prometheus metrics (enabled by CASTLE_ADVENTURE_METRICS)
+    path('metrics/', metrics.metrics, name='metrics'),
 ]
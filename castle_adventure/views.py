@@ -1,24 +1,37 @@
+import hashlib
+from dataclasses import replace
+
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponseBadRequest, Http404, JsonResponse
-from .models import Scene, Choice, Item, GameState
+from django.http import HttpResponse, HttpResponseBadRequest, Http404, JsonResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .models import Scene, GameState
+from .stores import get_game_state_store
+from .story_graph import get_story_graph
 
 
 def get_or_create_game_state(request):
-    """Get existing game state or return None for new game."""
-    if request.user.is_authenticated:
-        return GameState.objects.filter(
-            user=request.user,
-            is_complete=False
-        ).first()
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        return GameState.objects.filter(
-            session_key=session_key,
-            is_complete=False
-        ).first()
+    """
+    Get existing game state or return None for new game.
+
+    The game is loaded through the configured GameStateStore and memoized
+    on the request, so every view, middleware or template tag in the same
+    request shares one lookup.
+    """
+    game_state = getattr(request, '_castle_game_state', None)
+    if game_state is not None:
+        return game_state
+
+    game_state = get_game_state_store().load(request)
+    set_request_game_state(request, game_state)
+    return game_state
+
+
+def set_request_game_state(request, game_state):
+    """Replace (or clear, with None) the request's memoized game state."""
+    request._castle_game_state = game_state
 
 
 def get_game_state(request):
@@ -29,6 +42,86 @@ def get_game_state(request):
     return state
 
 
+MAX_WRITE_ATTEMPTS = 3
+
+
+CONFLICT_MESSAGE = "Your game was changed by another request. Please reload and try again."
+
+
+def write_with_retry(game_state, attempt, conflict_response=None):
+    """
+    Apply a conditional write, re-reading the game state when it is stale.
+
+    ``attempt(game_state)`` returns its result (usually a response), or None
+    if its write lost the optimistic version check. After MAX_WRITE_ATTEMPTS
+    stale writes ``conflict_response`` (by default a plain 409 Conflict) is
+    returned instead.
+    """
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        response = attempt(game_state)
+        if response is not None:
+            return response
+        try:
+            game_state.refresh_from_db()
+        except GameState.DoesNotExist:
+            raise Http404("No active game found")
+        if game_state.is_complete:
+            raise Http404("No active game found")
+    if conflict_response is not None:
+        return conflict_response
+    return HttpResponse(CONFLICT_MESSAGE, status=409)
+
+
+def redirect_to_current_scene(game_state, graph=None):
+    """Redirect to the scene the game state is currently on."""
+    graph = graph or get_story_graph()
+    scene = graph.scenes_by_pk[game_state.current_scene_id]
+    return redirect('castle_adventure:scene', scene_id=scene.scene_id)
+
+
+def make_etag(*parts):
+    """Hash validator components into an ETag value."""
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def game_state_etag(request, scene_id=None):
+    """
+    ETag of a page that depends only on story content and the player's game.
+
+    Every change to a game bumps its version or last_updated. Scene pages
+    use the scene's revision, so content changes elsewhere in the story
+    keep them valid; other pages use the story version. No content tables
+    are read. There is no Last-Modified: it has one-second resolution, so a
+    write in the same second as the last fetch would not move it forward.
+    """
+    game_state = get_or_create_game_state(request)
+    if game_state is None:
+        return None
+    graph = get_story_graph()
+    scene = graph.scenes.get(scene_id) if scene_id is not None else None
+    return make_etag(
+        graph.revision(scene) if scene is not None else graph.version,
+        game_state.pk,
+        game_state.game_started.timestamp(),
+        game_state.version,
+        game_state.last_updated.timestamp(),
+        scene_id,
+    )
+
+
+def endings_etag(request):
+    """ETag of the endings collection: unlocks only ever grow, so count them."""
+    if request.user.is_authenticated:
+        owner = f'user:{request.user.pk}'
+    else:
+        owner = f'session:{request.session.session_key}'
+    return make_etag(get_story_graph().version, owner, len(get_unlocked_endings(request)))
+
+
+# Browsers must revalidate game pages, which is cheap with the validators
+revalidate = cache_control(private=True, no_cache=True)
+
+
 def landing_page(request):
     """Landing page for the game."""
     return render(request, 'castle_adventure/landing.html')
@@ -38,13 +131,10 @@ def start_game(request):
     """Start new game or load existing save."""
     game_state = get_or_create_game_state(request)
     if not game_state:
-        start_scene = Scene.objects.get(scene_id='01')
-        game_state = GameState.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            session_key=request.session.session_key if not request.user.is_authenticated else None,
-            current_scene=start_scene
-        )
-    return redirect('castle_adventure:scene', scene_id=game_state.current_scene.scene_id)
+        start_scene = get_story_graph().scenes['01']
+        game_state = get_game_state_store().create(request, start_scene)
+        set_request_game_state(request, game_state)
+    return redirect_to_current_scene(game_state)
 
 
 def new_game(request):
@@ -62,30 +152,37 @@ def new_game(request):
         })
 
     if existing_save:
-        existing_save.delete()
+        get_game_state_store().delete(request, existing_save)
+        set_request_game_state(request, None)
 
     return redirect('castle_adventure:start')
 
 
+@revalidate
+@condition(etag_func=game_state_etag)
 def display_scene(request, scene_id):
     """Display current scene with choices."""
-    game_state = get_game_state(request)
-    scene = get_object_or_404(Scene, scene_id=scene_id)
+    return scene_page(request, get_game_state(request), get_story_graph(), scene_id)
+
+
+def scene_page(request, game_state, graph, scene_id):
+    """Render the scene page for a loaded game (shared with async_views)."""
+    scene = graph.scenes.get(scene_id)
+    if scene is None:
+        raise Http404("No Scene matches the given query.")
 
     # Ensure requested scene matches current game state
     # Redirect to actual current scene if they don't match
-    if scene != game_state.current_scene:
-        return redirect('castle_adventure:scene', scene_id=game_state.current_scene.scene_id)
-
-    choices = scene.choices_from.all()
+    if scene.pk != game_state.current_scene_id:
+        return redirect_to_current_scene(game_state, graph)
 
-    for choice in choices:
-        if choice.requires_item:
-            choice.is_locked = not game_state.has_item(choice.requires_item.item_id)
-        else:
-            choice.is_locked = False
+    choices = [
+        replace(choice, is_locked=not game_state.has_item(choice.requires_item_id))
+        if choice.requires_item_id else choice
+        for choice in scene.choices
+    ]
 
-    items_here = scene.items_here.exclude(item_id__in=game_state.inventory)
+    items_here = [item for item in scene.items if not game_state.has_item(item.item_id)]
 
     context = {
         'scene': scene,
@@ -93,55 +190,107 @@ def display_scene(request, scene_id):
         'items_here': items_here,
         'game_state': game_state,
     }
+    context['scene_body'] = render_scene_body(graph, scene, choices, items_here)
     return render(request, 'castle_adventure/game_board.html', context)
 
 
-def make_choice(request, choice_id):
-    """Process player choice and navigate to next scene."""
-    game_state = get_game_state(request)
-    choice = get_object_or_404(Choice, id=choice_id)
+def render_scene_body(graph, scene, choices, items_here):
+    """
+    Render the body of a scene page, reusing the graph's fragment cache.
 
-    if choice.from_scene != game_state.current_scene:
-        return HttpResponseBadRequest("Invalid choice for current scene")
+    The body depends only on the scene's content, which of its choices are
+    locked and which of its items are still there, so the scene revision
+    and those (as bitmasks) are the key.
+    """
+    lock_mask = sum(1 << bit for bit, choice in enumerate(choices) if choice.is_locked)
+    items_mask = sum(1 << bit for bit, item in enumerate(scene.items) if item in items_here)
+    key = (graph.revision(scene), lock_mask, items_mask)
 
-    if choice.requires_item and not game_state.has_item(choice.requires_item.item_id):
-        return HttpResponseBadRequest("Missing required item")
+    body = graph.fragments.get(key)
+    if body is None:
+        body = mark_safe(render_to_string('castle_adventure/scene_body.html', {
+            'scene': scene,
+            'choices': choices,
+            'items_here': items_here,
+        }))
+        graph.fragments.set(key, body)
+    return body
 
-    game_state.current_scene = choice.to_scene
-    game_state.choices_made += 1
 
-    if choice.to_scene.scene_id not in game_state.visited_scenes:
-        game_state.visited_scenes.append(choice.to_scene.scene_id)
+def choice_error(game_state, choice):
+    """Return why ``choice`` cannot be taken now, or None."""
+    if choice.from_scene_pk != game_state.current_scene_id:
+        return "Invalid choice for current scene"
+    if choice.requires_item_id and not game_state.has_item(choice.requires_item_id):
+        return "Missing required item"
+    return None
 
-    if choice.to_scene.is_death:
-        game_state.deaths += 1
 
-    game_state.save()
+def pickup_error(game_state, item):
+    """Return why ``item`` cannot be picked up now, or None."""
+    if item.found_in_scene_pk != game_state.current_scene_id:
+        return "Item not in this scene"
+    return None
 
-    return redirect('castle_adventure:scene', scene_id=choice.to_scene.scene_id)
+
+def make_choice(request, choice_id):
+    """Process player choice and navigate to next scene."""
+    game_state = get_game_state(request)
+    graph = get_story_graph()
+    choice = graph.choices.get(choice_id)
+    if choice is None:
+        raise Http404("No Choice matches the given query.")
+
+    to_scene = graph.scenes_by_pk[choice.to_scene_pk]
+
+    def attempt(game_state):
+        error = choice_error(game_state, choice)
+        if error:
+            return HttpResponseBadRequest(error)
+
+        if game_state.commit_move(choice, to_scene):
+            return redirect('castle_adventure:scene', scene_id=to_scene.scene_id)
+
+    return write_with_retry(game_state, attempt)
 
 
 def pickup_item(request, item_id):
     """Pick up an item and add to inventory."""
     game_state = get_game_state(request)
-    item = get_object_or_404(Item, item_id=item_id)
+    graph = get_story_graph()
+    item = graph.items.get(item_id)
+    if item is None:
+        raise Http404("No Item matches the given query.")
 
-    if item.found_in_scene != game_state.current_scene:
-        return HttpResponseBadRequest("Item not in this scene")
+    def attempt(game_state):
+        error = pickup_error(game_state, item)
+        if error:
+            return HttpResponseBadRequest(error)
 
-    game_state.add_item(item_id)
+        if game_state.add_item(item_id):
+            # Redirect back to current scene
+            return redirect_to_current_scene(game_state, graph)
 
-    # Redirect back to current scene
-    return redirect('castle_adventure:scene', scene_id=game_state.current_scene.scene_id)
+    return write_with_retry(game_state, attempt)
 
 
+@revalidate
+@condition(etag_func=game_state_etag)
 def view_inventory(request):
     """View player inventory."""
-    game_state = get_game_state(request)
-    items = Item.objects.filter(item_id__in=game_state.inventory)
+    return inventory_page(request, get_game_state(request), get_story_graph())
+
+
+def inventory_page(request, game_state, graph):
+    """Render the inventory page for a loaded game (shared with async_views)."""
+    items = sorted(
+        (graph.items[item_id] for item_id in game_state.inventory if item_id in graph.items),
+        key=lambda item: item.pk
+    )
 
     context = {
         'game_state': game_state,
+        'scene': graph.scenes_by_pk[game_state.current_scene_id],
         'items': items,
     }
     return render(request, 'castle_adventure/inventory.html', context)
@@ -149,11 +298,14 @@ def view_inventory(request):
 
 def save_game(request):
     """Manually save game state."""
+    def attempt(game_state):
+        if get_game_state_store().save(request, game_state):
+            # Redirect back to current scene with success message
+            return redirect_to_current_scene(game_state)
+
     try:
         game_state = get_game_state(request)
-        game_state.save()
-        # Redirect back to current scene with success message
-        return redirect('castle_adventure:scene', scene_id=game_state.current_scene.scene_id)
+        return write_with_retry(game_state, attempt)
     except Http404:
         return redirect('castle_adventure:landing')
 
@@ -162,7 +314,7 @@ def load_game(request):
     """Load saved game state."""
     game_state = get_or_create_game_state(request)
     if game_state:
-        return redirect('castle_adventure:scene', scene_id=game_state.current_scene.scene_id)
+        return redirect_to_current_scene(game_state)
     return redirect('castle_adventure:start')
 
 
@@ -204,12 +356,14 @@ def display_ending(request, scene_id):
     game_state = get_game_state(request)
     scene = get_object_or_404(Scene, scene_id=scene_id, is_ending=True)
 
-    ending_id = determine_ending(game_state)
-    ending = Ending.objects.get(ending_id=ending_id)
+    def attempt(game_state):
+        ending_id = determine_ending(game_state)
+        if game_state.complete(ending_id):
+            return Ending.objects.get(ending_id=ending_id)
 
-    game_state.is_complete = True
-    game_state.ending_reached = ending_id
-    game_state.save()
+    ending = write_with_retry(game_state, attempt)
+    if isinstance(ending, HttpResponse):
+        return ending
 
     unlock_ending(request, ending)
 
@@ -225,6 +379,8 @@ def display_ending(request, scene_id):
     return render(request, 'castle_adventure/ending.html', context)
 
 
+@revalidate
+@condition(etag_func=endings_etag)
 def endings_collection(request):
     """Display all endings with locked/unlocked status."""
     from .models import Ending
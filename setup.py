@@ -32,6 +32,9 @@ setup(
     install_requires=[
         "Django>=4.2,<5.0",
     ],
+    extras_require={
+        "analytics": ["numpy>=1.22"],
+    },
     include_package_data=True,
     zip_safe=False,
 )